@@ -0,0 +1,105 @@
+"""Single-flight snapshot cache for admin aggregates.
+
+Projector dashboards and organizers poll ``/admin/all_teams`` and ``/``
+at the same moment, and each of those requests used to rebuild the whole
+aggregate over every team. ``SnapshotCache`` keeps the last encoded body
+per key and serves it while it is younger than ``max_age``. Once it is
+older, the next request starts one rebuild, and every request arriving
+before it finishes waits on that same rebuild instead of starting its own.
+
+Builds are coroutines and may yield part way (the all_teams build does,
+every few thousand teams), so game requests keep flowing while a big
+snapshot is put together. A snapshot's age counts from the start of its
+build, since the teams it covers may have moved on from there.
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Hashable
+
+DEFAULT_MAX_AGE = 1.0
+
+AGE_HEADER = b"x-snapshot-age-ms"
+BUILD_HEADER = b"x-snapshot-build-ms"
+
+
+class Snapshot:
+    __slots__ = ("body", "taken_at", "build_seconds")
+
+    def __init__(self, body: bytes, taken_at: float, build_seconds: float):
+        self.body = body
+        self.taken_at = taken_at
+        self.build_seconds = build_seconds
+
+
+class SnapshotCache:
+    """Latest encoded body per key, rebuilt at most once at a time"""
+
+    def __init__(self, max_age: float = DEFAULT_MAX_AGE, now: Callable[[], float] = time.monotonic):
+        self.max_age = max_age
+        self.now = now
+        self.snapshots: Dict[Hashable, Snapshot] = {}
+        self.in_flight: Dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.builds = 0
+        self.waits = 0
+        self.build_seconds_total = 0.0
+        self.build_seconds_max = 0.0
+
+    async def get(self, key: Hashable, build: Callable[[], Awaitable[bytes]]) -> Snapshot:
+        """A snapshot no older than max_age, building one (or joining the build running) if needed"""
+        snapshot = self.snapshots.get(key)
+        if snapshot is not None and self.now() - snapshot.taken_at <= self.max_age:
+            self.hits += 1
+            return snapshot
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._build(key, build))
+            self.in_flight[key] = task
+        else:
+            self.waits += 1
+        # Shielded: a client going away must not cancel a build others are waiting on
+        return await asyncio.shield(task)
+
+    async def _build(self, key: Hashable, build: Callable[[], Awaitable[bytes]]) -> Snapshot:
+        started = self.now()
+        try:
+            body = await build()
+        finally:
+            del self.in_flight[key]
+        seconds = self.now() - started
+        snapshot = self.snapshots[key] = Snapshot(body, started, seconds)
+        self.builds += 1
+        self.build_seconds_total += seconds
+        self.build_seconds_max = max(self.build_seconds_max, seconds)
+        return snapshot
+
+    def headers(self, snapshot: Snapshot) -> Dict[str, str]:
+        """Response headers reporting how old a snapshot is and what it cost to build"""
+        return {
+            "X-Snapshot-Age-Ms": f"{(self.now() - snapshot.taken_at) * 1000:.1f}",
+            "X-Snapshot-Build-Ms": f"{snapshot.build_seconds * 1000:.1f}",
+        }
+
+    def expire(self, limit: int) -> int:
+        """Drop up to `limit` snapshots too old to serve; returns how many were dropped"""
+        now = self.now()
+        stale = [key for key, snapshot in self.snapshots.items()
+                 if now - snapshot.taken_at > self.max_age][:limit]
+        for key in stale:
+            del self.snapshots[key]
+        return len(stale)
+
+    def stats(self) -> dict:
+        requests = self.hits + self.builds + self.waits
+        return {
+            "max_age_ms": round(self.max_age * 1000, 1),
+            "snapshots": len(self.snapshots),
+            "snapshot_bytes": sum(len(snapshot.body) for snapshot in self.snapshots.values()),
+            "building_now": len(self.in_flight),
+            "served_cached": self.hits,
+            "builds": self.builds,
+            "waited_for_build": self.waits,
+            "hit_rate": round((self.hits + self.waits) / requests, 4) if requests else None,
+            "avg_build_ms": round(self.build_seconds_total / self.builds * 1000, 2) if self.builds else None,
+            "longest_build_ms": round(self.build_seconds_max * 1000, 2),
+        }
@@ -0,0 +1,223 @@
+"""Admission control: cap in-flight requests and shed low-priority work under overload.
+
+``AdmissionMiddleware`` lets at most ``max_in_flight`` requests run at
+once. The rest wait in one FIFO queue per priority class, and a freed slot
+always goes to the most important waiter:
+
+- ``game``: anything on an existing team (actions, escape, looks, hints),
+  so players already mid-game keep moving. Never shed.
+- ``join``: ``POST /create_team``, the burst when a venue opens.
+- ``background``: admin endpoints, the root page and the docs.
+
+Handlers here rarely await, so each request tends to run to completion
+in one step and the event loop would otherwise serve whatever arrived
+first. Only ``game`` requests are admitted on the spot; the others always
+take one pass through their queue, and slots are handed out after every
+request that arrived in the same loop iteration has queued, so players
+overtake the dashboards that arrived alongside them.
+
+``join`` and ``background`` requests are shed with 503 and Retry-After
+when they have waited longer than their class allows, when the queue
+ahead of them is already older than that, when their queue is full, or
+when event-loop lag is over the limit.
+"""
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Callable, Deque, List, Optional, Tuple
+
+import tracing
+
+CLASSES = ("game", "join", "background")
+GAME, JOIN, BACKGROUND = range(len(CLASSES))
+# New teams may queue this many times longer than background traffic
+JOIN_WAIT_FACTOR = 4
+RETRY_AFTER = {JOIN: 1, BACKGROUND: 5}
+SHED_REASONS = ("queue_full", "queue_time", "wait_timeout", "loop_lag")
+
+# Paths never queued or shed, so overload can always be watched
+EXEMPT_PATHS = {"/admin/admission", "/admin/scheduler"}
+BACKGROUND_FIRST_SEGMENTS = {"", "admin", "docs", "redoc", "openapi.json", "favicon.ico"}
+
+# Set on the scope by the outermost AdmissionMiddleware so inner copies skip the request
+SCOPE_MARKER = "admission.admitted"
+
+
+def classify(method: str, path: str) -> Optional[int]:
+    """Priority class of a request, or None if it bypasses admission control"""
+    if path in EXEMPT_PATHS:
+        return None
+    if path == "/create_team":
+        return JOIN
+    first = path.split("/", 2)[1] if path.startswith("/") else path
+    return BACKGROUND if first in BACKGROUND_FIRST_SEGMENTS else GAME
+
+
+class ClassStats:
+    __slots__ = ("admitted", "queued", "shed", "wait_total", "wait_max")
+
+    def __init__(self):
+        self.admitted = 0
+        self.queued = 0
+        self.shed = dict.fromkeys(SHED_REASONS, 0)
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+
+class AdmissionController:
+    """In-flight slots plus one waiting queue per priority class"""
+
+    def __init__(self, max_in_flight: int, max_wait: float, max_lag: float, max_queue: int,
+                 lag: Callable[[], float] = lambda: 0.0):
+        self.max_in_flight = max_in_flight
+        # Longest a request of each class may queue; game requests wait as long as it takes
+        self.max_wait: Tuple[Optional[float], ...] = (None, max_wait * JOIN_WAIT_FACTOR, max_wait)
+        self.max_lag = max_lag
+        self.max_queue = max_queue
+        self.lag = lag
+        self.in_flight = 0
+        self.dispatch_scheduled = False
+        # (enqueued at, future resolved when a slot is handed over)
+        self.queues: List[Deque[Tuple[float, asyncio.Future]]] = [deque() for _ in CLASSES]
+        self.stats = [ClassStats() for _ in CLASSES]
+
+    def _oldest_wait(self, priority: int, now: float) -> float:
+        """How long the oldest request at this priority or above has been waiting"""
+        return max((now - queue[0][0] for queue in self.queues[:priority + 1] if queue), default=0.0)
+
+    def _shed_reason(self, priority: int) -> Optional[str]:
+        if self.lag() >= self.max_lag:
+            return "loop_lag"
+        if len(self.queues[priority]) >= self.max_queue:
+            return "queue_full"
+        if self._oldest_wait(priority, time.monotonic()) >= self.max_wait[priority]:
+            return "queue_time"
+        return None
+
+    async def acquire(self, priority: int) -> Optional[str]:
+        """Wait for a slot; returns None once admitted, or the reason the request was shed"""
+        stats = self.stats[priority]
+        max_wait = self.max_wait[priority]
+        if max_wait is None:
+            if self.in_flight < self.max_in_flight and not self.queues[priority]:
+                self.in_flight += 1
+                stats.admitted += 1
+                return None
+        else:
+            reason = self._shed_reason(priority)
+            if reason is not None:
+                stats.shed[reason] += 1
+                return reason
+
+        enqueued = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        entry = (enqueued, future)
+        self.queues[priority].append(entry)
+        stats.queued += 1
+        self._schedule_dispatch()
+        try:
+            await asyncio.wait((future,), timeout=max_wait)
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Handed a slot just as the client went away: pass it on
+                self.release()
+            raise
+        finally:
+            if not future.done():
+                # Timed out, or the client went away while waiting
+                self.queues[priority].remove(entry)
+                future.cancel()
+        if future.cancelled():
+            stats.shed["wait_timeout"] += 1
+            return "wait_timeout"
+
+        waited = time.monotonic() - enqueued
+        stats.admitted += 1
+        stats.wait_total += waited
+        stats.wait_max = max(stats.wait_max, waited)
+        return None
+
+    def _schedule_dispatch(self) -> None:
+        if not self.dispatch_scheduled:
+            self.dispatch_scheduled = True
+            asyncio.get_running_loop().call_soon(self._dispatch)
+
+    def _dispatch(self) -> None:
+        """Fill free slots once every request that arrived with this batch has queued"""
+        self.dispatch_scheduled = False
+        while self.in_flight < self.max_in_flight and self._grant():
+            pass
+
+    def _grant(self) -> bool:
+        """Hand a slot to the most important waiter; False if nobody is waiting"""
+        for queue in self.queues:
+            if queue:
+                _, future = queue.popleft()
+                future.set_result(None)
+                self.in_flight += 1
+                return True
+        return False
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        if self.in_flight < self.max_in_flight:
+            self._grant()
+
+    def report(self) -> dict:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "classes": {
+                name: {
+                    "admitted": stats.admitted,
+                    "shed": sum(stats.shed.values()),
+                    "shed_by_reason": stats.shed,
+                    "queued_now": len(self.queues[priority]),
+                    "queued_total": stats.queued,
+                    "max_wait_ms": round(self.max_wait[priority] * 1000, 1) if self.max_wait[priority] else None,
+                    "avg_queue_ms": round(stats.wait_total / stats.queued * 1000, 2) if stats.queued else None,
+                    "longest_queue_ms": round(stats.wait_max * 1000, 2),
+                }
+                for priority, (name, stats) in enumerate(zip(CLASSES, self.stats))
+            },
+        }
+
+
+class AdmissionMiddleware:
+    """ASGI middleware putting every HTTP request through an AdmissionController"""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    @staticmethod
+    async def _shed(send, priority: int, reason: str) -> None:
+        body = json.dumps({"detail": "Server is busy, please retry shortly", "reason": reason},
+                          separators=(",", ":")).encode("utf-8")
+        await send({"type": "http.response.start", "status": 503, "headers": [
+            (b"content-length", str(len(body)).encode("latin-1")),
+            (b"content-type", b"application/json"),
+            (b"retry-after", str(RETRY_AFTER[priority]).encode("latin-1")),
+        ]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get(SCOPE_MARKER):
+            await self.app(scope, receive, send)
+            return
+        scope[SCOPE_MARKER] = True
+        priority = classify(scope["method"], scope["path"])
+        if priority is None:
+            await self.app(scope, receive, send)
+            return
+        with tracing.span("admission queue"):
+            reason = await self.controller.acquire(priority)
+        if reason is not None:
+            await self._shed(send, priority, reason)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release()
@@ -0,0 +1,926 @@
+"""Micro-benchmarks and stress runs for the game server internals.
+
+Usage: python bench.py <benchmark> [--n N]
+Run ``python bench.py --help`` to list the benchmarks.
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+
+
+def print_section(title):
+    """Print a formatted section header"""
+    print("\n" + "="*60)
+    print(f"  {title}")
+    print("="*60)
+
+
+def report(label, count, seconds):
+    """Print throughput for a timed loop"""
+    rate = count / seconds if seconds else float("inf")
+    print(f"   {label}: {count:,} in {seconds:.3f}s ({rate:,.0f}/s)")
+
+
+def bench_escape(n):
+    """Stress the escape rendezvous and timer wheel with n attempts on one team"""
+    from escape import EscapeRendezvous, TimerWheel
+
+    print_section(f"ESCAPE RENDEZVOUS - {n:,} attempts")
+    window = 10.0
+    rendezvous = EscapeRendezvous()
+    wheel = TimerWheel(lambda key, now: rendezvous.expire(now, window))
+    keys = ("eleven", "mike")
+
+    def footprint():
+        buckets = sum(sys.getsizeof(b) for b in wheel.buckets)
+        return (sys.getsizeof(rendezvous.times) + buckets
+                + sys.getsizeof(wheel.buckets) + sys.getsizeof(wheel.scheduled))
+
+    now = 0.0
+    escapes = 0
+    baseline = None
+    start = time.perf_counter()
+    for i in range(n):
+        # Same friend twice in a row most of the time, with gaps past the window
+        now += 0.5 if i % 7 else 11.0
+        wheel.advance(now)
+        if rendezvous.attempt(keys[(i // 3) % 2], now, window):
+            escapes += 1
+        wheel.schedule("team", now + window)
+        if i == 1000:
+            baseline = footprint()
+    elapsed = time.perf_counter() - start
+    final = footprint()
+
+    report("attempts", n, elapsed)
+    print(f"   escapes: {escapes:,}  timers on wheel: {len(wheel)}  attempts recorded: {rendezvous.count:,}")
+    if baseline is not None:
+        print(f"   escape state after 1k attempts: {baseline:,} B, after {n:,}: {final:,} B")
+        if final > baseline:
+            print("❌ Memory grew with the number of attempts")
+            return False
+    print("✅ Memory stayed constant")
+    return True
+
+
+def bench_team_ids(n):
+    """Allocate and look up n team IDs, then check typo detection"""
+    import random
+    from team_ids import ALPHABET, CHECK_ALPHABET, ID_LENGTH, TeamTable
+
+    print_section(f"TEAM ID ALLOCATOR - {n:,} teams")
+    table = TeamTable(seed=12345)
+
+    start = time.perf_counter()
+    for _ in range(n):
+        team_id = table.allocate()
+        table[team_id] = {'team_id': team_id}
+    report("allocate + insert", n, time.perf_counter() - start)
+
+    ids = list(table)
+    if len(set(ids)) != len(ids):
+        print("❌ Duplicate team IDs allocated")
+        return False
+    sample = random.Random(1).choices(ids, k=n)
+
+    start = time.perf_counter()
+    for team_id in sample:
+        table[team_id]
+    report("lookup", n, time.perf_counter() - start)
+
+    baseline = {team_id: None for team_id in ids}
+    start = time.perf_counter()
+    for team_id in sample:
+        baseline[team_id]
+    report("lookup (plain dict, for reference)", n, time.perf_counter() - start)
+
+    # IDs as typed back by players: other case, same team
+    typed = [team_id.upper() for team_id in sample]
+    start = time.perf_counter()
+    for team_id in typed:
+        table[team_id]
+    report("lookup (upper case, decoded)", n, time.perf_counter() - start)
+
+    # Single substitutions and adjacent swaps must never resolve to a team
+    rng = random.Random(2)
+    typos = missed = 0
+    for team_id in sample[:100_000]:
+        chars = list(team_id)
+        pos = rng.randrange(len(chars))
+        if rng.random() < 0.5 and pos < len(chars) - 1:
+            chars[pos], chars[pos + 1] = chars[pos + 1], chars[pos]
+        else:
+            alphabet = CHECK_ALPHABET if pos == ID_LENGTH - 1 else ALPHABET
+            chars[pos] = rng.choice(alphabet.replace(chars[pos], ""))
+        typo = "".join(chars)
+        if typo == team_id:
+            continue
+        typos += 1
+        if typo in table:
+            missed += 1
+    print(f"   typos tried: {typos:,}  accepted by mistake: {missed:,}")
+    if missed:
+        print("❌ Typos resolved to teams")
+        return False
+    print("✅ All IDs unique, every typo rejected")
+    return True
+
+
+def bench_teams(n):
+    """Memory per team and bulk reset/delete time for n teams"""
+    import asyncio
+    import main
+    import puzzle
+    from escape import EscapeRendezvous
+    from simulate import call_asgi
+    from team_ids import TeamTable
+
+    print_section(f"TEAM STATE - {n:,} teams")
+
+    def populate(played):
+        table = TeamTable(seed=1)
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for i in range(n):
+            team_id = table.allocate()
+            team = table[team_id] = main.new_team_state(team_id, f"team {i}", "stranger_things")
+            if played:
+                # What every team carried before copy-on-write: its own characters, steps and attempts
+                for key in puzzle.CHARACTER_KEYS:
+                    puzzle.own_character(team, key)
+                team['steps_completed'] = []
+                team['escape'] = EscapeRendezvous()
+        per_team = (tracemalloc.get_traced_memory()[0] - before) / n
+        tracemalloc.stop()
+        return per_team
+
+    fresh, played = populate(False), populate(True)
+    print(f"   new team: {fresh:,.0f} B, after its first moves: {played:,.0f} B "
+          f"({played / fresh:.1f}x; names and IDs included)")
+
+    async def run():
+        room = main.get_room("bench")
+        for i in range(n):
+            team_id = main.teams.allocate()
+            main.teams[team_id] = main.new_team_state(team_id, f"bench {i}", "stranger_things", "bench")
+            room.add(main.teams[team_id])
+            room.funnel("stranger_things").enter(main.teams[team_id], main.teams[team_id]['start_time'])
+        ok = True
+        for action, key in (("reset", "teams_reset"), ("reset", "teams_reset"), ("delete", "teams_deleted")):
+            start = time.perf_counter()
+            status, _, body = await call_asgi(main.app, "POST", f"/admin/teams/{action}?room=bench")
+            elapsed = time.perf_counter() - start
+            count = __import__("json").loads(body)[key] if status == 200 else 0
+            report(f"bulk {action} (one request)", count, elapsed)
+            ok = ok and status == 200 and count == n
+        if len(room) or any(room.funnel("stranger_things").current):
+            print("❌ Deleted teams are still counted in their room")
+            ok = False
+        return ok
+
+    ok = asyncio.run(run())
+    if ok:
+        print("✅ Every team reset, then deleted")
+    return ok
+
+
+def bench_export(n):
+    """Export n teams (with a few hint events each) as CSV and Arrow"""
+    import export
+    import main
+    from team_ids import TeamTable
+
+    print_section(f"EXPORT - {n:,} teams")
+    table = TeamTable(seed=1)
+    hints = {}
+    for i in range(n):
+        team_id = table.allocate()
+        table[team_id] = main.new_team_state(team_id, f"team {i}", "stranger_things")
+        table[team_id]['stage'] = 0
+        hints[team_id] = [{"time": 0.0, "friend": "Mike", "hint_given": "Ask Eleven"}] * (i % 3)
+
+    for fmt in export.FORMATS:
+        if fmt == "arrow" and export.pyarrow is None:
+            print("   arrow: skipped (pyarrow not installed)")
+            continue
+        for label, rows, columns in (
+            ("teams", lambda: export.iter_team_rows(table), export.TEAM_COLUMNS),
+            ("hints", lambda: export.iter_hint_rows(table, hints), export.HINT_COLUMNS),
+        ):
+            start = time.perf_counter()
+            size = sum(len(chunk) for chunk in export.stream_export(rows(), columns, fmt))
+            elapsed = time.perf_counter() - start
+
+            # Second, traced pass to measure the memory the export itself needs
+            tracemalloc.start()
+            for _ in export.stream_export(rows(), columns, fmt):
+                pass
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            report(f"{fmt} {label} rows", n if label == "teams" else sum(map(len, hints.values())), elapsed)
+            print(f"      {size / elapsed / 1e6:,.1f} MB/s, {size:,} bytes, peak extra memory {peak / 1e6:,.1f} MB")
+    return True
+
+
+def bench_fastpath(n):
+    """Compare the raw ASGI fast path with FastAPI routing on the hot read routes"""
+    import asyncio
+    import main
+    from simulate import call_asgi
+
+    print_section(f"ASGI FAST PATH - {n:,} requests per route")
+
+    async def run():
+        status, _, body = await call_asgi(main.app, "POST", "/create_team",
+                                          b'{"team_name": "bench fast path"}',
+                                          [(b"content-type", b"application/json")])
+        team_id = __import__("json").loads(body)["team_id"]
+        ok = True
+        routes = [("HEAD", f"/{team_id}/status", False)]
+        for path in (f"/team_status/{team_id}", f"/{team_id}/eleven", f"/{team_id}/mike"):
+            # Plain polls, then conditional polls answered with 304 Not Modified
+            routes += [("GET", path, False), ("GET", path, True)]
+        for method, path, conditional in routes:
+            headers = []
+            if conditional:
+                _, response_headers, _ = await call_asgi(main.app, method, path)
+                headers = [(b"if-none-match", dict(response_headers)[b"etag"])]
+            slow = await call_asgi(main.app, method, path, headers=headers)
+            fast = await call_asgi(main.fast_app, method, path, headers=headers)
+            if slow != fast:
+                print(f"❌ {method} {path} differs:\n   app:      {slow}\n   fast_app: {fast}")
+                ok = False
+
+            timings = []
+            for target in (main.app, main.fast_app):
+                start = time.perf_counter()
+                for _ in range(n):
+                    await call_asgi(target, method, path, headers=headers)
+                timings.append(time.perf_counter() - start)
+            print(f"   {method} {path.replace(team_id, '{team_id}')}{' (If-None-Match)' if conditional else ''}: "
+                  f"{slow[0]}, app {n / timings[0]:,.0f}/s, fast path {n / timings[1]:,.0f}/s "
+                  f"({timings[0] / timings[1]:.1f}x)")
+        return ok
+
+    ok = asyncio.run(run())
+    if ok:
+        print("✅ Fast path responses are byte-identical")
+    return ok
+
+
+def bench_keys(n):
+    """Sign and verify n escape keys, in process and through both HTTP stacks"""
+    import asyncio
+    import random
+    from escape_keys import EscapeKeySigner
+    import main
+    from simulate import call_asgi
+
+    print_section(f"ESCAPE KEYS - {n:,} keys")
+    signer = EscapeKeySigner(b"bench secret")
+    rng = random.Random(1)
+    claims = [(f"team{i:07d}", f"bench team {i}", rng.randint(30, 3600), rng.randint(0, 9)) for i in range(n)]
+
+    start = time.perf_counter()
+    keys = [signer.sign(*claim) for claim in claims]
+    report("sign", n, time.perf_counter() - start)
+    print(f"   key length: {min(map(len, keys))}-{max(map(len, keys))} characters")
+
+    start = time.perf_counter()
+    verified = [signer.verify(key) for key in keys]
+    report("verify", n, time.perf_counter() - start)
+    if [tuple(v) for v in verified] != claims:
+        print("❌ A key did not verify to the claims it was signed with")
+        return False
+
+    # One character changed anywhere, or the right key under another secret
+    forged = []
+    for key in keys[:100_000]:
+        pos = rng.randrange(len(key))
+        forged.append(key[:pos] + rng.choice("ABCxyz019-_".replace(key[pos], "")) + key[pos + 1:])
+    start = time.perf_counter()
+    accepted = sum(signer.verify(key) is not None for key in forged)
+    report("reject tampered", len(forged), time.perf_counter() - start)
+    accepted += sum(EscapeKeySigner(b"other secret").verify(key) is not None for key in keys[:1000])
+    if accepted:
+        print(f"❌ {accepted} forged keys verified")
+        return False
+
+    async def http():
+        requests = min(n, 20_000)
+        path = f"/verify_key/{main.escape_keys.sign('team0000001', 'bench team', 120, 1)}"
+        slow = await call_asgi(main.app, "GET", path)
+        fast = await call_asgi(main.fast_app, "GET", path)
+        if slow != fast or b'"valid":true' not in slow[2]:
+            print(f"❌ GET /verify_key differs:\n   app:      {slow}\n   fast_app: {fast}")
+            return False
+        timings = []
+        for target in (main.app, main.fast_app):
+            start = time.perf_counter()
+            for _ in range(requests):
+                await call_asgi(target, "GET", path)
+            timings.append(time.perf_counter() - start)
+        print(f"   GET /verify_key/{{key}}: app {requests / timings[0]:,.0f}/s, "
+              f"fast path {requests / timings[1]:,.0f}/s ({timings[0] / timings[1]:.1f}x)")
+        return True
+
+    if not asyncio.run(http()):
+        return False
+    print("✅ Every key verified, no forgery did")
+    return True
+
+
+def bench_admin_cache(n, dashboards=20):
+    """dashboards polling all_teams at once over n teams: separate rebuilds vs one shared snapshot"""
+    import asyncio
+    import json
+    import main
+    from simulate import call_asgi
+
+    print_section(f"ADMIN SNAPSHOTS - {dashboards} dashboards polling {n:,} teams")
+    room = main.get_room("bench")
+    for i in range(n):
+        team_id = main.teams.allocate()
+        main.teams[team_id] = main.new_team_state(team_id, f"bench {i}", "stranger_things", "bench")
+        room.add(main.teams[team_id])
+
+    async def timed(work):
+        """Run work() while a player task keeps asking for the loop; returns (result, seconds, longest stall)"""
+        stall = 0.0
+        done = False
+
+        async def player():
+            nonlocal stall
+            last = time.perf_counter()
+            while not done:
+                await asyncio.sleep(0)
+                now = time.perf_counter()
+                stall = max(stall, now - last)
+                last = now
+
+        task = asyncio.ensure_future(player())
+        await asyncio.sleep(0)
+        start = time.perf_counter()
+        result = await work()
+        elapsed = time.perf_counter() - start
+        done = True
+        await task
+        return result, elapsed, stall
+
+    async def run():
+        # Before: every request builds and encodes the whole aggregate in one go
+        chunk, main.SNAPSHOT_CHUNK = main.SNAPSHOT_CHUNK, n
+        bodies, elapsed, stall = await timed(lambda: asyncio.gather(*(main.build_all_teams(None)
+                                                                      for _ in range(dashboards))))
+        main.SNAPSHOT_CHUNK = chunk
+        print(f"   separate rebuilds: {elapsed * 1000:,.0f} ms for all {dashboards}, "
+              f"longest loop stall {stall * 1000:,.1f} ms")
+
+        responses, elapsed, stall = await timed(lambda: asyncio.gather(*(call_asgi(main.app, "GET", "/admin/all_teams")
+                                                                        for _ in range(dashboards))))
+        print(f"   shared snapshot:   {elapsed * 1000:,.0f} ms for all {dashboards}, "
+              f"longest loop stall {stall * 1000:,.1f} ms, {main.admin_snapshots.builds} build")
+        responses, elapsed, _ = await timed(lambda: asyncio.gather(*(call_asgi(main.app, "GET", "/admin/all_teams")
+                                                                    for _ in range(dashboards))))
+        headers = dict(responses[0][1])
+        print(f"   cached snapshot:   {elapsed * 1000:,.1f} ms for all {dashboards} "
+              f"(X-Snapshot-Age-Ms {headers[b'x-snapshot-age-ms'].decode()}, "
+              f"X-Snapshot-Build-Ms {headers[b'x-snapshot-build-ms'].decode()})")
+        print(f"   {main.admin_snapshots.stats()}")
+
+        ok = all(body == responses[0][2] for _, _, body in responses) and main.admin_snapshots.builds == 1
+        ok = ok and json.loads(responses[0][2])["total_teams"] == json.loads(bodies[0])["total_teams"] == n
+        if ok:
+            print("✅ One build served every dashboard")
+        else:
+            print("❌ Dashboards did not all get one identical snapshot")
+        return ok
+
+    return asyncio.run(run())
+
+
+def bench_search(n):
+    """Index n team names, then time prefix and fuzzy (typo'd) lookups"""
+    import random
+    import search
+
+    print_section(f"TEAM SEARCH - {n:,} teams")
+    rng = random.Random(1)
+    words = ("demogorgon hellfire hawkins upside down scoops troop party mind flayer vecna "
+             "eleven mike dustin lucas will max steve robin nancy jonathan hopper joyce "
+             "starcourt arcade lab gate radio bikes club squad crew hunters kids waffles "
+             "walkie talkie lights rift shadow monster byers wheeler sinclair henderson").split()
+    names = [f"{' '.join(rng.sample(words, rng.randint(2, 3)))} {rng.randint(1, 999)}" for _ in range(n)]
+
+    index = search.TeamNameIndex()
+    start = time.perf_counter()
+    for i, name in enumerate(names):
+        index.add(f"t{i}", name)
+    report("index adds", n, time.perf_counter() - start)
+
+    def typo(name):
+        chars = list(name)
+        for _ in range(rng.randint(1, 2)):
+            i = rng.randrange(len(chars))
+            op = rng.choice(("drop", "swap", "replace"))
+            if op == "drop" and len(chars) > 4:
+                del chars[i]
+            elif op == "swap" and i + 1 < len(chars):
+                chars[i], chars[i + 1] = chars[i + 1], chars[i]
+            else:
+                chars[i] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+        return "".join(chars)
+
+    queries = 2000
+    ok = True
+    for mode in ("prefix", "fuzzy"):
+        latencies = []
+        found = 0
+        for _ in range(queries):
+            target = rng.randrange(n)
+            query = names[target][:rng.randint(3, 8)] if mode == "prefix" else typo(names[target])
+            start = time.perf_counter()
+            results = search.search([index], query, mode, 10)
+            latencies.append(time.perf_counter() - start)
+            found += any(team_id == f"t{target}" for _, _, team_id in results) or \
+                (mode == "prefix" and len(results) == 10)
+        latencies.sort()
+        p50, p99 = latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.99)] * 1000
+        print(f"   {mode}: p50 {p50:.3f} ms, p99 {p99:.3f} ms, target in top 10 for {found / queries:.1%}")
+        ok = ok and p99 < 50
+    if ok:
+        print("✅ Lookups answer in milliseconds")
+    return ok
+
+
+def bench_router(n):
+    """Ring balance for n placements, then throughput through the router with 1, 2 and 4 backends"""
+    import asyncio
+    import json
+    import os
+    import subprocess
+    import router
+    from urllib.parse import quote
+    from http_pool import ConnectionPool
+
+    print_section(f"CONSISTENT-HASH ROUTER - {n:,} requests per run")
+    for backends in (2, 4, 8):
+        ring = router.HashRing(list(range(backends)))
+        counts = [0] * backends
+        for i in range(n):
+            counts[ring.node_for(f"main\0team {i}")] += 1
+        grown = router.HashRing(list(range(backends + 1)))
+        moved = sum(ring.node_for(f"main\0team {i}") != grown.node_for(f"main\0team {i}") for i in range(n))
+        print(f"   {backends} backends: busiest/average {max(counts) * backends / n:.2f}, "
+              f"adding one moves {moved / n:.1%} of placements")
+
+    async def load(url, requests, concurrency=64):
+        pool = ConnectionPool(url, concurrency)
+        json_type = [(b"content-type", b"application/json")]
+        team_ids = []
+        for i in range(concurrency):
+            body = json.dumps({"team_name": f"bench {i}"}).encode()
+            team_ids.append(json.loads((await pool.fetch("POST", "/create_team", json_type, body))[2])["team_id"])
+
+        async def worker(team_id, count):
+            for i in range(count):
+                await pool.fetch("GET", f"/team_status/{team_id}" if i % 2 else f"/{team_id}/eleven", [], b"")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(team_id, requests // concurrency) for team_id in team_ids))
+        elapsed = time.perf_counter() - start
+        await pool.close()
+        return requests // concurrency * concurrency / elapsed
+
+    async def encoded_rooms(url):
+        """Room names needing percent-encoding reach the backends intact; returns the failures"""
+        pool = ConnectionPool(url, 4)
+        json_type = [(b"content-type", b"application/json")]
+        failures = []
+        for room in ("Lincoln High", "Hawkins Ünïon", "50% Club"):
+            body = json.dumps({"team_name": f"bench {room}", "room": room}).encode()
+            await pool.fetch("POST", "/create_team", json_type, body)
+            status, _, raw = await pool.fetch("GET", f"/admin/rooms/{quote(room, safe='')}/leaderboard", [], b"")
+            if status != 200 or json.loads(raw).get("room") != room:
+                failures.append(f"{room!r}: {status}")
+        await pool.close()
+        return failures
+
+    print(f"   {os.cpu_count()} CPU core(s): throughput only scales while there are cores for "
+          "every backend, the router and this load generator")
+    ok = True
+    for count in (1, 2, 4):
+        processes, urls = router.spawn_backends(count, 8801)
+        proxy = subprocess.Popen([sys.executable, "-m", "uvicorn", "router:app", "--port", "8800",
+                                  "--log-level", "warning"], env={**os.environ, "ROUTER_BACKENDS": ",".join(urls)})
+        try:
+            router.wait_until_up(urls + ["http://127.0.0.1:8800"])
+            direct = asyncio.run(load(urls[0], n)) if count == 1 else None
+            routed = asyncio.run(load("http://127.0.0.1:8800", n))
+            print(f"   {count} backend(s): {routed:,.0f} req/s through the router"
+                  + (f" (one backend direct: {direct:,.0f} req/s)" if direct else ""))
+            failures = asyncio.run(encoded_rooms("http://127.0.0.1:8800"))
+            if failures:
+                print(f"❌ {count} backend(s): encoded room names failed: {', '.join(failures)}")
+                ok = False
+        except Exception as error:
+            print(f"❌ {count} backends: {error}")
+            ok = False
+        finally:
+            for process in [proxy, *processes]:
+                process.terminate()
+            for process in [proxy, *processes]:
+                process.wait()
+    return ok
+
+
+def bench_admission(n, teams=200, flood=64, players=16):
+    """Player latency for n requests while admin dashboards flood the server, with and without admission control"""
+    import asyncio
+    import json
+    import os
+    import subprocess
+    import router
+    from admission import GAME, AdmissionController
+    from http_pool import ConnectionPool
+
+    print_section(f"ADMISSION CONTROL - {n:,} player requests under an admin flood")
+
+    async def load(url):
+        json_type = [(b"content-type", b"application/json")]
+        setup = ConnectionPool(url, 64)
+
+        async def create(i):
+            body = json.dumps({"team_name": f"bench {i}"}).encode()
+            return json.loads((await setup.fetch("POST", "/create_team", json_type, body))[2])["team_id"]
+
+        team_ids = await asyncio.gather(*(create(i) for i in range(teams)))
+        await setup.close()
+
+        admin_pool = ConnectionPool(url, flood)
+        player_pool = ConnectionPool(url, players)
+        done = asyncio.Event()
+        admin_status = {}
+        latencies = []
+
+        async def admin():
+            while not done.is_set():
+                status = (await admin_pool.fetch("GET", "/admin/all_teams", [], b""))[0]
+                admin_status[status] = admin_status.get(status, 0) + 1
+
+        async def player(team_id, count):
+            for i in range(count):
+                started = time.perf_counter()
+                await player_pool.fetch("GET", f"/team_status/{team_id}" if i % 2 else f"/{team_id}/eleven", [], b"")
+                latencies.append(time.perf_counter() - started)
+
+        admins = [asyncio.create_task(admin()) for _ in range(flood)]
+        await asyncio.sleep(0.5)
+        start = time.perf_counter()
+        await asyncio.gather(*(player(team_id, n // players) for team_id in team_ids[:players]))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await asyncio.gather(*admins)
+        stats = json.loads((await player_pool.fetch("GET", "/admin/admission", [], b""))[2])
+        await admin_pool.close()
+        await player_pool.close()
+        latencies.sort()
+        return elapsed, latencies, admin_status, stats
+
+    async def cancel_after_grant():
+        """A waiter cancelled just after it was handed a slot has to pass the slot on"""
+        controller = AdmissionController(1, max_wait=1.0, max_lag=1.0, max_queue=8)
+        await controller.acquire(GAME)
+        waiter = asyncio.create_task(controller.acquire(GAME))
+        await asyncio.sleep(0)
+        controller.release()
+        waiter.cancel()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            pass
+        leaked = controller.in_flight
+        try:
+            admitted = await asyncio.wait_for(controller.acquire(GAME), 1.0)
+        except asyncio.TimeoutError:
+            admitted = "timeout"
+        return leaked == 0 and admitted is None and controller.in_flight == 1
+
+    ok = asyncio.run(cancel_after_grant())
+    print(f"   waiter cancelled right after its grant: {'slot passed on' if ok else 'slot leaked'}")
+    for limit in (0, 16):
+        process = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:fast_app", "--port", "8790",
+                                    "--log-level", "warning"],
+                                   env={**os.environ, "ADMISSION_MAX_IN_FLIGHT": str(limit)})
+        try:
+            router.wait_until_up(["http://127.0.0.1:8790"])
+            elapsed, latencies, admin_status, stats = asyncio.run(load("http://127.0.0.1:8790"))
+            label = f"{limit} in flight" if limit else "no admission"
+            print(f"   {label}: players p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+                  f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms, "
+                  f"{len(latencies) / elapsed:,.0f} req/s; admin responses {dict(sorted(admin_status.items()))}")
+            if stats.get("enabled"):
+                for name, counts in stats["classes"].items():
+                    print(f"      {name}: {counts['admitted']:,} admitted, {counts['shed']:,} shed, "
+                          f"avg queue {counts['avg_queue_ms']} ms")
+        except Exception as error:
+            print(f"❌ {limit} in flight: {error}")
+            ok = False
+        finally:
+            process.terminate()
+            process.wait()
+    return ok
+
+
+def bench_channels(n):
+    """Hold n WebSockets open (two per team) and play every team's game over them"""
+    import asyncio
+    import json
+    import os
+    import subprocess
+    import websockets
+    import router
+    from http_pool import ConnectionPool
+
+    print_section(f"WEBSOCKET CHANNELS - {n:,} sockets, {n // 2:,} teams")
+    moves = [("Mike", "send_item", {"item": "demogorgon tooth"}),
+             ("Eleven", "use_item", {"action": "combine_radio_tooth"}),
+             ("Eleven", "fix", {"action": "scan_frequency"}),
+             ("Mike", "remove", {"code": "0110"}),
+             ("Eleven", "escape", {}),
+             ("Mike", "escape", {})]
+
+    class Player:
+        def __init__(self, socket):
+            self.socket = socket
+            self.results = {}
+            self.updates = 0
+            self.out_of_order = 0
+            self.reader = asyncio.create_task(self.read())
+
+        async def read(self):
+            async for text in self.socket:
+                message = json.loads(text)
+                if message["type"] == "update":
+                    self.updates += 1
+                elif message["type"] == "result":
+                    # The update for our own action must have come first
+                    if self.updates <= message["id"]:
+                        self.out_of_order += 1
+                    self.results.pop(message["id"]).set_result(message)
+
+        async def act(self, move_id, action, data):
+            self.results[move_id] = asyncio.get_running_loop().create_future()
+            await self.socket.send(json.dumps({"id": move_id, "action": action, "data": data}))
+            return await self.results[move_id]
+
+    async def load(url, ws_url):
+        pool = ConnectionPool(url, 64)
+        json_type = [(b"content-type", b"application/json")]
+
+        async def create(i):
+            body = json.dumps({"team_name": f"channel {i}"}).encode()
+            return json.loads((await pool.fetch("POST", "/create_team", json_type, body))[2])["team_id"]
+
+        team_ids = await asyncio.gather(*(create(i) for i in range(n // 2)))
+        connecting = asyncio.Semaphore(200)
+
+        async def connect(team_id, friend):
+            async with connecting:
+                socket = await websockets.connect(f"{ws_url}/ws/{team_id}?friend={friend}", max_queue=None)
+                assert json.loads(await socket.recv())["type"] == "welcome"
+            return Player(socket)
+
+        start = time.perf_counter()
+        players = await asyncio.gather(*(connect(team_id, friend) for team_id in team_ids
+                                         for friend in ("Eleven", "Mike")))
+        report("sockets opened", len(players), time.perf_counter() - start)
+        open_sockets = json.loads((await pool.fetch("GET", "/admin/channels", [], b""))[2])["open_sockets"]
+
+        latencies = []
+
+        async def play(eleven, mike):
+            for move_id, (friend, action, data) in enumerate(moves):
+                started = time.perf_counter()
+                result = await (eleven if friend == "Eleven" else mike).act(move_id, action, data)
+                latencies.append(time.perf_counter() - started)
+                assert result["status"] == 200, result
+            return result["body"].get("success") is True
+
+        start = time.perf_counter()
+        escaped = await asyncio.gather(*(play(players[i], players[i + 1]) for i in range(0, len(players), 2)))
+        elapsed = time.perf_counter() - start
+        await asyncio.sleep(0.2)
+        for player in players:
+            await player.socket.close()
+            await player.reader
+        await pool.close()
+        latencies.sort()
+        return open_sockets, sum(escaped), elapsed, latencies, players
+
+    process = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:fast_app", "--port", "8790",
+                                "--log-level", "warning"], env=os.environ)
+    try:
+        router.wait_until_up(["http://127.0.0.1:8790"])
+        open_sockets, escaped, elapsed, latencies, players = asyncio.run(
+            load("http://127.0.0.1:8790", "ws://127.0.0.1:8790"))
+    finally:
+        process.terminate()
+        process.wait()
+
+    report("actions over sockets", len(latencies), elapsed)
+    print(f"   action round trip: p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms")
+    missed = sum(len(moves) - player.updates for player in players)
+    late = sum(player.out_of_order for player in players)
+    print(f"   {open_sockets:,} sockets open at once; {escaped:,}/{n // 2:,} teams escaped; "
+          f"{missed} updates missed; {late} results ahead of their update")
+    ok = open_sockets == n and escaped == n // 2 and not missed and not late
+    print("✅ Every socket saw every partner update" if ok else "❌ Channel delivery broken")
+    return ok
+
+
+def bench_tracing(n, teams=20_000):
+    """Request overhead of tracing over n requests per route, then slow-request capture and export"""
+    import asyncio
+    import json
+    import os
+    import tempfile
+    # Built without tracing so the same routes can be timed before and after adding it
+    os.environ["TRACE_SAMPLE_RATE"] = os.environ["TRACE_SLOW_MS"] = "0"
+    os.environ["ADMIN_SNAPSHOT_MAX_AGE_MS"] = "0"
+    import main
+    import tracing
+    from fastapi import FastAPI
+    from simulate import call_asgi
+
+    print_section(f"REQUEST TRACING - {n:,} requests per route")
+    json_type = [(b"content-type", b"application/json")]
+
+    async def run():
+        body = (await call_asgi(main.app, "POST", "/create_team", b'{"team_name": "bench tracing"}', json_type))[2]
+        team_id = json.loads(body)["team_id"]
+        routes = [("GET", f"/team_status/{team_id}", b"", []),
+                  ("PUT", f"/{team_id}/use_item", b'{"friend": "Eleven", "action": "wave"}', json_type),
+                  ("POST", f"/{team_id}/send_item", b'{"from_friend": "Eleven"}', json_type)]
+
+        async def time_routes(app, timed=routes):
+            timings = []
+            for method, path, request_body, headers in timed:
+                start = time.perf_counter()
+                for _ in range(n):
+                    await call_asgi(app, method, path, request_body, headers)
+                timings.append((time.perf_counter() - start) / n)
+            return timings
+
+        # Best of three rounds each, alternating, to keep a noisy host out of the difference
+        tracer = tracing.Tracer(sample_rate=0.01, slow_threshold=0.5)
+        traced_app = tracing.TracingMiddleware(main.fast_app, tracer)
+        untraced = traced = [float("inf")] * len(routes)
+        for _ in range(3):
+            untraced = [min(pair) for pair in zip(untraced, await time_routes(main.fast_app))]
+        for _ in range(3):
+            traced = [min(pair) for pair in zip(traced, await time_routes(traced_app))]
+        for (method, path, _, _), before, after in zip(routes, untraced, traced):
+            print(f"   {method} {path.replace(team_id, '{team_id}')}: {before * 1e6:.1f} µs untraced, "
+                  f"{after * 1e6:.1f} µs traced ({(after - before) * 1e6:+.1f} µs)")
+        print(f"   recorded {tracer.recorded:,}, kept {len(tracer.ring)} sampled at 1%")
+
+        # TRACE_PHASES: the same endpoints as plain routes and as TracedRoute, both traced
+        plain, phased = FastAPI(), FastAPI()
+        phased.router.route_class = tracing.TracedRoute
+        for bare in (plain, phased):
+            bare.put("/{team_id}/use_item")(main.use_item)
+            bare.post("/{team_id}/send_item")(main.send_item)
+        before = after = [float("inf")] * (len(routes) - 1)
+        for _ in range(3):
+            before = [min(pair) for pair in zip(before, await time_routes(
+                tracing.TracingMiddleware(plain, tracer), routes[1:]))]
+            after = [min(pair) for pair in zip(after, await time_routes(
+                tracing.TracingMiddleware(phased, tracer), routes[1:]))]
+        print("   TracedRoute over a plain route: " + ", ".join(
+            f"{method} {path.replace(team_id, '{team_id}')} {(a - b) * 1e6:+.1f} µs"
+            for (method, path, _, _), b, a in zip(routes[1:], before, after)))
+        every = tracing.Tracer(sample_rate=1.0, slow_threshold=0)
+        await call_asgi(tracing.TracingMiddleware(phased, every), *routes[1])
+        marked = list(every.ring[-1].phases())
+        print(f"   TracedRoute phases: {', '.join(marked)}")
+
+        # Slow requests are kept whatever the sample rate
+        tracer = tracing.Tracer(sample_rate=0, slow_threshold=0.02)
+        app = tracing.TracingMiddleware(main.fast_app, tracer)
+        room = main.get_room("bench")
+        for i in range(teams):
+            new_id = main.teams.allocate()
+            main.teams[new_id] = main.new_team_state(new_id, f"tracing {i}", "stranger_things", "bench")
+            room.add(main.teams[new_id])
+        for _ in range(20):
+            await call_asgi(app, "GET", f"/team_status/{team_id}")
+            await call_asgi(app, "GET", "/admin/all_teams")
+        slow = tracer.search(slow=True)
+        all_teams = [trace for trace in slow if trace.route == "/admin/all_teams"]
+        if all_teams:
+            phases = all_teams[0].phases()
+            print(f"   latest slow /admin/all_teams over {teams:,} teams, {all_teams[0].to_dict()['total_ms']:.0f} ms "
+                  f"({', '.join(f'{name} {ms:.1f}' for name, ms in phases.items())})")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "traces.json")
+            events = tracing.write_chrome_trace(path, list(tracer.ring))
+            with open(path) as f:
+                exported = json.load(f)["traceEvents"]
+        print(f"   exported {len(tracer.ring)} traces as {events} trace events")
+        return (len(all_teams) == 20 and len(slow) == 20 and len(exported) == events
+                and marked == ["routing", "validation", "handler", "serialization", "response"])
+
+    ok = asyncio.run(run())
+    print("✅ Every slow request was kept and exported, TracedRoute marked every phase" if ok
+          else "❌ Slow requests went missing or phases were not marked")
+    return ok
+
+
+def bench_handoff(n):
+    """Play n games in-process, pass the state through the handoff wire format and keep playing"""
+    import asyncio
+    import handoff
+    import simulate
+
+    print_section(f"LIVE STATE HANDOFF - {n:,} games")
+
+    async def run():
+        sim = await simulate.simulate(n, seed=1)
+        main = sim.main
+        start = time.perf_counter()
+        blob = handoff.dump_state(main.handoff_state())
+        dumped = time.perf_counter() - start
+        start = time.perf_counter()
+        main.restore_state(handoff.load_state(blob))
+        loaded = time.perf_counter() - start
+        print(f"   {len(main.teams):,} teams: {len(blob) / 1e6:.1f} MB, "
+              f"dump {dumped * 1000:.0f} ms, load {loaded * 1000:.0f} ms")
+        # The restored state has to keep its invariants while play goes on
+        for number in range(n, n + 1000):
+            await sim.play_game(number)
+        sim.check_global()
+        return sim
+
+    sim = asyncio.run(run())
+    if sim.violations:
+        print(f"❌ {len(sim.violations)} invariant violations, first: {sim.violations[0]}")
+        return False
+    print("✅ All invariants held after the handoff")
+    return True
+
+
+def bench_simulate(n):
+    """Play n randomized games in-process on a virtual clock"""
+    import asyncio
+    import simulate
+
+    print_section(f"GAME SIMULATION - {n:,} games")
+    start = time.perf_counter()
+    sim = asyncio.run(simulate.simulate(n, seed=1))
+    elapsed = time.perf_counter() - start
+    report("games", sim.games, elapsed)
+    report("requests", sim.requests, elapsed)
+    if sim.violations:
+        print(f"❌ {len(sim.violations)} invariant violations, first: {sim.violations[0]}")
+        return False
+    print("✅ All invariants held")
+    return True
+
+
+BENCHMARKS = {
+    "admin_cache": (bench_admin_cache, 100_000),
+    "admission": (bench_admission, 800),
+    "channels": (bench_channels, 4_000),
+    "escape": (bench_escape, 1_000_000),
+    "team_ids": (bench_team_ids, 1_000_000),
+    "teams": (bench_teams, 100_000),
+    "export": (bench_export, 100_000),
+    "fastpath": (bench_fastpath, 20_000),
+    "handoff": (bench_handoff, 20_000),
+    "keys": (bench_keys, 1_000_000),
+    "router": (bench_router, 20_000),
+    "search": (bench_search, 100_000),
+    "simulate": (bench_simulate, 10_000),
+    "tracing": (bench_tracing, 20_000),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS) + ["all"])
+    parser.add_argument("--n", type=int, default=None, help="Override the iteration count")
+    args = parser.parse_args()
+
+    names = sorted(BENCHMARKS) if args.benchmark == "all" else [args.benchmark]
+    ok = True
+    for name in names:
+        func, default_n = BENCHMARKS[name]
+        ok = func(args.n or default_n) is not False and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Traffic capture to a JSON Lines file.
+
+``CaptureMiddleware`` records every HTTP request (method, path, query,
+body, status, timing and team_id) and hands the record to a
+``CaptureWriter``. The writer buffers records in memory and a background
+task appends them to the file in batches from a worker thread, so the
+request path never touches the disk.
+
+Enable it with ``CAPTURE_FILE=requests.jsonl``; replay a capture with
+replay.py.
+"""
+import asyncio
+import base64
+import json
+import time
+from typing import Callable, List, Optional
+
+FLUSH_INTERVAL = 0.5
+MAX_BUFFER = 5000
+MAX_BODY_BYTES = 64 * 1024
+
+# Set on the scope by the outermost capture so inner copies skip the request
+SCOPE_MARKER = "capture.recorded"
+
+
+class CaptureWriter:
+    """Buffers capture records and appends them to a file in the background"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.buffer: List[str] = []
+        self.task: Optional[asyncio.Task] = None
+        self.wakeup: Optional[asyncio.Event] = None
+        self.written = 0
+        self.dropped = 0
+
+    def record(self, entry: dict) -> None:
+        if len(self.buffer) >= MAX_BUFFER * 4:
+            # The disk cannot keep up; never let capture take the server down
+            self.dropped += 1
+            return
+        self.buffer.append(json.dumps(entry, ensure_ascii=False))
+        if len(self.buffer) >= MAX_BUFFER and self.wakeup is not None:
+            self.wakeup.set()
+
+    def _write(self, lines: List[str]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    async def flush(self) -> None:
+        if not self.buffer:
+            return
+        lines, self.buffer = self.buffer, []
+        await asyncio.get_running_loop().run_in_executor(None, self._write, lines)
+        self.written += len(lines)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        await self.flush()
+
+
+class CaptureMiddleware:
+    """ASGI middleware that records each HTTP request to a CaptureWriter"""
+
+    def __init__(self, app, writer: CaptureWriter, team_id_of: Callable[[str], Optional[str]]):
+        self.app = app
+        self.writer = writer
+        self.team_id_of = team_id_of
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get(SCOPE_MARKER):
+            await self.app(scope, receive, send)
+            return
+        scope[SCOPE_MARKER] = True
+
+        started = time.time()
+        start = time.perf_counter()
+        body = bytearray()
+        status = None
+        created_id = None
+        response_body = bytearray()
+        path = scope["path"]
+        # Only create_team reveals its team_id in the response
+        want_response = path == "/create_team"
+
+        async def capture_receive():
+            message = await receive()
+            if message["type"] == "http.request" and len(body) < MAX_BODY_BYTES:
+                body.extend(message.get("body", b""))
+            return message
+
+        async def capture_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif want_response and message["type"] == "http.response.body":
+                response_body.extend(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, capture_receive, capture_send)
+        finally:
+            team_id = self.team_id_of(path)
+            if want_response and status == 200:
+                try:
+                    created_id = json.loads(response_body)["team_id"]
+                except (ValueError, KeyError, TypeError):
+                    created_id = None
+                team_id = created_id
+            try:
+                text = body.decode("utf-8")
+                encoded = None
+            except UnicodeDecodeError:
+                text = None
+                encoded = base64.b64encode(bytes(body)).decode("ascii")
+            self.writer.record({
+                "ts": started,
+                "method": scope["method"],
+                "path": path,
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "body": text,
+                "body_b64": encoded,
+                "content_type": next((v.decode("latin-1") for k, v in scope["headers"]
+                                      if k == b"content-type"), None),
+                "status": status,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+                "team_id": team_id,
+            })
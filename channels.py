@@ -0,0 +1,150 @@
+"""Per-team WebSocket channels.
+
+``/ws/{team_id}?friend=Eleven`` opens a socket on a team. Each message the
+client sends is one game action, run by the same handler as its REST route;
+``data`` is that route's JSON body (the query parameters for hint):
+
+    {"id": 7, "action": "use_item", "data": {"action": "combine_radio_tooth"}}
+
+``id`` is optional and echoed back; ``friend`` (``from_friend`` for
+send_item) defaults to the one given when connecting. The socket gets:
+
+- ``{"type": "welcome", "team": {...}}`` once, with the team's status
+- ``{"type": "result", "id": 7, "action": ..., "status": 200, "body": {...}}``
+  for each message: the REST status code and response body
+- ``{"type": "update", "action": ..., "friend": ..., "team": {...}}``
+  whenever anyone on the team changes its state, over a socket or REST;
+  the update for an action reaches every socket before its result does
+
+``ChannelHub`` keeps the sockets open on each team. Every socket has a
+bounded outbox drained by its own writer task, so a slow client only holds
+up itself; one that lets its outbox fill is disconnected rather than
+buffered without limit. A broadcast is encoded once, whatever the number
+of sockets listening.
+"""
+import asyncio
+import json
+from typing import Dict, Optional, Set
+
+DEFAULT_OUTBOX_SIZE = 64
+
+# Close codes (RFC 6455 and the IANA registry)
+POLICY_VIOLATION = 1008
+TRY_AGAIN_LATER = 1013
+
+# Queued after an outbox's last message to make its writer close the socket
+_CLOSE = object()
+
+
+class Listener:
+    """One open socket on a team"""
+    __slots__ = ("websocket", "team_id", "friend", "outbox", "writer", "close_code")
+
+    def __init__(self, websocket, team_id: str, friend: Optional[str], outbox_size: int):
+        self.websocket = websocket
+        self.team_id = team_id
+        self.friend = friend
+        self.outbox: asyncio.Queue = asyncio.Queue(outbox_size)
+        self.writer: Optional[asyncio.Task] = None
+        self.close_code: Optional[int] = None
+
+
+def encode(message: dict) -> str:
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+
+
+class ChannelHub:
+    """The sockets listening on each team"""
+
+    def __init__(self, outbox_size: int = DEFAULT_OUTBOX_SIZE):
+        self.outbox_size = outbox_size
+        self.teams: Dict[str, Set[Listener]] = {}
+        self.opened = 0
+        self.messages_sent = 0
+        self.broadcasts = 0
+        self.overflows = 0
+
+    def join(self, websocket, team_id: str, friend: Optional[str]) -> Listener:
+        """Register an accepted socket and start its writer"""
+        listener = Listener(websocket, team_id, friend, self.outbox_size)
+        listener.writer = asyncio.ensure_future(self._write(listener))
+        self.teams.setdefault(team_id, set()).add(listener)
+        self.opened += 1
+        return listener
+
+    async def leave(self, listener: Listener) -> None:
+        """Unregister a socket once its client is gone, and stop its writer"""
+        listeners = self.teams.get(listener.team_id)
+        if listeners is not None:
+            listeners.discard(listener)
+            if not listeners:
+                del self.teams[listener.team_id]
+        listener.writer.cancel()
+        try:
+            await listener.writer
+        except asyncio.CancelledError:
+            pass
+
+    def send(self, listener: Listener, message: dict) -> None:
+        self._put(listener, encode(message))
+
+    def publish(self, team_id: str, message: dict) -> int:
+        """Queue a message for every socket on a team; returns how many got it"""
+        listeners = self.teams.get(team_id)
+        if not listeners:
+            return 0
+        self.broadcasts += 1
+        text = encode(message)
+        for listener in listeners:
+            self._put(listener, text)
+        return len(listeners)
+
+    def close_team(self, team_id: str, code: int = POLICY_VIOLATION) -> None:
+        """Close every socket on a team after what is already queued for it"""
+        for listener in self.teams.get(team_id, ()):
+            self._close(listener, code)
+
+    def _put(self, listener: Listener, text: str) -> None:
+        if listener.close_code is not None:
+            return
+        try:
+            listener.outbox.put_nowait(text)
+        except asyncio.QueueFull:
+            # Not reading its messages: drop them and hang up
+            self.overflows += 1
+            while not listener.outbox.empty():
+                listener.outbox.get_nowait()
+            self._close(listener, TRY_AGAIN_LATER)
+
+    @staticmethod
+    def _close(listener: Listener, code: int) -> None:
+        if listener.close_code is None:
+            listener.close_code = code
+            # The close matters more than the last queued message
+            if listener.outbox.full():
+                listener.outbox.get_nowait()
+            listener.outbox.put_nowait(_CLOSE)
+
+    async def _write(self, listener: Listener) -> None:
+        while True:
+            text = await listener.outbox.get()
+            try:
+                if text is _CLOSE:
+                    await listener.websocket.close(code=listener.close_code)
+                    return
+                await listener.websocket.send_text(text)
+            except (RuntimeError, OSError):
+                # The client went away; the endpoint's receive loop sees it too
+                return
+            self.messages_sent += 1
+
+    def stats(self) -> dict:
+        return {
+            "teams_listening": len(self.teams),
+            "open_sockets": sum(len(listeners) for listeners in self.teams.values()),
+            "opened_total": self.opened,
+            "messages_sent": self.messages_sent,
+            "broadcasts": self.broadcasts,
+            "closed_for_overflow": self.overflows,
+            "outbox_size": self.outbox_size,
+        }
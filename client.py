@@ -0,0 +1,397 @@
+"""Async client for the game API.
+
+    async with GameClient("http://localhost:8000") as client:
+        team = await client.create_team("Hawkins AV Club")
+        await client.send_item(team["team_id"], "Mike", "demogorgon tooth")
+
+A ``GameClient`` keeps one pool of keep-alive connections (http_pool.py)
+shared by every coroutine using it, so thousands of simulated players can
+play from one process over a few hundred sockets.
+
+Failed calls are retried: connection errors and timeouts after a short
+backoff, 503s from an overloaded server after their Retry-After. Game
+actions carry an Idempotency-Key that stays the same across retries, so an
+action whose response was lost is never applied twice.
+
+``client.batch()`` queues calls and pipelines them over one connection;
+the server answers them in order, so a whole walkthrough costs one round
+trip.
+"""
+import asyncio
+import json
+import os
+import random
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, TypedDict, Union
+from urllib.parse import quote, urlencode
+
+from http_pool import BackendError, ConnectionPool, RawHeaders
+
+DEFAULT_URL = os.environ.get("BASE_URL", "http://localhost:8000")
+DEFAULT_CONNECTIONS = 100
+DEFAULT_RETRIES = 3
+DEFAULT_TIMEOUT = 30.0
+# First retry after a connection error waits about this long, then it doubles
+BACKOFF = 0.05
+MAX_RETRY_AFTER = 10.0
+
+JSON_HEADERS: RawHeaders = [(b"content-type", b"application/json")]
+IDEMPOTENCY_HEADER = b"idempotency-key"
+
+
+# --- Responses ---
+class TeamCreated(TypedDict):
+    team_id: str
+    team_name: str
+    room: str
+    message: str
+    instructions: str
+    story: str
+    hint_system: str
+
+
+class Look(TypedDict):
+    location: str
+    gate_status: str
+    items: List[str]
+    notes: List[str]
+    friend_location: str
+    atmosphere: str
+
+
+class ActionResult(TypedDict, total=False):
+    """What an action returns depends on the scenario; success and message are always there"""
+    success: bool
+    message: str
+
+
+class DimensionStatus(TypedDict):
+    team_status: str
+    escaped: bool
+    eleven_ready: bool
+    mike_ready: bool
+    time_elapsed: int
+    dimension_sync: str
+
+
+class EscapeOptions(TypedDict):
+    allow: str
+    requires: str
+    preconditions: str
+    warning: str
+
+
+class EscapeResult(TypedDict, total=False):
+    success: bool
+    message: str
+    escape_key: str
+    time_taken: str
+    steps_used: List[str]
+    hints_used: int
+    time_window: str
+
+
+class EscapeKey(TypedDict):
+    team_name: str
+    escape_key: str
+    time_taken: str
+    steps_completed: int
+    hints_used: int
+    escaped: bool
+    story_ending: str
+    certificate: str
+
+
+class KeyCheck(TypedDict, total=False):
+    """Who earned a key; just valid and message when it is not a real one"""
+    valid: bool
+    message: str
+    team_id: str
+    team_name: str
+    time_taken: str
+    hints_used: int
+
+
+class Hint(TypedDict, total=False):
+    """A hint, or a warning and time_remaining while hints are cooling down"""
+    hint: str
+    friend: str
+    hints_used_total: int
+    note: str
+    warning: str
+    time_remaining: str
+
+
+class TeamStatus(TypedDict):
+    team_name: str
+    escaped: bool
+    time_elapsed: str
+    eleven_items: List[str]
+    mike_items: List[str]
+    eleven_has_frequency: bool
+    mike_has_eggs: bool
+    steps_completed: List[str]
+    escape_attempts: int
+    hints_used: int
+
+
+class Response(NamedTuple):
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+
+    def json(self) -> Any:
+        return json.loads(self.body) if self.body else None
+
+
+class ApiError(Exception):
+    """The server answered with an error status"""
+
+    def __init__(self, response: Response):
+        try:
+            detail = response.json()["detail"]
+        except (ValueError, TypeError, KeyError):
+            detail = response.body.decode("utf-8", "replace")
+        super().__init__(f"{response.status}: {detail}")
+        self.status = response.status
+        self.detail = detail
+        self.response = response
+
+
+class Call(NamedTuple):
+    method: str
+    target: str
+    headers: RawHeaders
+    body: bytes
+    parse: Callable[[Response], Any]
+
+
+def _json(response: Response) -> Any:
+    return response.json()
+
+
+def _yes(value: Optional[str]) -> bool:
+    return value == "YES"
+
+
+def _dimension_status(response: Response) -> DimensionStatus:
+    headers = response.headers
+    return {
+        "team_status": headers.get("x-team-status", ""),
+        "escaped": _yes(headers.get("x-escaped")),
+        "eleven_ready": _yes(headers.get("x-eleven-ready")),
+        "mike_ready": _yes(headers.get("x-mike-ready")),
+        "time_elapsed": int(headers.get("x-time-elapsed", 0)),
+        "dimension_sync": headers.get("x-dimension-sync", ""),
+    }
+
+
+def _escape_options(response: Response) -> EscapeOptions:
+    headers = response.headers
+    return {
+        "allow": headers.get("allow", ""),
+        "requires": headers.get("x-escape-requires", ""),
+        "preconditions": headers.get("x-preconditions", ""),
+        "warning": headers.get("x-warning", ""),
+    }
+
+
+class Endpoints:
+    """One typed method per endpoint; subclasses decide how the call is sent"""
+
+    def _submit(self, call: Call) -> Awaitable:
+        raise NotImplementedError
+
+    def _get(self, path: str, parse: Callable[[Response], Any] = _json, **query) -> Awaitable:
+        query = {name: value for name, value in query.items() if value is not None}
+        target = path + ("?" + urlencode(query) if query else "")
+        return self._submit(Call("GET", target, [], b"", parse))
+
+    def _action(self, method: str, team_id: str, action: str, body: dict) -> Awaitable:
+        # One key per logical call: every retry of it carries the same one
+        headers = [*JSON_HEADERS, (IDEMPOTENCY_HEADER, uuid.uuid4().hex.encode("ascii"))]
+        return self._submit(Call(method, f"/{quote(team_id)}/{action}", headers, _encode(body), _json))
+
+    def root(self) -> Awaitable[dict]:
+        return self._get("/")
+
+    def create_team(self, team_name: str, room: Optional[str] = None,
+                    scenario: Optional[str] = None) -> Awaitable[TeamCreated]:
+        """Create a team; asking again for the same name in the same room returns the same team"""
+        body = {"team_name": team_name, "room": room, "scenario": scenario}
+        body = {field: value for field, value in body.items() if value is not None}
+        return self._submit(Call("POST", "/create_team", JSON_HEADERS, _encode(body), _json))
+
+    def look(self, team_id: str, character: str) -> Awaitable[Look]:
+        """Look around as a character: "eleven" or "mike" """
+        return self._get(f"/{quote(team_id)}/{character.lower()}")
+
+    def send_item(self, team_id: str, from_friend: str, item: str) -> Awaitable[ActionResult]:
+        return self._action("POST", team_id, "send_item", {"from_friend": from_friend, "item": item})
+
+    def use_item(self, team_id: str, friend: str, action: str) -> Awaitable[ActionResult]:
+        return self._action("PUT", team_id, "use_item", {"friend": friend, "action": action})
+
+    def fix(self, team_id: str, friend: str, action: str) -> Awaitable[ActionResult]:
+        return self._action("PATCH", team_id, "fix", {"friend": friend, "action": action})
+
+    def remove(self, team_id: str, friend: str, code: str) -> Awaitable[ActionResult]:
+        return self._action("DELETE", team_id, "remove", {"friend": friend, "code": code})
+
+    def status(self, team_id: str) -> Awaitable[DimensionStatus]:
+        return self._submit(Call("HEAD", f"/{quote(team_id)}/status", [], b"", _dimension_status))
+
+    def escape_options(self, team_id: str) -> Awaitable[EscapeOptions]:
+        return self._submit(Call("OPTIONS", f"/{quote(team_id)}/escape", [], b"", _escape_options))
+
+    def escape(self, team_id: str, friend: str) -> Awaitable[EscapeResult]:
+        return self._action("POST", team_id, "escape", {"friend": friend})
+
+    def key(self, team_id: str) -> Awaitable[EscapeKey]:
+        return self._get(f"/{quote(team_id)}/key")
+
+    def verify_key(self, escape_key: str) -> Awaitable[KeyCheck]:
+        return self._get(f"/verify_key/{quote(escape_key)}")
+
+    def hint(self, team_id: str, friend: Optional[str] = None) -> Awaitable[Hint]:
+        return self._get(f"/{quote(team_id)}/hint", friend=friend)
+
+    def team_status(self, team_id: str) -> Awaitable[TeamStatus]:
+        return self._get(f"/team_status/{quote(team_id)}")
+
+    def all_teams(self, room: Optional[str] = None) -> Awaitable[dict]:
+        return self._get("/admin/all_teams", room=room)
+
+
+def _encode(body: dict) -> bytes:
+    return json.dumps(body, separators=(",", ":")).encode("utf-8")
+
+
+def _response(raw) -> Response:
+    status, headers, body = raw
+    return Response(status, {name.decode("latin-1"): value.decode("latin-1") for name, value in headers}, body)
+
+
+class GameClient(Endpoints):
+    """Sends each call on its own, over the shared pool, retrying as needed"""
+
+    def __init__(self, base_url: str = DEFAULT_URL, connections: int = DEFAULT_CONNECTIONS,
+                 retries: int = DEFAULT_RETRIES, timeout: Optional[float] = DEFAULT_TIMEOUT):
+        self.base_url = base_url
+        self.pool = ConnectionPool(base_url, connections)
+        self.retries = retries
+        self.timeout = timeout
+        self.requests = 0
+        self.retried = 0
+
+    async def __aenter__(self) -> "GameClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        await self.pool.close()
+
+    def batch(self) -> "Batch":
+        return Batch(self)
+
+    def _retry_delay(self, attempt: int, response: Optional[Response]) -> float:
+        if response is not None and "retry-after" in response.headers:
+            try:
+                return min(float(response.headers["retry-after"]), MAX_RETRY_AFTER)
+            except ValueError:
+                pass
+        # Jittered, so players knocked off together do not come back together
+        return BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5)
+
+    @staticmethod
+    def _result(call: Call, response: Response) -> Any:
+        if response.status >= 400:
+            raise ApiError(response)
+        return call.parse(response)
+
+    async def _submit(self, call: Call) -> Any:
+        for attempt in range(self.retries + 1):
+            self.requests += 1
+            response = None
+            try:
+                raw = await asyncio.wait_for(self.pool.fetch(call.method, call.target, call.headers, call.body),
+                                             self.timeout)
+                response = _response(raw)
+                if response.status != 503 or attempt == self.retries:
+                    return self._result(call, response)
+            except (BackendError, asyncio.TimeoutError):
+                if attempt == self.retries:
+                    raise
+            self.retried += 1
+            await asyncio.sleep(self._retry_delay(attempt, response))
+
+    async def _pipeline(self, calls: List[Call]) -> List[Union[Any, Exception]]:
+        """Send calls pipelined; results in order, with the exception for each call that failed"""
+        results: List[Union[Any, Exception]] = [None] * len(calls)
+        pending = list(range(len(calls)))
+        for attempt in range(self.retries + 1):
+            self.requests += len(pending)
+            last = attempt == self.retries
+            response = None
+            try:
+                raws = await asyncio.wait_for(
+                    self.pool.pipeline([(calls[i].method, calls[i].target, calls[i].headers, calls[i].body)
+                                        for i in pending]),
+                    self.timeout)
+            except (BackendError, asyncio.TimeoutError) as error:
+                raws = []
+                if last:
+                    for index in pending:
+                        results[index] = error
+            retry = []
+            for index, raw in zip(pending, raws):
+                response = _response(raw)
+                if response.status == 503 and not last:
+                    retry.append(index)
+                    continue
+                try:
+                    results[index] = self._result(calls[index], response)
+                except (ApiError, ValueError) as error:
+                    results[index] = error
+            # Calls the connection dropped before answering go again, in their original order
+            pending = retry + pending[len(raws):]
+            if not pending or last:
+                break
+            self.retried += len(pending)
+            await asyncio.sleep(self._retry_delay(attempt, response if retry else None))
+        return results
+
+
+class Batch(Endpoints):
+    """Calls queued up by the endpoint methods and pipelined on one connection by ``run()``
+
+    Each endpoint method returns a future for that call's result; ``run()``
+    returns every result in order, with the exception in place of a call
+    that failed (like ``asyncio.gather(..., return_exceptions=True)``).
+    """
+
+    def __init__(self, client: GameClient):
+        self.client = client
+        self.calls: List[Call] = []
+        self.futures: List[asyncio.Future] = []
+
+    def _submit(self, call: Call) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.calls.append(call)
+        self.futures.append(future)
+        return future
+
+    async def run(self) -> List[Union[Any, Exception]]:
+        calls, futures = self.calls, self.futures
+        self.calls, self.futures = [], []
+        results = await self.client._pipeline(calls) if calls else []
+        for future, result in zip(futures, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+                # Already handed back by run(): never log it as unretrieved
+                future.exception()
+            else:
+                future.set_result(result)
+        return results
@@ -0,0 +1,28 @@
+"""Injectable wall clock.
+
+main.py reads time only through its module-level ``clock``, so tests and
+simulations can swap in a ``VirtualClock`` and move time forward instantly
+instead of sleeping through escape windows and hint cooldowns.
+"""
+import time
+
+
+class SystemClock:
+    """Real wall-clock time"""
+
+    def now(self) -> float:
+        return time.time()
+
+
+class VirtualClock:
+    """Time that only moves when told to"""
+
+    def __init__(self, start: float = 1_700_000_000.0):
+        self.current = start
+
+    def now(self) -> float:
+        return self.current
+
+    def advance(self, seconds: float) -> float:
+        self.current += seconds
+        return self.current
@@ -0,0 +1,139 @@
+"""Escape coordination: a fixed-size rendezvous per team and a shared timer wheel.
+
+Every team holds one ``EscapeRendezvous`` with a slot per character, so the
+memory used by escape tracking stays the same however many attempts are
+made. Teams that have not tried to escape yet all share ``NO_ATTEMPTS``. A single ``TimerWheel`` shared by all teams clears attempts once the
+escape window has passed; each team has at most one entry on the wheel.
+"""
+from typing import Callable, Dict, List, Optional
+
+from puzzle import CHARACTER_KEYS
+
+SLOT_INDEX = {key: index for index, key in enumerate(CHARACTER_KEYS)}
+
+
+class EscapeRendezvous:
+    """Pending escape attempts for one team, one slot per character"""
+    __slots__ = ('times', 'count', 'last_time')
+
+    def __init__(self):
+        self.times: List[Optional[float]] = [None] * len(CHARACTER_KEYS)
+        self.count = 0
+        self.last_time: Optional[float] = None
+
+    def attempt(self, key: str, now: float, window: float) -> bool:
+        """Record an attempt; True when a different character attempted within the window"""
+        slot = SLOT_INDEX[key]
+        self.times[slot] = now
+        self.count += 1
+        self.last_time = now
+        return any(
+            t is not None and now - t <= window
+            for index, t in enumerate(self.times) if index != slot
+        )
+
+    def expire(self, now: float, window: float) -> Optional[float]:
+        """Clear stale attempts; returns the deadline of the oldest one still pending"""
+        deadline = None
+        for index, t in enumerate(self.times):
+            if t is None:
+                continue
+            if now - t > window:
+                self.times[index] = None
+            elif deadline is None or t + window < deadline:
+                deadline = t + window
+        return deadline
+
+    def pending(self) -> int:
+        """Number of characters currently waiting at the gate"""
+        return sum(1 for t in self.times if t is not None)
+
+
+class SharedRendezvous(EscapeRendezvous):
+    """The empty rendezvous shared by teams that have not tried to escape; read-only"""
+    __slots__ = ()
+
+    def attempt(self, key: str, now: float, window: float) -> bool:
+        raise TypeError("NO_ATTEMPTS is shared; give the team its own EscapeRendezvous first")
+
+    def __reduce__(self):
+        # Pickled by name, so it is still the shared instance after a handoff
+        return "NO_ATTEMPTS"
+
+
+NO_ATTEMPTS = SharedRendezvous()
+
+
+class TimerWheel:
+    """Hashed timer wheel keyed by team_id
+
+    Deadlines are bucketed into ``slots`` buckets of ``resolution`` seconds.
+    Scheduling a key that is already on the wheel is a no-op; when a key
+    fires, the callback returns its next deadline (or None) so it can be
+    put back on the wheel.
+    """
+
+    def __init__(self, on_expire: Callable[[str, float], Optional[float]],
+                 resolution: float = 1.0, slots: int = 64):
+        self.on_expire = on_expire
+        self.resolution = resolution
+        self.buckets: List[Dict[str, float]] = [{} for _ in range(slots)]
+        self.scheduled: Dict[str, int] = {}
+        self.current_tick: Optional[int] = None
+
+    def _tick(self, when: float) -> int:
+        return int(when // self.resolution)
+
+    def schedule(self, key: str, deadline: float) -> None:
+        if key in self.scheduled:
+            return
+        tick = self._tick(deadline)
+        if self.current_tick is not None and tick <= self.current_tick:
+            tick = self.current_tick + 1
+        self.buckets[tick % len(self.buckets)][key] = deadline
+        self.scheduled[key] = tick
+
+    def cancel(self, key: str) -> None:
+        tick = self.scheduled.pop(key, None)
+        if tick is not None:
+            self.buckets[tick % len(self.buckets)].pop(key, None)
+
+    def advance(self, now: float, limit: Optional[int] = None) -> int:
+        """Fire every timer due by ``now``, or at most ``limit`` of them; returns how many fired
+
+        A pass cut short by the limit leaves the wheel on the unfinished tick,
+        so the next call picks up where this one stopped.
+        """
+        target = self._tick(now)
+        if self.current_tick is None:
+            self.current_tick = target
+            return 0
+
+        fired = 0
+        # Never walk more than one full revolution: later ticks share buckets
+        start = max(self.current_tick + 1, target - len(self.buckets) + 1)
+        reached = target
+        due = []
+        for tick in range(start, target + 1):
+            bucket = self.buckets[tick % len(self.buckets)]
+            for key, deadline in list(bucket.items()):
+                if self.scheduled.get(key) is not None and self.scheduled[key] <= target:
+                    if len(due) == limit:
+                        reached = tick - 1
+                        break
+                    del bucket[key]
+                    del self.scheduled[key]
+                    due.append((key, deadline))
+            if reached < target:
+                break
+        self.current_tick = reached
+
+        for key, deadline in due:
+            fired += 1
+            next_deadline = self.on_expire(key, now)
+            if next_deadline is not None:
+                self.schedule(key, next_deadline)
+        return fired
+
+    def __len__(self) -> int:
+        return len(self.scheduled)
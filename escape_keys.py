@@ -0,0 +1,92 @@
+"""Signed escape keys that verify without the team.
+
+An escape key is ``ESC1.<claims>.<tag>``. The claims are the team ID,
+seconds taken, hints used and team name joined by "|" (the name last, so
+it may contain anything); the tag is the first 16 bytes of HMAC-SHA256
+over them. Both are base64url without
+padding, so a key fits in a URL path segment.
+
+Verifying is one HMAC and a constant-time compare, with no lookup: any
+process holding the secret checks any key, including keys for teams
+another backend owns or that have long been evicted.
+
+Every process that must accept the same keys needs the same secret, set
+in ESCAPE_KEY_SECRET. Without it, each process makes up its own, and keys
+stop verifying when the process goes (serve.py reloads hand the secret
+over; router.py gives the backends it spawns one shared secret).
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import os
+import secrets
+from typing import NamedTuple, Optional, Tuple
+
+PREFIX = "ESC1"
+TAG_BYTES = 16
+SECRET_ENV = "ESCAPE_KEY_SECRET"
+
+
+class EscapeClaims(NamedTuple):
+    team_id: str
+    team_name: str
+    seconds: int
+    hints_used: int
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class EscapeKeySigner:
+    """Mints and checks escape keys under one secret"""
+
+    def __init__(self, secret: bytes):
+        if not secret:
+            raise ValueError("The escape key secret must not be empty")
+        self.secret = secret
+        # Keyed once; copying it skips hashing the key again for every tag
+        self.keyed = hmac.new(secret, digestmod=hashlib.sha256)
+
+    def _tag(self, claims: bytes) -> bytes:
+        mac = self.keyed.copy()
+        mac.update(claims)
+        return mac.digest()[:TAG_BYTES]
+
+    def sign(self, team_id: str, team_name: str, seconds: int, hints_used: int) -> str:
+        claims = f"{team_id}|{seconds}|{hints_used}|{team_name}".encode("utf-8")
+        return f"{PREFIX}.{_b64encode(claims)}.{_b64encode(self._tag(claims))}"
+
+    def verify(self, key: str) -> Optional[EscapeClaims]:
+        """The claims a key carries, or None if it is malformed or was not signed with this secret"""
+        prefix, _, rest = key.partition(".")
+        encoded_claims, _, encoded_tag = rest.partition(".")
+        if prefix != PREFIX or not encoded_claims:
+            return None
+        try:
+            claims = _b64decode(encoded_claims)
+        except (binascii.Error, ValueError):
+            return None
+        # Compared as text: base64 ignores padding bits and stray characters, so
+        # several strings decode to the same bytes and only one may pass. The
+        # text is encoded first, since compare_digest rejects non-ASCII str
+        expected_tag = _b64encode(self._tag(claims)).encode("ascii")
+        if (not hmac.compare_digest(encoded_tag.encode("utf-8"), expected_tag)
+                or _b64encode(claims) != encoded_claims):
+            return None
+        # Only this code signs, so a valid tag means well-formed claims
+        team_id, seconds, hints_used, team_name = claims.decode("utf-8").split("|", 3)
+        return EscapeClaims(team_id, team_name, int(seconds), int(hints_used))
+
+
+def secret_from_env() -> Tuple[bytes, bool]:
+    """The configured secret and True, or a random one and False"""
+    configured = os.environ.get(SECRET_ENV)
+    if configured:
+        return configured.encode("utf-8"), True
+    return secrets.token_bytes(32), False
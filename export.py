@@ -0,0 +1,235 @@
+"""Streaming, typed export of team results and hint events.
+
+Rows are pulled from the live state in batches and each batch is encoded
+on its own, so memory stays flat however many teams there are. Two
+encodings are supported:
+
+- ``csv``: a header row followed by plain CSV rows
+- ``arrow``: an Apache Arrow IPC stream, one record batch per batch of
+  rows (needs the optional ``pyarrow`` package)
+
+Run as a script to download an export from a running server:
+
+    python export.py teams --format arrow --out teams.arrows
+"""
+import argparse
+import csv
+import io
+import sys
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import puzzle
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:  # Arrow export is optional
+    pyarrow = None
+
+BATCH_SIZE = 1000
+FORMATS = ("csv", "arrow")
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+# (column name, type, getter); types are string, int, float, bool and
+# timestamp (seconds since the epoch, exported as UTC microseconds)
+Column = Tuple[str, str, Callable[[Any], Any]]
+
+
+def _time_taken(team: dict) -> Optional[float]:
+    if team['end_time'] is None:
+        return None
+    return team['end_time'] - team['start_time']
+
+
+def _stage(team: dict) -> Optional[str]:
+    if 'stage' not in team:
+        return None
+    return puzzle.SCENARIOS[team['scenario']].stages[team['stage']]
+
+
+TEAM_COLUMNS: List[Column] = [
+    ("team_id", "string", lambda t: t['team_id']),
+    ("team_name", "string", lambda t: t['team_name']),
+    ("room", "string", lambda t: t['room']),
+    ("scenario", "string", lambda t: t['scenario']),
+    ("stage", "string", _stage),
+    ("escaped", "bool", lambda t: t['escaped']),
+    ("start_time", "timestamp", lambda t: t['start_time']),
+    ("end_time", "timestamp", lambda t: t['end_time']),
+    ("time_taken_seconds", "float", _time_taken),
+    ("escape_key", "string", lambda t: t['escape_key']),
+    ("steps_completed", "string", lambda t: "|".join(t['steps_completed'])),
+    ("steps_count", "int", lambda t: len(t['steps_completed'])),
+    ("escape_attempts", "int", lambda t: t['escape'].count),
+    ("eleven_items", "string", lambda t: "|".join(t['eleven']['items'])),
+    ("mike_items", "string", lambda t: "|".join(t['mike']['items'])),
+    ("eleven_has_frequency", "bool", lambda t: t['eleven']['has_frequency']),
+    ("mike_has_eggs", "bool", lambda t: t['mike']['has_eggs']),
+    ("eleven_hints_used", "int", lambda t: t['eleven']['hints_used']),
+    ("mike_hints_used", "int", lambda t: t['mike']['hints_used']),
+    ("last_hint_time", "timestamp", lambda t: t['last_hint_time']),
+]
+
+# Hint rows are (team_id, hint request) pairs
+HINT_COLUMNS: List[Column] = [
+    ("team_id", "string", lambda h: h[0]),
+    ("time", "timestamp", lambda h: h[1]['time']),
+    ("friend", "string", lambda h: h[1]['friend']),
+    ("hint_given", "string", lambda h: h[1]['hint_given']),
+]
+
+
+def iter_team_rows(teams, team_ids: Optional[Iterable[str]] = None) -> Iterator[dict]:
+    # TeamTable iterates its ID list lazily, so this never copies the table
+    for team_id in teams if team_ids is None else team_ids:
+        team = teams.get(team_id)
+        if team is not None:
+            yield team
+
+
+def iter_hint_rows(teams, hint_requests: Dict[str, List[dict]],
+                   team_ids: Optional[Iterable[str]] = None) -> Iterator[Tuple[str, dict]]:
+    for team_id in teams if team_ids is None else team_ids:
+        for request in list(hint_requests.get(team_id, ())):
+            yield team_id, request
+
+
+def batches(rows: Iterable[Any], columns: List[Column], batch_size: int = BATCH_SIZE) -> Iterator[Dict[str, list]]:
+    """Group rows into column-major batches"""
+    batch: Dict[str, list] = {name: [] for name, _, _ in columns}
+    size = 0
+    for row in rows:
+        for name, _, getter in columns:
+            batch[name].append(getter(row))
+        size += 1
+        if size == batch_size:
+            yield batch
+            batch = {name: [] for name, _, _ in columns}
+            size = 0
+    if size:
+        yield batch
+
+
+class CsvEncoder:
+    def __init__(self, columns: List[Column]):
+        self.columns = columns
+
+    def header(self) -> bytes:
+        return self._rows([[name for name, _, _ in self.columns]])
+
+    def encode(self, batch: Dict[str, list]) -> bytes:
+        return self._rows(zip(*(batch[name] for name, _, _ in self.columns)))
+
+    def footer(self) -> bytes:
+        return b""
+
+    @staticmethod
+    def _rows(rows) -> bytes:
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows(
+            ["" if value is None else value for value in row] for row in rows
+        )
+        return buffer.getvalue().encode("utf-8")
+
+
+class ArrowEncoder:
+    """Arrow IPC stream: schema message, one message per batch, end marker"""
+
+    def __init__(self, columns: List[Column]):
+        if pyarrow is None:
+            raise RuntimeError("Arrow export needs the optional 'pyarrow' package")
+        self.columns = columns
+        arrow_types = {
+            "string": pyarrow.string(),
+            "int": pyarrow.int64(),
+            "float": pyarrow.float64(),
+            "bool": pyarrow.bool_(),
+            "timestamp": pyarrow.timestamp("us", tz="UTC"),
+        }
+        self.schema = pyarrow.schema([(name, arrow_types[kind]) for name, kind, _ in columns])
+        # Everything the writer emits lands here and is handed out per batch
+        self.sink = io.BytesIO()
+        self.writer = pyarrow.ipc.new_stream(self.sink, self.schema)
+
+    def _drain(self) -> bytes:
+        data = self.sink.getvalue()
+        self.sink.seek(0)
+        self.sink.truncate()
+        return data
+
+    def header(self) -> bytes:
+        return b""
+
+    def encode(self, batch: Dict[str, list]) -> bytes:
+        arrays = []
+        for (name, kind, _), field in zip(self.columns, self.schema):
+            values = batch[name]
+            if kind == "timestamp":
+                values = [None if v is None else int(v * 1_000_000) for v in values]
+            arrays.append(pyarrow.array(values, type=field.type))
+        self.writer.write_batch(pyarrow.RecordBatch.from_arrays(arrays, schema=self.schema))
+        return self._drain()
+
+    def footer(self) -> bytes:
+        self.writer.close()
+        return self._drain()
+
+
+def stream_export(rows: Iterable[Any], columns: List[Column], fmt: str,
+                  batch_size: int = BATCH_SIZE) -> Iterator[bytes]:
+    """Encode rows batch by batch, yielding bytes ready to send"""
+    encoder = ArrowEncoder(columns) if fmt == "arrow" else CsvEncoder(columns)
+    header = encoder.header()
+    if header:
+        yield header
+    for batch in batches(rows, columns, batch_size):
+        yield encoder.encode(batch)
+    footer = encoder.footer()
+    if footer:
+        yield footer
+
+
+async def download(url: str, table: str, fmt: str, out: str) -> int:
+    """Stream an export from a running server into a file; returns the bytes written"""
+    from urllib.parse import urlencode
+    from http_pool import ConnectionPool
+
+    pool = ConnectionPool(url, 1)
+    written = 0
+    try:
+        status, _, chunks = await pool.request("GET", f"/admin/export/{table}?{urlencode({'format': fmt})}", [], b"")
+        try:
+            if status != 200:
+                detail = b"".join([chunk async for chunk in chunks]).decode("utf-8", "replace")
+                print(f"❌ Export failed: {status} {detail}")
+                sys.exit(1)
+            with open(out, "wb") as f:
+                async for chunk in chunks:
+                    f.write(chunk)
+                    written += len(chunk)
+        finally:
+            await chunks.aclose()
+    finally:
+        await pool.close()
+    return written
+
+
+def main():
+    import asyncio
+
+    parser = argparse.ArgumentParser(description="Download a team or hint export from a running server")
+    parser.add_argument("table", choices=("teams", "hints"))
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--url", default="http://localhost:8000", help="Server base URL")
+    parser.add_argument("--out", default=None, help="Output file (default: <table>.<format>)")
+    args = parser.parse_args()
+
+    out = args.out or f"{args.table}.{args.format}"
+    written = asyncio.run(download(args.url.rstrip("/"), args.table, args.format, out))
+    print(f"✅ Wrote {written:,} bytes to {out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Raw ASGI fast path for hot read-only routes.
+
+``FastPathRouter`` sits in front of the FastAPI app and answers a handful
+of registered ``/<segment>/<segment>`` routes itself, skipping routing,
+dependency resolution and response classes. Anything it does not
+recognise, or that a handler declines (by returning None), is passed to
+the wrapped app untouched, so that app stays the single source of truth
+for errors and edge cases.
+
+Handlers must produce exactly what the FastAPI route would: use
+``json_response`` for JSON bodies, which encodes like Starlette's
+``JSONResponse``.
+"""
+import json
+from typing import Callable, Dict, List, Optional, Tuple
+
+import tracing
+
+# (status, raw headers, body)
+RawResponse = Tuple[int, List[Tuple[bytes, bytes]], bytes]
+RawHeaders = List[Tuple[bytes, bytes]]
+# Called with the path parameter (usually a team_id) and the request's raw headers
+Handler = Callable[[str, RawHeaders], Optional[RawResponse]]
+
+JSON_CONTENT_TYPE = (b"content-type", b"application/json")
+
+
+def json_body(content) -> bytes:
+    """Encode content the way Starlette's JSONResponse does"""
+    return json.dumps(content, ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def json_response(content, headers: RawHeaders = ()) -> RawResponse:
+    """A JSONResponse as raw parts; headers go after its own,
+    as FastAPI appends headers set on the injected Response"""
+    body = json_body(content)
+    return 200, [(b"content-length", str(len(body)).encode("latin-1")), JSON_CONTENT_TYPE, *headers], body
+
+
+def is_param(segment: str) -> bool:
+    return segment.startswith("{") and segment.endswith("}")
+
+
+def header_value(headers: RawHeaders, name: bytes) -> Optional[str]:
+    """First value of a request header, by lowercase name"""
+    for key, value in headers:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+class FastPathRouter:
+    """ASGI app serving registered two-segment routes directly"""
+
+    def __init__(self, app):
+        self.app = app
+        # (method, literal first segment) and (method, literal second segment)
+        self.by_first: Dict[Tuple[str, str], Handler] = {}
+        self.by_second: Dict[Tuple[str, str], Handler] = {}
+        self.served = 0
+        self.passed = 0
+
+    def route(self, method: str, path: str):
+        """Register a handler for "/literal/{param}" or "/{param}/literal" """
+        first, second = path.strip("/").split("/")
+
+        def decorator(handler: Handler) -> Handler:
+            if is_param(first) and not is_param(second):
+                self.by_second[(method, second)] = handler
+            elif is_param(second) and not is_param(first):
+                self.by_first[(method, first)] = handler
+            else:
+                raise ValueError(f"Fast path routes need one {{param}} segment and one literal: {path}")
+            return handler
+        return decorator
+
+    def _match(self, method: str, path: str) -> Optional[Tuple[Handler, str]]:
+        parts = path.split("/")
+        if len(parts) != 3 or parts[0] or not parts[1] or not parts[2]:
+            return None
+        # Literal first segments win, matching the order the app declares routes in
+        handler = self.by_first.get((method, parts[1]))
+        if handler is not None:
+            return handler, parts[2]
+        handler = self.by_second.get((method, parts[2]))
+        if handler is not None:
+            return handler, parts[1]
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            match = self._match(scope["method"], scope["path"])
+            # CORS responses depend on the Origin header; leave those to the app
+            if match is not None and not any(name == b"origin" for name, _ in scope["headers"]):
+                handler, param = match
+                trace = tracing.current()
+                if trace is not None:
+                    trace.enter("handler")
+                    trace.route = f"fast path: {handler.__name__}"
+                response = handler(param, scope["headers"])
+                if response is not None:
+                    status, headers, body = response
+                    self.served += 1
+                    await send({"type": "http.response.start", "status": status, "headers": headers})
+                    await send({"type": "http.response.body", "body": body})
+                    return
+        self.passed += 1
+        await self.app(scope, receive, send)
@@ -0,0 +1,82 @@
+"""Incrementally maintained game funnel.
+
+Handlers report stage changes as they record steps, so the funnel always
+knows how many teams sit at each stage and how long teams spent in each
+stage before moving on. Reading it costs O(stages), whatever the number of
+teams.
+"""
+from bisect import bisect_left
+from typing import Dict, List
+
+# Upper bounds (seconds) of the dwell-time histogram buckets; the last
+# bucket catches everything slower
+DWELL_BUCKETS = (5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+class Funnel:
+    """Per-stage team counts and dwell-time histograms for one scenario"""
+
+    def __init__(self, stages: List[str]):
+        self.stages = stages
+        self.current = [0] * len(stages)
+        self.reached = [0] * len(stages)
+        self.dwell = [[0] * (len(DWELL_BUCKETS) + 1) for _ in stages]
+        self.dwell_total = [0.0] * len(stages)
+
+    def enter(self, team: dict, now: float) -> None:
+        """Place a new (or freshly reset) team at the first stage
+
+        ``team['stage_reached']`` is the furthest stage the team ever got to,
+        None for a new team. A reset team keeps it, so replaying stages it
+        already reached does not count it as reaching them again.
+        """
+        team['stage'] = 0
+        team['stage_since'] = now
+        self.current[0] += 1
+        if team['stage_reached'] is None:
+            team['stage_reached'] = 0
+            self.reached[0] += 1
+
+    def advance(self, team: dict, stage: int, now: float) -> None:
+        """Move a team forward; stages it skipped over count as reached"""
+        previous = team['stage']
+        if stage <= previous:
+            return
+        spent = now - team['stage_since']
+        self.dwell[previous][bisect_left(DWELL_BUCKETS, spent)] += 1
+        self.dwell_total[previous] += spent
+        self.current[previous] -= 1
+        self.current[stage] += 1
+        for skipped in range(team['stage_reached'] + 1, stage + 1):
+            self.reached[skipped] += 1
+        team['stage'] = stage
+        team['stage_since'] = now
+        team['stage_reached'] = max(team['stage_reached'], stage)
+
+    def leave(self, team: dict) -> None:
+        """Forget a team that is being reset or removed"""
+        self.current[team['stage']] -= 1
+
+    def merge(self, other: "Funnel") -> None:
+        """Add another funnel's counts for the same stages into this one"""
+        for index in range(len(self.stages)):
+            self.current[index] += other.current[index]
+            self.reached[index] += other.reached[index]
+            self.dwell_total[index] += other.dwell_total[index]
+            for bucket, count in enumerate(other.dwell[index]):
+                self.dwell[index][bucket] += count
+
+    def snapshot(self) -> List[Dict]:
+        labels = [f"<={bound}s" for bound in DWELL_BUCKETS] + [f">{DWELL_BUCKETS[-1]}s"]
+        result = []
+        for index, stage in enumerate(self.stages):
+            left = sum(self.dwell[index])
+            result.append({
+                "stage": stage,
+                "teams_here": self.current[index],
+                "teams_reached": self.reached[index],
+                "teams_left": left,
+                "avg_dwell_seconds": round(self.dwell_total[index] / left, 1) if left else None,
+                "dwell_histogram": dict(zip(labels, self.dwell[index]))
+            })
+        return result
@@ -0,0 +1,354 @@
+"""Live state handoff between an old and a new server process.
+
+serve.py runs the game with a control socket (a unix socket named after
+the port it serves). A new serve.py started for the same port connects to
+it instead of binding the port, and the two processes trade places:
+
+1. new -> old: hello, carrying a compatibility token
+2. old -> new: the listening socket itself, as a file descriptor, so new
+   connections queue in the kernel from here on instead of being refused
+3. old stops accepting, lets in-flight requests finish and sends its
+   state: a JSON header frame, then a pickle frame
+4. new loads the state, acknowledges and starts accepting
+5. old exits
+
+When the tokens differ (a scenario's stages or starting state changed, or
+HANDOFF_VERSION did) the old process refuses and keeps serving. When the new process
+never acknowledges, the old one writes its state to ``<socket>.state``
+for ``serve.py --restore``.
+
+``SnapshotWriter`` saves the same state to a file periodically, for
+``serve.py --restore`` after a crash.
+
+Pickled state is only ever read from the same user's processes: the
+control socket and state files are created with mode 0600.
+"""
+import asyncio
+import gc
+import hashlib
+import json
+import os
+import pickle
+import socket
+import struct
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+import puzzle
+
+# Bump whenever the handed-off state changes shape (new team keys, new
+# classes, ...): processes on different versions refuse to trade state
+HANDOFF_VERSION = 5
+ACK_TIMEOUT = 60.0
+_LENGTH = struct.Struct(">Q")
+
+
+class HandoffError(RuntimeError):
+    """The other process refused the handoff or broke off halfway"""
+
+
+def compatibility_token() -> str:
+    """Processes only trade state when they agree on its layout and on every scenario's stages
+
+    Starting character state counts too: teams that never changed theirs
+    point at the scenario's template, which is not sent along.
+    """
+    scenarios = {name: [scenario.stages, scenario.templates]
+                 for name, scenario in sorted(puzzle.SCENARIOS.items())}
+    payload = json.dumps([HANDOFF_VERSION, scenarios], separators=(",", ":")).encode("utf-8")
+    return hashlib.blake2b(payload, digest_size=8).hexdigest()
+
+
+def default_socket_path(port: int) -> str:
+    return os.path.join(tempfile.gettempdir(), f"escape-room-{port}.sock")
+
+
+# (Un)pickling the state allocates a container per team dict, list and
+# set, none of them garbage: with the collector on, it keeps rescanning a
+# heap that only grows
+def dump_state(state: Any) -> bytes:
+    return _without_gc(pickle.dumps, state, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_state(blob: bytes) -> Any:
+    return _without_gc(pickle.loads, blob)
+
+
+def _without_gc(function: Callable, *args, **kwargs):
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+# --- Framing: 8-byte big-endian length, then the payload ---
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if not count:
+            raise HandoffError("Connection closed mid-handoff")
+        received += count
+    return bytes(buffer)
+
+
+def _send_frame(sock: socket.socket, payload: bytes) -> None:
+    sock.sendall(_LENGTH.pack(len(payload)) + payload)
+
+
+def _recv_frame(sock: socket.socket) -> bytes:
+    return _recv_exactly(sock, _LENGTH.unpack(_recv_exactly(sock, _LENGTH.size))[0])
+
+
+def _send_json(sock: socket.socket, message: dict) -> None:
+    _send_frame(sock, json.dumps(message).encode("utf-8"))
+
+
+def _recv_json(sock: socket.socket) -> dict:
+    return json.loads(_recv_frame(sock))
+
+
+async def _recv_frame_async(loop: asyncio.AbstractEventLoop, sock: socket.socket) -> bytes:
+    async def exactly(size: int) -> bytes:
+        buffer = bytearray()
+        while len(buffer) < size:
+            chunk = await loop.sock_recv(sock, size - len(buffer))
+            if not chunk:
+                raise HandoffError("Connection closed mid-handoff")
+            buffer.extend(chunk)
+        return bytes(buffer)
+
+    return await exactly(_LENGTH.unpack(await exactly(_LENGTH.size))[0])
+
+
+async def _send_frame_async(loop: asyncio.AbstractEventLoop, sock: socket.socket, payload: bytes) -> None:
+    await loop.sock_sendall(sock, _LENGTH.pack(len(payload)))
+    await loop.sock_sendall(sock, payload)
+
+
+# --- New process ---
+def take_over(path: str, load: Callable[[Any, dict], None]) -> Optional[Tuple[List[socket.socket], dict]]:
+    """Take the listening sockets and state from the process serving at path
+
+    Returns None when nothing is serving there. ``load(state, report)`` must
+    install the state; it runs before the old process is told it may exit.
+    Returns the listening sockets and the handoff report (timings in ms).
+    """
+    control = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        control.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        control.close()
+        return None
+
+    with control:
+        requested = time.time()
+        _send_json(control, {"token": compatibility_token(), "pid": os.getpid()})
+        # The descriptors ride along with the first bytes of the reply
+        length, fds, _, _ = socket.recv_fds(control, _LENGTH.size, 16)
+        if len(length) < _LENGTH.size:
+            length += _recv_exactly(control, _LENGTH.size - len(length))
+        reply = json.loads(_recv_exactly(control, _LENGTH.unpack(length)[0]))
+        if not reply.get("ok"):
+            for fd in fds:
+                os.close(fd)
+            raise HandoffError(reply.get("error", "Old process closed the control socket"))
+        sockets = [socket.socket(fileno=fd) for fd in fds]
+
+        header = _recv_json(control)
+        started = time.perf_counter()
+        blob = _recv_frame(control)
+        transfer_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        state = load_state(blob)
+
+        report = {
+            **header,
+            "old_pid": reply["pid"],
+            "new_pid": os.getpid(),
+            "state_bytes": len(blob),
+            "transfer_ms": round(transfer_ms, 1),
+        }
+        load(state, report)
+        report["load_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        _send_json(control, {"ok": True})
+        report["total_ms"] = round((time.time() - requested) * 1000, 1)
+        # Nothing was accepted from the moment the old process stopped until now
+        report["paused_ms"] = round((time.time() - header["stopped_accepting_at"]) * 1000, 1)
+    return sockets, report
+
+
+# --- Old process ---
+class HandoffServer:
+    """Listens on the control socket and hands everything over to the first process that asks
+
+    ``drain()`` must stop accepting and wait for in-flight requests;
+    ``snapshot()`` returns the state to send. ``handed_off`` is set once the
+    new process has acknowledged (or the state was written to a file), and
+    the caller should then exit without touching the state again.
+    """
+
+    def __init__(self, path: str, sockets: List[socket.socket],
+                 drain: Callable[[], Awaitable[None]], snapshot: Callable[[], Any]):
+        self.path = path
+        self.sockets = sockets
+        self.drain = drain
+        self.snapshot = snapshot
+        self.handed_off = asyncio.Event()
+        self.listener: Optional[socket.socket] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.path)
+        os.chmod(self.path, 0o600)
+        listener.listen(1)
+        listener.setblocking(False)
+        self.listener = listener
+        self.task = asyncio.get_running_loop().create_task(self._serve())
+
+    def close(self, unlink: bool = True) -> None:
+        if self.task is not None and not self.task.done() and not self.handed_off.is_set():
+            self.task.cancel()
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+            if unlink and os.path.exists(self.path):
+                os.unlink(self.path)
+
+    async def _serve(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            connection, _ = await loop.sock_accept(self.listener)
+            try:
+                if await self._hand_off(loop, connection):
+                    return
+            except (OSError, HandoffError, ValueError) as error:
+                # Nothing was handed over yet: keep serving and wait for the next caller
+                print(f"Handoff failed: {error!r}")
+            finally:
+                connection.close()
+
+    async def _hand_off(self, loop: asyncio.AbstractEventLoop, connection: socket.socket) -> bool:
+        connection.setblocking(False)
+        hello = json.loads(await _recv_frame_async(loop, connection))
+        if hello.get("token") != compatibility_token():
+            error = "Incompatible state layout or scenarios; restart without handoff"
+            await _send_frame_async(loop, connection, json.dumps({"ok": False, "error": error}).encode())
+            print(f"Refused handoff to pid {hello.get('pid')}: {error}")
+            return False
+
+        # The listening sockets go first, so connections queue for the new
+        # process while this one finishes what it has started
+        reply = json.dumps({"ok": True, "pid": os.getpid()}).encode("utf-8")
+        socket.send_fds(connection, [_LENGTH.pack(len(reply)) + reply], [s.fileno() for s in self.sockets])
+        # Only one handoff at a time: later callers get a refused connection
+        self.listener.close()
+        self.listener = None
+
+        stopped_accepting_at = time.time()
+        started = time.perf_counter()
+        await self.drain()
+        drain_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        blob = dump_state(self.snapshot())
+        dump_ms = (time.perf_counter() - started) * 1000
+        header = {
+            "stopped_accepting_at": stopped_accepting_at,
+            "drain_ms": round(drain_ms, 1),
+            "dump_ms": round(dump_ms, 1),
+        }
+
+        # From here on this process no longer serves, so it must not lose the state
+        try:
+            await _send_frame_async(loop, connection, json.dumps(header).encode("utf-8"))
+            await _send_frame_async(loop, connection, blob)
+            ack = json.loads(await asyncio.wait_for(_recv_frame_async(loop, connection), ACK_TIMEOUT))
+        except (OSError, HandoffError, ValueError, asyncio.TimeoutError):
+            ack = {}
+        if not ack.get("ok"):
+            fallback = f"{self.path}.state"
+            with open(fallback, "wb") as f:
+                os.chmod(fallback, 0o600)
+                f.write(blob)
+            print(f"New process never confirmed the handoff; state saved to {fallback} "
+                  f"(start with: python serve.py --restore {fallback})")
+        self.handed_off.set()
+        return True
+
+
+# --- Periodic snapshots ---
+class SnapshotWriter:
+    """Writes the state to a file from a forked child, so the server only pays for the fork
+
+    The child sees the state exactly as it was when it was forked (pages are
+    shared copy-on-write) and pickles it at its own pace while the server
+    goes on. ``run`` is meant for the scheduler: it starts a snapshot, or
+    collects the one still being written.
+    """
+
+    def __init__(self, path: str, snapshot: Callable[[], Any]):
+        self.path = path
+        self.snapshot = snapshot
+        self.child: Optional[int] = None
+        self.written = 0
+        self.failed = 0
+        # What a snapshot costs the server: the time to fork
+        self.last_fork_ms: Optional[float] = None
+
+    def run(self, budget: int = 0) -> int:
+        """Start a snapshot unless the last one is still being written
+
+        A snapshot is one fork however big the state, so there is never
+        work left over: returns 0.
+        """
+        if self.child is not None and not self.collect(block=False):
+            return 0
+        started = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                blob = dump_state(self.snapshot())
+                partial = f"{self.path}.partial"
+                with open(partial, "wb") as f:
+                    os.chmod(partial, 0o600)
+                    f.write(blob)
+                os.replace(partial, self.path)
+                code = 0
+            finally:
+                os._exit(code)
+        self.child = pid
+        self.last_fork_ms = (time.perf_counter() - started) * 1000
+        return 0
+
+    def collect(self, block: bool = True) -> bool:
+        """Reap the snapshot child; False while it is still running"""
+        if self.child is None:
+            return True
+        pid, status = os.waitpid(self.child, 0 if block else os.WNOHANG)
+        if pid == 0:
+            return False
+        self.child = None
+        if os.waitstatus_to_exitcode(status) == 0:
+            self.written += 1
+        else:
+            self.failed += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "written": self.written,
+            "failed": self.failed,
+            "in_progress": self.child is not None,
+            "last_fork_ms": round(self.last_fork_ms, 2) if self.last_fork_ms is not None else None,
+        }
@@ -0,0 +1,237 @@
+"""Keep-alive HTTP/1.1 connection pool on asyncio streams.
+
+Shared by the router (forwarding to backends) and the player client
+(client.py). A general-purpose client costs several times more per request
+than uvicorn spends answering it; this one only speaks the subset of
+HTTP/1.1 the game server uses, and adds pipelining: several requests
+written back to back on one connection, answered in order.
+"""
+import asyncio
+from typing import AsyncIterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+DEFAULT_SIZE = 100
+
+# Never passed on from a response, nor forwarded by the router
+HOP_BY_HOP = {b"connection", b"keep-alive", b"transfer-encoding", b"te", b"upgrade", b"proxy-connection"}
+# Dropped from responses too: whoever serves them on writes their own
+REWRITTEN_RESPONSE = {b"date", b"server"}
+
+RawHeaders = List[Tuple[bytes, bytes]]
+Connection = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+# (method, target, headers, body)
+Request = Tuple[str, str, RawHeaders, bytes]
+
+
+class BackendError(Exception):
+    """The server could not be reached or sent a malformed response"""
+
+
+class ResponseBody:
+    """Async iterator over a response body that frees its connection when closed
+
+    Read to the end, a keep-alive connection goes back to the pool; closed
+    early, it is dropped, since the rest of the body is still on the wire.
+    """
+
+    def __init__(self, pool: "ConnectionPool", connection: Connection, chunks: AsyncIterator[bytes],
+                 keep_alive: bool):
+        self.pool = pool
+        self.connection = connection
+        self.chunks = chunks
+        self.keep_alive = keep_alive
+        self.complete = False
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        try:
+            return await self.chunks.__anext__()
+        except StopAsyncIteration:
+            self.complete = True
+            await self.aclose()
+            raise
+
+    async def aclose(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        await self.chunks.aclose()
+        if self.complete and self.keep_alive:
+            self.pool.idle.append(self.connection)
+        else:
+            self.connection[1].close()
+        self.pool.slots.release()
+
+
+class ConnectionPool:
+    """Up to ``size`` keep-alive connections to one server"""
+
+    def __init__(self, url: str, size: int = DEFAULT_SIZE):
+        parsed = urlsplit(url)
+        if parsed.scheme != "http" or not parsed.hostname:
+            raise ValueError(f"URLs must be http://host:port, got {url!r}")
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.host_header = f"{self.host}:{self.port}".encode("latin-1")
+        self.size = size
+        self.slots: Optional[asyncio.Semaphore] = None
+        self.idle: List[Connection] = []
+
+    def _encode(self, method: str, target: str, headers: RawHeaders, body: bytes) -> bytes:
+        return b"%s %s HTTP/1.1\r\nhost: %s\r\ncontent-length: %d\r\n%s\r\n%s" % (
+            method.encode("latin-1"), target.encode("latin-1"), self.host_header, len(body),
+            b"".join(b"%s: %s\r\n" % header for header in headers), body)
+
+    @staticmethod
+    async def _read_head(reader: asyncio.StreamReader) -> Tuple[int, RawHeaders]:
+        head = await reader.readuntil(b"\r\n\r\n")
+        lines = head[:-4].split(b"\r\n")
+        status = int(lines[0].split(b" ", 2)[1])
+        headers = []
+        for line in lines[1:]:
+            name, _, value = line.partition(b":")
+            headers.append((name.strip().lower(), value.strip()))
+        return status, headers
+
+    async def _acquire(self) -> Tuple[Connection, bool]:
+        """A free slot and a connection for it; True if the connection was idle in the pool"""
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.size)
+        await self.slots.acquire()
+        if self.idle:
+            return self.idle.pop(), True
+        try:
+            return await asyncio.open_connection(self.host, self.port), False
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def _body_reader(self, reader: asyncio.StreamReader, method: str, status: int,
+                     fields: dict) -> Tuple[AsyncIterator[bytes], bool]:
+        """The body's chunks, and whether its end is marked (so the connection can be reused)"""
+        if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            return self._empty(), True
+        if fields.get(b"transfer-encoding", b"").lower() == b"chunked":
+            return self._chunked(reader), True
+        if b"content-length" in fields:
+            return self._sized(reader, int(fields[b"content-length"])), True
+        return self._until_closed(reader), False
+
+    @staticmethod
+    def _public(headers: RawHeaders) -> RawHeaders:
+        return [h for h in headers if h[0] not in HOP_BY_HOP and h[0] not in REWRITTEN_RESPONSE]
+
+    async def request(self, method: str, target: str, headers: RawHeaders,
+                      body: bytes) -> Tuple[int, RawHeaders, ResponseBody]:
+        """Send a request; the body must be read to the end (or closed) to free the connection"""
+        request = self._encode(method, target, headers, body)
+        connection, reused = await self._acquire()
+        try:
+            try:
+                connection[1].write(request)
+                status, response_headers = await self._read_head(connection[0])
+            except (ConnectionError, asyncio.IncompleteReadError):
+                if not reused:
+                    raise
+                # The server closed an idle keep-alive connection before reading this request
+                connection[1].close()
+                connection = await asyncio.open_connection(self.host, self.port)
+                connection[1].write(request)
+                status, response_headers = await self._read_head(connection[0])
+        except BaseException as error:
+            connection[1].close()
+            self.slots.release()
+            if isinstance(error, (OSError, asyncio.IncompleteReadError, ValueError, IndexError)):
+                raise BackendError(f"{self.host}:{self.port}: {error!r}") from error
+            raise
+
+        fields = dict(response_headers)
+        chunks, delimited = self._body_reader(connection[0], method, status, fields)
+        keep_alive = delimited and fields.get(b"connection", b"").lower() != b"close"
+        return status, self._public(response_headers), ResponseBody(self, connection, chunks, keep_alive)
+
+    async def pipeline(self, requests: List[Request]) -> List[Tuple[int, RawHeaders, bytes]]:
+        """Write every request on one connection at once, then read the responses in order
+
+        Returns the responses read before the connection ended, which may be
+        fewer than the requests: the rest may or may not have been handled.
+        Raises BackendError only when no response came back at all.
+        """
+        connection, reused = await self._acquire()
+        responses: List[Tuple[int, RawHeaders, bytes]] = []
+        reusable = False
+        failure = None
+        try:
+            connection[1].write(b"".join(self._encode(*request) for request in requests))
+            keep_alive = True
+            for method, _, _, _ in requests:
+                status, response_headers = await self._read_head(connection[0])
+                fields = dict(response_headers)
+                chunks, keep_alive = self._body_reader(connection[0], method, status, fields)
+                content = b"".join([chunk async for chunk in chunks])
+                responses.append((status, self._public(response_headers), content))
+                keep_alive = keep_alive and fields.get(b"connection", b"").lower() != b"close"
+                if not keep_alive:
+                    break
+            reusable = keep_alive
+        except (OSError, asyncio.IncompleteReadError, ValueError, IndexError) as error:
+            failure = error
+        finally:
+            if reusable:
+                self.idle.append(connection)
+            else:
+                connection[1].close()
+            self.slots.release()
+
+        if failure is not None and not responses:
+            if reused and isinstance(failure, (ConnectionError, asyncio.IncompleteReadError)):
+                # The server closed an idle keep-alive connection before reading these requests
+                return await self.pipeline(requests)
+            raise BackendError(f"{self.host}:{self.port}: {failure!r}") from failure
+        return responses
+
+    @staticmethod
+    async def _empty() -> AsyncIterator[bytes]:
+        return
+        yield
+
+    @staticmethod
+    async def _sized(reader: asyncio.StreamReader, length: int) -> AsyncIterator[bytes]:
+        if length:
+            yield await reader.readexactly(length)
+
+    @staticmethod
+    async def _chunked(reader: asyncio.StreamReader) -> AsyncIterator[bytes]:
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+            if size == 0:
+                await reader.readuntil(b"\r\n")
+                return
+            chunk = await reader.readexactly(size + 2)
+            yield chunk[:-2]
+
+    @staticmethod
+    async def _until_closed(reader: asyncio.StreamReader) -> AsyncIterator[bytes]:
+        while True:
+            chunk = await reader.read(65536)
+            if not chunk:
+                return
+            yield chunk
+
+    async def fetch(self, method: str, target: str, headers: RawHeaders, body: bytes) -> Tuple[int, RawHeaders, bytes]:
+        """Send a request and read the whole response"""
+        status, response_headers, chunks = await self.request(method, target, headers, body)
+        try:
+            content = b"".join([chunk async for chunk in chunks])
+        except (OSError, asyncio.IncompleteReadError, ValueError) as error:
+            raise BackendError(f"{self.host}:{self.port}: {error!r}") from error
+        finally:
+            await chunks.aclose()
+        return status, response_headers, content
+
+    async def close(self) -> None:
+        while self.idle:
+            self.idle.pop()[1].close()
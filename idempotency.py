@@ -0,0 +1,214 @@
+"""Idempotency-Key support for mutating game actions.
+
+Clients on flaky networks retry requests whose response they never saw.
+When such a request carries an ``Idempotency-Key`` header, the
+``IdempotencyMiddleware`` runs it once and stores the response in an
+``IdempotencyStore`` under (team_id, key). Retries get the stored response
+back, marked with ``Idempotent-Replayed: true``, without running the
+handler again. A retry that arrives while the first request is still
+running waits for it instead of racing it.
+
+The store is a bounded LRU whose entries also expire after a TTL.
+"""
+import asyncio
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+HEADER = b"idempotency-key"
+REPLAYED_HEADER = (b"idempotent-replayed", b"true")
+MAX_KEY_LENGTH = 255
+DEFAULT_MAX_ENTRIES = 50_000
+DEFAULT_TTL = 15 * 60.0
+
+# (method, last path segment) of the actions that honour the header
+ACTIONS = {
+    ("POST", "send_item"),
+    ("PUT", "use_item"),
+    ("PATCH", "fix"),
+    ("DELETE", "remove"),
+    ("POST", "escape"),
+}
+
+# (status, raw headers, body)
+StoredResponse = Tuple[int, List[Tuple[bytes, bytes]], bytes]
+
+
+class IdempotencyStore:
+    """Bounded, TTL-evicting LRU of responses keyed by (team_id, key)"""
+
+    def __init__(self, now: Callable[[], float], max_entries: int = DEFAULT_MAX_ENTRIES,
+                 ttl: float = DEFAULT_TTL):
+        self.now = now
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # (team_id, key) -> (expires, request fingerprint, response)
+        self.entries: "OrderedDict[Tuple[str, str], Tuple[float, bytes, StoredResponse]]" = OrderedDict()
+        self.in_flight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.conflicts = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Tuple[str, str]) -> Optional[Tuple[bytes, StoredResponse]]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires, fingerprint, response = entry
+        if expires <= self.now():
+            del self.entries[key]
+            self.expirations += 1
+            return None
+        self.entries.move_to_end(key)
+        return fingerprint, response
+
+    def put(self, key: Tuple[str, str], fingerprint: bytes, response: StoredResponse) -> None:
+        now = self.now()
+        self.entries[key] = (now + self.ttl, fingerprint, response)
+        self.entries.move_to_end(key)
+        # Expired entries sit at the old end unless they were read recently
+        while self.entries:
+            oldest = next(iter(self.entries))
+            expires = self.entries[oldest][0]
+            if expires <= now:
+                self.expirations += 1
+            elif len(self.entries) > self.max_entries:
+                self.evictions += 1
+            else:
+                break
+            del self.entries[oldest]
+
+    def expire(self, limit: int) -> int:
+        """Drop up to `limit` expired entries from the old end; returns how many were dropped"""
+        now = self.now()
+        dropped = 0
+        while self.entries and dropped < limit:
+            oldest = next(iter(self.entries))
+            if self.entries[oldest][0] > now:
+                break
+            del self.entries[oldest]
+            dropped += 1
+        self.expirations += dropped
+        return dropped
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "in_flight": len(self.in_flight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "waited_for_in_flight": self.waits,
+            "key_reuse_conflicts": self.conflicts,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+def _error(status: int, detail: str) -> StoredResponse:
+    body = json.dumps({"detail": detail}, separators=(",", ":")).encode("utf-8")
+    return status, [(b"content-length", str(len(body)).encode("latin-1")),
+                    (b"content-type", b"application/json")], body
+
+
+class IdempotencyMiddleware:
+    """ASGI middleware that replays stored responses for repeated Idempotency-Keys"""
+
+    def __init__(self, app, store: IdempotencyStore, team_id_of: Callable[[str], Optional[str]]):
+        self.app = app
+        self.store = store
+        self.team_id_of = team_id_of
+
+    @staticmethod
+    async def _send_stored(send, response: StoredResponse, replayed: bool) -> None:
+        status, headers, body = response
+        if replayed:
+            headers = [*headers, REPLAYED_HEADER]
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        idempotency_key = next((value for name, value in scope["headers"] if name == HEADER), None)
+        parts = scope["path"].split("/")
+        if idempotency_key is None or len(parts) != 3 or (scope["method"], parts[2]) not in ACTIONS:
+            await self.app(scope, receive, send)
+            return
+        if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+            await self._send_stored(send, _error(400, f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters"),
+                                    False)
+            return
+
+        # The request has to be read up front to tell a retry from a reused key
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                return
+            body.extend(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        # The team is part of the key, and its ID may be spelled differently on a retry
+        fingerprint = hashlib.blake2b(b"%s %s\n%s" % (scope["method"].encode(), parts[2].encode(), body),
+                                      digest_size=16).digest()
+        team_id = self.team_id_of(scope["path"])
+        key = (team_id, idempotency_key.decode("latin-1"))
+
+        while True:
+            stored = self.store.get(key)
+            if stored is not None:
+                if stored[0] != fingerprint:
+                    self.store.conflicts += 1
+                    await self._send_stored(send, _error(422, "Idempotency-Key was already used for a different request"),
+                                            False)
+                    return
+                self.store.hits += 1
+                await self._send_stored(send, stored[1], True)
+                return
+            pending = self.store.in_flight.get(key)
+            if pending is None:
+                break
+            # Same key still running: wait for it, then look again
+            self.store.waits += 1
+            await asyncio.shield(pending)
+
+        self.store.misses += 1
+        done = asyncio.get_running_loop().create_future()
+        self.store.in_flight[key] = done
+        status = None
+        headers: List[Tuple[bytes, bytes]] = []
+        response_body = bytearray()
+        delivered = False
+
+        async def replay_receive():
+            nonlocal delivered
+            if not delivered:
+                delivered = True
+                return {"type": "http.request", "body": bytes(body), "more_body": False}
+            return await receive()
+
+        async def recording_send(message):
+            nonlocal status, headers
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = [tuple(h) for h in message.get("headers", [])]
+            elif message["type"] == "http.response.body":
+                response_body.extend(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, recording_send)
+            # Server errors are worth retrying for real, so they are not stored
+            if status is not None and status < 500:
+                self.store.put(key, fingerprint, (status, headers, bytes(response_body)))
+        finally:
+            del self.store.in_flight[key]
+            done.set_result(None)
@@ -1,9 +1,13 @@
-import requests
-import time
-import sys
+import argparse
+import asyncio
 import json
+import sys
+import time
+
+from client import DEFAULT_URL, ApiError, BackendError, GameClient
 
-BASE_URL = "http://localhost:8000"
+DEFAULT_PACE = 0.5
+DEFAULT_CONNECTIONS = 200
 
 def print_section(title):
     """Print a formatted section header"""
@@ -22,7 +26,7 @@ def print_result(success, message, data=None):
         print(f"✅ {message}")
     else:
         print(f"❌ {message}")
-    
+
     if data:
         # Clean up data for display
         if isinstance(data, dict):
@@ -36,329 +40,169 @@ def print_result(success, message, data=None):
                     clean_data[key] = value
             print(f"   Data: {json.dumps(clean_data, indent=2)}")
 
-def test_all_endpoints():
+async def attempt(call):
+    """Await a client call; None (after printing why) if it failed"""
+    try:
+        return await call
+    except ApiError as e:
+        print_result(False, f"Failed: {e.status}")
+        print(f"   Error: {e.detail}")
+    except BackendError as e:
+        print_result(False, f"Exception: {str(e)}")
+    return None
+
+async def test_all_endpoints(client, pace):
     """Test all endpoints in the specified sequence"""
-    
-    team_id = None
+
     team_name = "TestTeam"
-    
+
     print_section("STRANGER THINGS API COMPREHENSIVE TEST")
     print("Testing all endpoints in sequence...")
-    
+
     # ========== Step 1: Create Team ==========
     print_step("1", "POST /create_team - Create a new team")
-    try:
-        response = requests.post(
-            f"{BASE_URL}/create_team",
-            json={"team_name": team_name}
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            team_id = data.get("team_id")
-            print_result(True, f"Team created successfully: {team_id}")
-            print(f"   Team Name: {data.get('team_name')}")
-            print(f"   Message: {data.get('message')}")
-            print(f"   Instructions: {data.get('instructions')}")
-        else:
-            print_result(False, f"Failed to create team: {response.status_code}")
-            print(f"   Error: {response.text}")
-            return False
-    except Exception as e:
-        print_result(False, f"Exception creating team: {str(e)}")
+    data = await attempt(client.create_team(team_name))
+    if data is None:
         return False
-    
-    time.sleep(0.5)
-    
-    # ========== Step 2: Eleven Looks Around ==========
-    print_step("2", f"GET /{team_id}/eleven - Eleven looks around Hawkins Lab")
-    try:
-        response = requests.get(f"{BASE_URL}/{team_id}/eleven")
-        
-        if response.status_code == 200:
-            data = response.json()
-            print_result(True, "Eleven looked around successfully")
-            print(f"   Location: {data.get('location')}")
-            print(f"   Gate Status: {data.get('gate_status')}")
-            print(f"   Items: {', '.join(data.get('items', []))}")
-            print(f"   Note: {data.get('notes', [''])[0]}")
-        else:
-            print_result(False, f"Failed: {response.status_code}")
-            print(f"   Error: {response.text}")
-            return False
-    except Exception as e:
-        print_result(False, f"Exception: {str(e)}")
-        return False
-    
-    time.sleep(0.5)
-    
-    # ========== Step 3: Mike Looks Around ==========
-    print_step("3", f"GET /{team_id}/mike - Mike looks around Upside Down")
-    try:
-        response = requests.get(f"{BASE_URL}/{team_id}/mike")
-        
-        if response.status_code == 200:
-            data = response.json()
-            print_result(True, "Mike looked around successfully")
-            print(f"   Location: {data.get('location')}")
-            print(f"   Gate Status: {data.get('gate_status')}")
-            print(f"   Items: {', '.join(data.get('items', []))}")
-            print(f"   Note: {data.get('notes', [''])[0]}")
-        else:
-            print_result(False, f"Failed: {response.status_code}")
-            print(f"   Error: {response.text}")
-            return False
-    except Exception as e:
-        print_result(False, f"Exception: {str(e)}")
-        return False
-    
-    time.sleep(0.5)
-    
-    # ========== Step 4: Send Demogorgon Tooth ==========
-    print_step("4", f"POST /{team_id}/send_item - Mike sends demogorgon tooth to Eleven")
-    try:
-        response = requests.post(
-            f"{BASE_URL}/{team_id}/send_item",
-            json={"from_friend": "Mike", "item": "demogorgon tooth"}
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            success = data.get("success", False)
-            if success:
-                print_result(True, data.get("message", "Item sent"))
-                print(f"   Eleven's Items: {data.get('eleven_items', [])}")
-                print(f"   Mike's Items: {data.get('mike_items', [])}")
-                print(f"   Next Action: {data.get('next_action')}")
-            else:
-                print_result(False, data.get("message", "Failed to send item"))
-                return False
-        else:
-            print_result(False, f"Failed: {response.status_code}")
-            print(f"   Error: {response.text}")
-            return False
-    except Exception as e:
-        print_result(False, f"Exception: {str(e)}")
-        return False
-    
-    time.sleep(0.5)
-    
-    # ========== Step 5: Combine Radio and Tooth ==========
-    print_step("5", f"PUT /{team_id}/use_item - Eleven combines radio and tooth")
-    try:
-        response = requests.put(
-            f"{BASE_URL}/{team_id}/use_item",
-            json={"friend": "Eleven", "action": "combine_radio_tooth"}
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            success = data.get("success", False)
-            if success:
-                print_result(True, data.get("message", "Items combined"))
-                print(f"   Sound Effect: {data.get('sound_effect')}")
-                print(f"   Next Action: {data.get('next_action')}")
-            else:
-                print_result(False, data.get("message", "Failed to combine items"))
-                return False
-        else:
-            print_result(False, f"Failed: {response.status_code}")
-            print(f"   Error: {response.text}")
+    team_id = data["team_id"]
+    print_result(True, f"Team created successfully: {team_id}")
+    print(f"   Team Name: {data.get('team_name')}")
+    print(f"   Message: {data.get('message')}")
+    print(f"   Instructions: {data.get('instructions')}")
+
+    await asyncio.sleep(pace)
+
+    # ========== Steps 2-3: Both Friends Look Around ==========
+    for number, character, place in (("2", "Eleven", "Hawkins Lab"), ("3", "Mike", "Upside Down")):
+        print_step(number, f"GET /{team_id}/{character.lower()} - {character} looks around {place}")
+        data = await attempt(client.look(team_id, character))
+        if data is None:
             return False
-    except Exception as e:
-        print_result(False, f"Exception: {str(e)}")
-        return False
-    
-    time.sleep(0.5)
-    
-    # ========== Step 6: Scan for Frequency ==========
-    print_step("6", f"PATCH /{team_id}/fix - Eleven scans for gate frequency")
-    try:
-        response = requests.patch(
-            f"{BASE_URL}/{team_id}/fix",
-            json={"friend": "Eleven", "action": "scan_frequency"}
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            success = data.get("success", False)
-            if success:
-                print_result(True, data.get("message", "Frequency scanned"))
-                print(f"   Code Revealed: {data.get('code_revealed')}")
-                print(f"   Instructions: {data.get('instructions')}")
-            else:
-                print_result(False, data.get("message", "Failed to scan frequency"))
-                return False
-        else:
-            print_result(False, f"Failed: {response.status_code}")
-            print(f"   Error: {response.text}")
+        print_result(True, f"{character} looked around successfully")
+        print(f"   Location: {data.get('location')}")
+        print(f"   Gate Status: {data.get('gate_status')}")
+        print(f"   Items: {', '.join(data.get('items', []))}")
+        print(f"   Note: {(data.get('notes') or [''])[0]}")
+
+        await asyncio.sleep(pace)
+
+    # ========== Steps 4-7: The Puzzle ==========
+    actions = (
+        ("4", f"POST /{team_id}/send_item - Mike sends demogorgon tooth to Eleven",
+         lambda: client.send_item(team_id, "Mike", "demogorgon tooth"), "Item sent",
+         ("eleven_items", "mike_items", "next_action")),
+        ("5", f"PUT /{team_id}/use_item - Eleven combines radio and tooth",
+         lambda: client.use_item(team_id, "Eleven", "combine_radio_tooth"), "Items combined",
+         ("sound_effect", "next_action")),
+        ("6", f"PATCH /{team_id}/fix - Eleven scans for gate frequency",
+         lambda: client.fix(team_id, "Eleven", "scan_frequency"), "Frequency scanned",
+         ("code_revealed", "instructions")),
+        ("7", f"DELETE /{team_id}/remove - Mike activates gate control panel",
+         lambda: client.remove(team_id, "Mike", "0110"), "Gate panel activated",
+         ("instructions",)),
+    )
+    for number, description, call, done, fields in actions:
+        print_step(number, description)
+        data = await attempt(call())
+        if data is None:
             return False
-    except Exception as e:
-        print_result(False, f"Exception: {str(e)}")
-        return False
-    
-    time.sleep(0.5)
-    
-    # ========== Step 7: Activate Gate Panel ==========
-    print_step("7", f"DELETE /{team_id}/remove - Mike activates gate control panel")
-    try:
-        response = requests.delete(
-            f"{BASE_URL}/{team_id}/remove",
-            json={"friend": "Mike", "code": "0110"}
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            success = data.get("success", False)
-            if success:
-                print_result(True, data.get("message", "Gate panel activated"))
-                print(f"   Instructions: {data.get('instructions')}")
-            else:
-                print_result(False, data.get("message", "Failed to activate gate panel"))
-                return False
-        else:
-            print_result(False, f"Failed: {response.status_code}")
-            print(f"   Error: {response.text}")
+        if not data.get("success", False):
+            print_result(False, data.get("message", f"Failed: {done.lower()}"))
             return False
-    except Exception as e:
-        print_result(False, f"Exception: {str(e)}")
-        return False
-    
-    time.sleep(0.5)
-    
+        print_result(True, data.get("message", done))
+        for field in fields:
+            print(f"   {field.replace('_', ' ').title()}: {data.get(field)}")
+
+        await asyncio.sleep(pace)
+
     # ========== Step 8: Check Dimension Sync ==========
     print_step("8", f"HEAD /{team_id}/status - Check dimension sync status")
-    try:
-        response = requests.head(f"{BASE_URL}/{team_id}/status")
-        
-        if response.status_code == 200:
-            headers = response.headers
-            print_result(True, "Status check successful")
-            print(f"   Team Status: {headers.get('X-Team-Status', 'N/A')}")
-            print(f"   Escaped: {headers.get('X-Escaped', 'N/A')}")
-            print(f"   Eleven Ready: {headers.get('X-Eleven-Ready', 'N/A')}")
-            print(f"   Mike Ready: {headers.get('X-Mike-Ready', 'N/A')}")
-            print(f"   Dimension Sync: {headers.get('X-Dimension-Sync', 'N/A')}")
-        else:
-            print_result(False, f"Failed: {response.status_code}")
-            return False
-    except Exception as e:
-        print_result(False, f"Exception: {str(e)}")
+    status = await attempt(client.status(team_id))
+    if status is None:
         return False
-    
-    time.sleep(0.5)
-    
+    print_result(True, "Status check successful")
+    print(f"   Team Status: {status['team_status']}")
+    print(f"   Escaped: {status['escaped']}")
+    print(f"   Eleven Ready: {status['eleven_ready']}")
+    print(f"   Mike Ready: {status['mike_ready']}")
+    print(f"   Dimension Sync: {status['dimension_sync']}")
+
+    await asyncio.sleep(pace)
+
     # ========== Step 9: Check Escape Options ==========
     print_step("9", f"OPTIONS /{team_id}/escape - See escape requirements")
-    try:
-        response = requests.options(f"{BASE_URL}/{team_id}/escape")
-        
-        if response.status_code == 200:
-            headers = response.headers
-            print_result(True, "Escape options retrieved")
-            print(f"   Allowed Methods: {headers.get('Allow', 'N/A')}")
-            print(f"   Requirements: {headers.get('X-Escape-Requires', 'N/A')}")
-            print(f"   Preconditions: {headers.get('X-Preconditions', 'N/A')}")
-            print(f"   Warning: {headers.get('X-Warning', 'N/A')}")
-        else:
-            print_result(False, f"Failed: {response.status_code}")
-            return False
-    except Exception as e:
-        print_result(False, f"Exception: {str(e)}")
+    options = await attempt(client.escape_options(team_id))
+    if options is None:
         return False
-    
-    time.sleep(0.5)
-    
+    print_result(True, "Escape options retrieved")
+    print(f"   Allowed Methods: {options['allow']}")
+    print(f"   Requirements: {options['requires']}")
+    print(f"   Preconditions: {options['preconditions']}")
+    print(f"   Warning: {options['warning']}")
+
+    await asyncio.sleep(pace)
+
     # ========== Step 10: Eleven Attempts Escape ==========
     print_step("10", f"POST /{team_id}/escape - Eleven attempts to escape")
-    try:
-        response = requests.post(
-            f"{BASE_URL}/{team_id}/escape",
-            json={"friend": "Eleven"}
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            success = data.get("success", False)
-            if success:
-                print_result(True, data.get("message", "Eleven escaped"))
-                print(f"   Escape Key: {data.get('escape_key')}")
-            else:
-                print_result(True, data.get("message", "Waiting for Mike"))
-                print(f"   Attempts: {data.get('escape_attempts', 'N/A')}")
-                print(f"   Time Window: {data.get('time_window', 'N/A')}")
-        else:
-            print_result(False, f"Failed: {response.status_code}")
-            print(f"   Error: {response.text}")
-            return False
-    except Exception as e:
-        print_result(False, f"Exception: {str(e)}")
+    data = await attempt(client.escape(team_id, "Eleven"))
+    if data is None:
         return False
-    
-    time.sleep(2)  # Wait less than 10 seconds for coordination
-    
+    if data.get("success", False):
+        print_result(True, data.get("message", "Eleven escaped"))
+        print(f"   Escape Key: {data.get('escape_key')}")
+    else:
+        print_result(True, data.get("message", "Waiting for Mike"))
+        print(f"   Attempts: {data.get('escape_attempts', 'N/A')}")
+        print(f"   Time Window: {data.get('time_window', 'N/A')}")
+
+    await asyncio.sleep(pace * 4)  # Wait less than 10 seconds for coordination
+
     # ========== Step 11: Mike Attempts Escape ==========
     print_step("11", f"POST /{team_id}/escape - Mike attempts to escape (within 10s!)")
-    try:
-        response = requests.post(
-            f"{BASE_URL}/{team_id}/escape",
-            json={"friend": "Mike"}
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            success = data.get("success", False)
-            if success:
-                print_result(True, "🎉 ESCAPE SUCCESSFUL! 🎉")
-                print(f"   Message: {data.get('message')}")
-                print(f"   Escape Key: {data.get('escape_key')}")
-                print(f"   Time Taken: {data.get('time_taken')}")
-                print(f"   Steps Used: {len(data.get('steps_used', []))} HTTP methods")
-            else:
-                print_result(False, data.get("message", "Escape failed"))
-                return False
-        else:
-            print_result(False, f"Failed: {response.status_code}")
-            print(f"   Error: {response.text}")
-            return False
-    except Exception as e:
-        print_result(False, f"Exception: {str(e)}")
+    data = await attempt(client.escape(team_id, "Mike"))
+    if data is None:
         return False
-    
-    time.sleep(0.5)
-    
+    if not data.get("success", False):
+        print_result(False, data.get("message", "Escape failed"))
+        return False
+    print_result(True, "🎉 ESCAPE SUCCESSFUL! 🎉")
+    print(f"   Message: {data.get('message')}")
+    print(f"   Escape Key: {data.get('escape_key')}")
+    print(f"   Time Taken: {data.get('time_taken')}")
+    print(f"   Steps Used: {len(data.get('steps_used', []))} HTTP methods")
+
+    await asyncio.sleep(pace)
+
     # ========== Step 12: Get Escape Key ==========
     print_step("12", f"GET /{team_id}/key - Get escape key")
-    try:
-        response = requests.get(f"{BASE_URL}/{team_id}/key")
-        
-        if response.status_code == 200:
-            data = response.json()
-            print_result(True, "Escape key retrieved")
-            print(f"   Team Name: {data.get('team_name')}")
-            print(f"   Escape Key: {data.get('escape_key')}")
-            print(f"   Time Taken: {data.get('time_taken')}")
-            print(f"   Steps Completed: {data.get('steps_completed')}")
-            print(f"   Story Ending: {data.get('story_ending', 'N/A')}")
-        else:
-            print_result(False, f"Failed: {response.status_code}")
-            print(f"   Error: {response.text}")
-            return False
-    except Exception as e:
-        print_result(False, f"Exception: {str(e)}")
+    data = await attempt(client.key(team_id))
+    if data is None:
         return False
-    
-    time.sleep(0.5)
-    
+    print_result(True, "Escape key retrieved")
+    print(f"   Team Name: {data.get('team_name')}")
+    print(f"   Escape Key: {data.get('escape_key')}")
+    print(f"   Time Taken: {data.get('time_taken')}")
+    print(f"   Steps Completed: {data.get('steps_completed')}")
+    print(f"   Story Ending: {data.get('story_ending', 'N/A')}")
+
+    await asyncio.sleep(pace)
+
+    # ========== Bonus: Verify Escape Key ==========
+    print_step("Bonus", "GET /verify_key/{escape_key} - Anyone can check the key")
+    check = await attempt(client.verify_key(data['escape_key']))
+    if check is not None:
+        print_result(check.get('valid', False), "Escape key verified" if check.get('valid') else check.get('message'))
+        print(f"   Earned By: {check.get('team_name')} ({check.get('team_id')})")
+        print(f"   Time Taken: {check.get('time_taken')}, Hints Used: {check.get('hints_used')}")
+
+    await asyncio.sleep(pace)
+
     # ========== Bonus: Test Hint System ==========
     print_step("Bonus", f"GET /{team_id}/hint - Get help when stuck")
-    try:
-        # Test hint for Eleven
-        print("\n   Testing hint for Eleven...")
-        response = requests.get(f"{BASE_URL}/{team_id}/hint?friend=Eleven")
-        
-        if response.status_code == 200:
-            data = response.json()
+    for friend, label in (("Eleven", "hint for Eleven"), ("Mike", "hint for Mike"), (None, "general hint")):
+        print(f"\n   Testing {label}...")
+        data = await attempt(client.hint(team_id, friend))
+        if data is not None:
             if "hint" in data:
                 print_result(True, "Hint retrieved successfully")
                 print(f"   Hint: {data.get('hint', 'N/A')[:100]}...")
@@ -370,75 +214,20 @@ def test_all_endpoints():
             else:
                 print_result(True, "Hint endpoint responded")
                 print(f"   Response: {data}")
-        else:
-            print_result(False, f"Failed: {response.status_code}")
-            print(f"   Error: {response.text}")
-    except Exception as e:
-        print_result(False, f"Exception: {str(e)}")
-    
-    time.sleep(1)
-    
-    # Test hint for Mike (might be on cooldown)
-    try:
-        print("\n   Testing hint for Mike...")
-        response = requests.get(f"{BASE_URL}/{team_id}/hint?friend=Mike")
-        
-        if response.status_code == 200:
-            data = response.json()
-            if "hint" in data:
-                print_result(True, "Hint retrieved successfully")
-                print(f"   Hint: {data.get('hint', 'N/A')[:100]}...")
-            elif "warning" in data:
-                print_result(True, "Hint system working (cooldown active)")
-                print(f"   Warning: {data.get('warning')}")
-            else:
-                print_result(True, "Hint endpoint responded")
-        else:
-            print_result(False, f"Failed: {response.status_code}")
-    except Exception as e:
-        print_result(False, f"Exception: {str(e)}")
-    
-    time.sleep(1)
-    
-    # Test hint without friend parameter
-    try:
-        print("\n   Testing general hint...")
-        response = requests.get(f"{BASE_URL}/{team_id}/hint")
-        
-        if response.status_code == 200:
-            data = response.json()
-            if "hint" in data:
-                print_result(True, "General hint retrieved")
-                print(f"   Hint: {data.get('hint', 'N/A')[:100]}...")
-            elif "warning" in data:
-                print_result(True, "Hint system working (cooldown active)")
-                print(f"   Warning: {data.get('warning')}")
-            else:
-                print_result(True, "Hint endpoint responded")
-        else:
-            print_result(False, f"Failed: {response.status_code}")
-    except Exception as e:
-        print_result(False, f"Exception: {str(e)}")
-    
+
+        await asyncio.sleep(pace * 2)
+
     # ========== Bonus: Test Team Status ==========
     print_step("Bonus", f"GET /team_status/{team_id} - Check team status")
-    try:
-        response = requests.get(f"{BASE_URL}/team_status/{team_id}")
-        
-        if response.status_code == 200:
-            data = response.json()
-            print_result(True, "Team status retrieved")
-            print(f"   Team Name: {data.get('team_name')}")
-            print(f"   Escaped: {data.get('escaped')}")
-            print(f"   Time Elapsed: {data.get('time_elapsed')}")
-            print(f"   Steps Completed: {len(data.get('steps_completed', []))}")
-            print(f"   Escape Attempts: {data.get('escape_attempts', 0)}")
-        else:
-            print_result(False, f"Failed: {response.status_code}")
-            print(f"   Error: {response.text}")
-    except Exception as e:
-        print_result(False, f"Exception: {str(e)}")
-    
+    data = await attempt(client.team_status(team_id))
+    if data is not None:
+        print_result(True, "Team status retrieved")
+        print(f"   Team Name: {data.get('team_name')}")
+        print(f"   Escaped: {data.get('escaped')}")
+        print(f"   Time Elapsed: {data.get('time_elapsed')}")
+        print(f"   Steps Completed: {len(data.get('steps_completed', []))}")
+        print(f"   Escape Attempts: {data.get('escape_attempts', 0)}")
+
     # ========== Summary ==========
     print_section("TEST SUMMARY")
     print("✅ All 12 main endpoints tested successfully!")
@@ -461,30 +250,93 @@ def test_all_endpoints():
     print("   ✓ Gate activation")
     print("   ✓ Synchronized escape")
     print("   ✓ Key retrieval")
-    
+
     return True
 
-def main():
-    """Main function"""
-    try:
+# --- Load test ---
+def play_game(api, team_id):
+    """Every call of a winning game after team creation, in order, made as it is iterated"""
+    yield api.look(team_id, "eleven")
+    yield api.look(team_id, "mike")
+    yield api.send_item(team_id, "Mike", "demogorgon tooth")
+    yield api.use_item(team_id, "Eleven", "combine_radio_tooth")
+    yield api.fix(team_id, "Eleven", "scan_frequency")
+    yield api.remove(team_id, "Mike", "0110")
+    yield api.status(team_id)
+    yield api.escape_options(team_id)
+    yield api.escape(team_id, "Eleven")
+    yield api.escape(team_id, "Mike")
+    yield api.key(team_id)
+
+async def play(client, name, pipeline, latencies):
+    """One simulated team playing a whole game; True if it escaped"""
+    started = time.perf_counter()
+    team = await client.create_team(name)
+    latencies.append(time.perf_counter() - started)
+    if pipeline:
+        batch = client.batch()
+        list(play_game(batch, team["team_id"]))
+        started = time.perf_counter()
+        results = await batch.run()
+        latencies.append(time.perf_counter() - started)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+    else:
+        results = []
+        for call in play_game(client, team["team_id"]):
+            started = time.perf_counter()
+            results.append(await call)
+            latencies.append(time.perf_counter() - started)
+    return results[-1]["escaped"]
+
+async def load_test(client, players, pipeline):
+    """Play ``players`` games at once and report throughput and latency"""
+    mode = "pipelined" if pipeline else "sequential"
+    print_section(f"LOAD TEST: {players} players, {mode}, {client.pool.size} connections")
+    run = int(time.time())
+    latencies = []
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(
+        *(play(client, f"Load-{run}-{i}", pipeline, latencies) for i in range(players)),
+        return_exceptions=True)
+    elapsed = time.perf_counter() - started
+
+    escaped = sum(outcome is True for outcome in outcomes)
+    errors = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+    latencies.sort()
+    print(f"   Games escaped: {escaped}/{players} in {elapsed:.2f}s ({escaped / elapsed:.0f} games/s)")
+    print(f"   Requests: {client.requests} ({client.requests / elapsed:.0f}/s), retried: {client.retried}")
+    if latencies:
+        unit = "batch" if pipeline else "request"
+        print(f"   Latency per {unit}: p50 {latencies[len(latencies) // 2] * 1000:.1f}ms, "
+              f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f}ms")
+    if errors:
+        print(f"   Errors: {len(errors)}, first: {errors[0]!r}")
+    return not errors and escaped == players
+
+async def run(args):
+    async with GameClient(args.url, connections=args.connections) as client:
         # First, check if server is running
         print("🔍 Checking server connection...")
         try:
-            response = requests.get(f"{BASE_URL}/")
-            if response.status_code == 200:
-                print("✅ Server is running!")
-            else:
-                print(f"❌ Server responded with status: {response.status_code}")
-                sys.exit(1)
-        except requests.exceptions.ConnectionError:
+            await client.root()
+            print("✅ Server is running!")
+        except ApiError as e:
+            print(f"❌ Server responded with status: {e.status}")
+            return False
+        except BackendError:
             print("❌ Cannot connect to server!")
             print("   Make sure the FastAPI server is running with:")
             print("   uvicorn main:app --reload --port 8000")
-            sys.exit(1)
-        
+            return False
+
+        if args.players:
+            return await load_test(client, args.players, args.pipeline)
+
         # Run the tests
-        success = test_all_endpoints()
-        
+        success = await test_all_endpoints(client, args.pace)
+
         if success:
             print_section("🎉 ALL TESTS PASSED! 🎉")
             print("The Stranger Things API is fully functional!")
@@ -496,14 +348,32 @@ def main():
         else:
             print_section("❌ SOME TESTS FAILED")
             print("Check the error messages above for details.")
-            sys.exit(1)
-            
+        return success
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Walk through every endpoint, or load test with simulated players")
+    parser.add_argument("--url", default=DEFAULT_URL, help="Server to test (default: $BASE_URL or %(default)s)")
+    parser.add_argument("--pace", type=float, default=DEFAULT_PACE,
+                        help="Seconds between walkthrough steps (default: %(default)s)")
+    parser.add_argument("--players", type=int, default=0,
+                        help="Load test: play this many games at once instead of the walkthrough")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Load test: send each game's calls pipelined in one batch")
+    parser.add_argument("--connections", type=int, default=DEFAULT_CONNECTIONS,
+                        help="Keep-alive connections shared by all players (default: %(default)s)")
+    args = parser.parse_args()
+
+    try:
+        success = asyncio.run(run(args))
     except KeyboardInterrupt:
         print("\n\n⚠️ Test interrupted by user")
         sys.exit(0)
     except Exception as e:
         print(f"\n\n❌ Unexpected error: {str(e)}")
         sys.exit(1)
+    if not success:
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,16 +1,85 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Header, Response, WebSocket
+from pydantic import BaseModel, ValidationError
 from typing import List, Dict, Optional
+import asyncio
+import json
 import time
-import uuid
 from datetime import datetime
 from fastapi.middleware.cors import CORSMiddleware
 import os
 
+import puzzle
+from escape import NO_ATTEMPTS, EscapeRendezvous, TimerWheel
+from escape_keys import EscapeKeySigner, secret_from_env
+from team_ids import TeamTable
+from funnel import Funnel
+import export
+from fastpath import FastPathRouter, header_value, json_body, json_response
+from capture import CaptureMiddleware, CaptureWriter
+from clock import SystemClock
+from rooms import DEFAULT_ROOM, Room
+import memory
+import search
+from idempotency import DEFAULT_MAX_ENTRIES, DEFAULT_TTL, IdempotencyMiddleware, IdempotencyStore
+import handoff
+from scheduler import MAX_SAMPLES, ActiveRequests, LoopMonitor, Scheduler
+from admission import AdmissionController, AdmissionMiddleware
+from admin_cache import DEFAULT_MAX_AGE, Snapshot, SnapshotCache
+from channels import DEFAULT_OUTBOX_SIZE, POLICY_VIOLATION, ChannelHub
+import tracing
+from tracing import DEFAULT_RING_SIZE, DEFAULT_SAMPLE_RATE, DEFAULT_SLOW_MS, Tracer, TracingMiddleware
+
 app = FastAPI(title="Stranger Things: Escape the Upside Down", 
               description="Multi-dimensional coordination puzzle")
 
-# ADD THESE LINES ↓↓↓
+# TRACE_PHASES=1 splits traced requests into validation, handler and
+# serialization; it has to be set before any route is added (see tracing.py)
+TRACE_PHASES = bool(int(os.environ.get("TRACE_PHASES", 0)))
+if TRACE_PHASES:
+    app.router.route_class = tracing.TracedRoute
+
+
+# All game timing reads this clock; simulations replace it with a VirtualClock
+clock = SystemClock()
+
+# --- In-Memory Storage ---
+# Team IDs are allocated by the table itself (see team_ids.py)
+teams: TeamTable = TeamTable()
+# Only teams that have asked for a hint have an entry
+hint_requests: Dict[str, List[dict]] = {}
+# Every team belongs to one event room, which indexes its own teams (see rooms.py)
+rooms: Dict[str, Room] = {}
+# Open WebSockets per team (see channels.py)
+channels = ChannelHub(int(os.environ.get("CHANNEL_OUTBOX_SIZE", DEFAULT_OUTBOX_SIZE)))
+
+def get_room(name: str) -> Room:
+    """The room with this name, created on first use"""
+    if name not in rooms:
+        rooms[name] = Room(name)
+    return rooms[name]
+
+def team_id_in_path(path: str) -> Optional[str]:
+    """The team_id a request path refers to, if any"""
+    parts = path.strip("/").split("/")
+    if len(parts) >= 2 and parts[0] == "team_status":
+        candidate = parts[1]
+    elif len(parts) >= 3 and parts[:2] == ["admin", "reset_team"]:
+        candidate = parts[2]
+    elif len(parts) >= 2 and parts[0] not in ("admin", "verify_key"):
+        candidate = parts[0]
+    else:
+        return None
+    team = teams.get(candidate)
+    return team['team_id'] if team is not None else candidate
+
+# Retried game actions carrying an Idempotency-Key get the first response back
+idempotency_store = IdempotencyStore(lambda: clock.now(),
+                                     max_entries=int(os.environ.get("IDEMPOTENCY_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+                                     ttl=float(os.environ.get("IDEMPOTENCY_TTL", DEFAULT_TTL)))
+app.add_middleware(IdempotencyMiddleware, store=idempotency_store, team_id_of=team_id_in_path)
+
+# CORS goes outside the idempotency middleware: stored responses carry no
+# Access-Control-* headers, and a replay gets them for the retrying origin
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Allows all origins
@@ -19,21 +88,168 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Traffic capture (replay it with replay.py): CAPTURE_FILE=requests.jsonl
+CAPTURE_FILE = os.environ.get("CAPTURE_FILE")
+capture_writer = CaptureWriter(CAPTURE_FILE) if CAPTURE_FILE else None
+if capture_writer:
+    app.add_middleware(CaptureMiddleware, writer=capture_writer, team_id_of=team_id_in_path)
 
+    @app.on_event("startup")
+    async def start_capture():
+        capture_writer.start()
 
-# --- In-Memory Storage ---
-teams: Dict[str, dict] = {}
-hint_requests: Dict[str, List[dict]] = {}
+    @app.on_event("shutdown")
+    async def stop_capture():
+        await capture_writer.stop()
 
-# Stranger Things themed items
-DEFAULT_ITEMS = {
-    "Eleven": ["radio", "note: 'need demogorgon frequency'"],
-    "Mike": ["demogorgon tooth", "broken walkie-talkie"]
-}
+
+# Puzzle scenarios (characters, items, actions, hints) are compiled from
+# scenarios/*.json by the puzzle module at import time
+# Initial team state per scenario. A new team is a shallow copy: its
+# characters, steps and escape attempts stay the shared, read-only values
+# below until the team first changes them (characters through
+# puzzle.own_character, steps and attempts by replacing the value)
+TEAM_TEMPLATES: Dict[str, dict] = {}
+
+def team_template(scenario: str) -> dict:
+    if scenario not in TEAM_TEMPLATES:
+        definition = puzzle.SCENARIOS[scenario]
+        TEAM_TEMPLATES[scenario] = {
+            'team_id': None,
+            'team_name': None,
+            'scenario': scenario,
+            'room': DEFAULT_ROOM,
+            'escaped': False,
+            'escape_key': None,
+            'start_time': None,
+            'end_time': None,
+            'eleven': definition.templates['eleven'],
+            'mike': definition.templates['mike'],
+            'steps_completed': (),
+            'escape': NO_ATTEMPTS,
+            'last_hint_time': None,
+            'version': 0,
+            # Filled in by the room's funnel and leaderboard; present up front so the dict never grows
+            'stage': 0,
+            'stage_since': None,
+            'stage_reached': None,
+            'leaderboard_entry': None
+        }
+    return TEAM_TEMPLATES[scenario]
+
+def new_team_state(team_id: str, team_name: str, scenario: str, room: str = DEFAULT_ROOM) -> dict:
+    """Build the initial state for a team playing the given scenario"""
+    team = team_template(scenario).copy()
+    team['team_id'] = team_id
+    team['team_name'] = team_name
+    team['room'] = room
+    team['start_time'] = clock.now()
+    return team
+
+def expire_escape_attempts(team_id: str, now: float) -> Optional[float]:
+    """Timer wheel callback: drop a team's stale escape attempts"""
+    team = teams.get(team_id)
+    if team is None:
+        return None
+    return team['escape'].expire(now, puzzle.SCENARIOS[team['scenario']].escape_window)
+
+# Shared by all teams; holds at most one timer per team
+escape_timers = TimerWheel(expire_escape_attempts)
+
+def advance_stage(team: dict, stage: int) -> None:
+    """Move the team forward in its room's funnel for its scenario"""
+    rooms[team['room']].funnel(team['scenario']).advance(team, stage, clock.now())
+
+def reset_team_state(team: dict) -> dict:
+    """Put a team back at the start of its scenario, keeping its ID, name and room"""
+    room = rooms[team['room']]
+    room.forget_escape(team)
+    funnel = room.funnel(team['scenario'])
+    funnel.leave(team)
+    fresh = new_team_state(team['team_id'], team['team_name'], team['scenario'], team['room'])
+    # Versions only ever grow, so ETags from before the reset stop matching
+    fresh['version'] = team['version'] + 1
+    # The funnel counts each team once per stage, however often it resets
+    fresh['stage_reached'] = team['stage_reached']
+    teams[team['team_id']] = fresh
+    funnel.enter(fresh, fresh['start_time'])
+    hint_requests.pop(team['team_id'], None)
+    publish_update(fresh, "reset", None)
+    return fresh
+
+def delete_team_state(team: dict) -> None:
+    """Remove a team for good; its ID is never handed out again"""
+    room = rooms[team['room']]
+    room.funnel(team['scenario']).leave(team)
+    room.remove(team)
+    escape_timers.cancel(team['team_id'])
+    hint_requests.pop(team['team_id'], None)
+    del teams[team['team_id']]
+    channels.close_team(team['team_id'])
+
+def publish_update(team: dict, action: str, friend: Optional[str]) -> None:
+    """Tell the team's open sockets what changed; free when nobody is listening"""
+    if team['team_id'] in channels.teams:
+        channels.publish(team['team_id'], {"type": "update", "action": action, "friend": friend,
+                                           "team": team_status_body(team)})
+
+def record_step(team: dict, step: str) -> None:
+    """Record that the team used an endpoint"""
+    if step not in team['steps_completed']:
+        team['steps_completed'] += (step,)
+        team['version'] += 1
+        stage = puzzle.SCENARIOS[team['scenario']].stage_after_steps(team['steps_completed'])
+        if stage is not None:
+            advance_stage(team, stage)
+
+# --- Conditional GET ---
+# Every mutation bumps team['version'] (the puzzle engine bumps it for action
+# effects). Read endpoints send it as a weak ETag: time_elapsed keeps ticking
+# while the version stands still, and the two bodies are equivalent otherwise.
+# The epoch keeps tags from an earlier server process from matching.
+ETAG_EPOCH = format(int(time.time() * 1000), "x")
+
+def team_etag(team: dict) -> str:
+    return f'W/"{ETAG_EPOCH}-{team["version"]}"'
+
+def etag_matches(team: dict, if_none_match: Optional[str]) -> bool:
+    """Does an If-None-Match header name the team's current version?"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    current = team_etag(team)[2:]
+    # Weak comparison: the W/ prefix is ignored on both sides
+    return any(tag.strip().removeprefix("W/") == current for tag in if_none_match.split(","))
+
+# --- Escape keys ---
+# Keys are signed (see escape_keys.py), so GET /verify_key checks them without
+# the team: on any backend, after a restart, after the team is gone. Without
+# ESCAPE_KEY_SECRET the secret is this process's own, handed over on reload.
+ESCAPE_KEY_SECRET, ESCAPE_KEY_SECRET_CONFIGURED = secret_from_env()
+escape_keys = EscapeKeySigner(ESCAPE_KEY_SECRET)
+
+def verify_key_body(escape_key: str) -> dict:
+    """What a key proves, shared by the verify route and the fast path"""
+    claims = escape_keys.verify(escape_key)
+    if claims is None:
+        return {"valid": False, "message": "This is not an escape key from this game"}
+    return {
+        "valid": True,
+        "team_id": claims.team_id,
+        "team_name": claims.team_name,
+        "time_taken": f"{claims.seconds} seconds",
+        "hints_used": claims.hints_used
+    }
+
+def not_modified(team: dict) -> Response:
+    return Response(status_code=304, headers={"ETag": team_etag(team)})
 
 # --- Data Models ---
 class TeamCreate(BaseModel):
     team_name: str
+    scenario: Optional[str] = None
+    room: Optional[str] = None
 
 class SendItem(BaseModel):
     from_friend: str
@@ -64,61 +280,38 @@ class HintRequest(BaseModel):
 async def create_new_team(team: TeamCreate):
     """Create a new team - Stranger Things Edition"""
     
-    # Normalize the incoming name (lowercase and remove spaces)
-    incoming_name_clean = team.team_name.lower().strip()
-
-    # --- CHANGE START: Check if team name already exists (Case Insensitive) ---
-    for existing_id, existing_data in teams.items():
-        # Compare the lowercase version of the stored name vs incoming name
-        if existing_data['team_name'].lower().strip() == incoming_name_clean:
-            return {
-                "team_id": existing_id,
-                "team_name": existing_data['team_name'], # Return original name
-                "message": f"Team '{team.team_name}' found (matches '{existing_data['team_name']}'). Returning existing ID.",
-                "instructions": f"Share this team_id with both friends: {existing_id}",
-                "story": "Welcome back. The gate is still waiting...",
-                "hint_system": "Use GET /{team_id}/hint when stuck. But use wisely!"
-            }
-    # --- CHANGE END ---
-
-    team_id = str(uuid.uuid4())[:8]
-    current_time = time.time()
-    
-    teams[team_id] = {
-        'team_id': team_id,
-        'team_name': team.team_name, # Store the name exactly as they typed it the first time
-        'escaped': False,
-        'escape_key': None,
-        'start_time': current_time,
-        'end_time': None,
-        'eleven': {
-            'location': 'Hawkins Lab (Real World)',
-            'items': DEFAULT_ITEMS["Eleven"].copy(),
-            'gate_locked': True,
-            'has_frequency': False,
-            'has_eggs': False,
-            'last_action': None,
-            'hints_used': 0
-        },
-        'mike': {
-            'location': 'Upside Down Hawkins Lab',
-            'items': DEFAULT_ITEMS["Mike"].copy(),
-            'gate_locked': True,
-            'has_frequency': False,
-            'has_eggs': False,
-            'last_action': None,
-            'hints_used': 0
-        },
-        'steps_completed': [],
-        'escape_attempts': [],
-        'last_hint_time': None
-    }
-    
-    hint_requests[team_id] = []
+    room_name = (team.room or "").strip() or DEFAULT_ROOM
+    room = rooms.get(room_name)
+
+    # Names are unique per room (case insensitive); the room's name index finds matches
+    existing_id = room.find_by_name(team.team_name) if room is not None else None
+    if existing_id is not None:
+        existing_data = teams[existing_id]
+        return {
+            "team_id": existing_id,
+            "team_name": existing_data['team_name'], # Return original name
+            "room": room_name,
+            "message": f"Team '{team.team_name}' found (matches '{existing_data['team_name']}'). Returning existing ID.",
+            "instructions": f"Share this team_id with both friends: {existing_id}",
+            "story": "Welcome back. The gate is still waiting...",
+            "hint_system": "Use GET /{team_id}/hint when stuck. But use wisely!"
+        }
+
+    scenario = team.scenario or puzzle.DEFAULT_SCENARIO
+    if scenario not in puzzle.SCENARIOS:
+        raise HTTPException(400, f"Unknown scenario '{scenario}'")
+
+    room = get_room(room_name)
+    team_id = teams.allocate()
+    # Store the name exactly as they typed it the first time
+    teams[team_id] = new_team_state(team_id, team.team_name, scenario, room_name)
+    room.add(teams[team_id])
+    room.funnel(scenario).enter(teams[team_id], teams[team_id]['start_time'])
     
     return {
         "team_id": team_id,
         "team_name": team.team_name,
+        "room": room_name,
         "message": f"Team '{team.team_name}' created!",
         "instructions": f"Share this team_id with both friends: {team_id}",
         "story": "You are Eleven (Real World) and Mike (Upside Down). Work together to escape!",
@@ -126,13 +319,21 @@ async def create_new_team(team: TeamCreate):
     }
 
 @app.get("/team_status/{team_id}")
-async def get_team_status(team_id: str):
+async def get_team_status(team_id: str, response: Response, if_none_match: Optional[str] = Header(None)):
     """Check team progress"""
     if team_id not in teams:
         raise HTTPException(status_code=404, detail="Team not found")
     
     team = teams[team_id]
-    elapsed = int(time.time() - team['start_time'])
+    if etag_matches(team, if_none_match):
+        return not_modified(team)
+    
+    response.headers["ETag"] = team_etag(team)
+    return team_status_body(team)
+
+def team_status_body(team: dict) -> dict:
+    """Team progress, shared by the status route and the fast path"""
+    elapsed = int(clock.now() - team['start_time'])
     
     return {
         "team_name": team['team_name'],
@@ -143,60 +344,65 @@ async def get_team_status(team_id: str):
         "eleven_has_frequency": team['eleven']['has_frequency'],
         "mike_has_eggs": team['mike']['has_eggs'],
         "steps_completed": team['steps_completed'],
-        "escape_attempts": len(team['escape_attempts']),
+        "escape_attempts": team['escape'].count,
         "hints_used": team['eleven']['hints_used'] + team['mike']['hints_used']
     }
 
+def look_around(team: dict, key: str, if_none_match: Optional[str] = None) -> Optional[dict]:
+    """Describe a character's surroundings; None if the client's copy is still current"""
+    look = puzzle.SCENARIOS[team['scenario']].looks[key]
+    
+    # Record step (before comparing versions: the first look is a mutation)
+    record_step(team, look['step'])
+    if etag_matches(team, if_none_match):
+        return None
+    
+    return {
+        "location": team[key]['location'],
+        "gate_status": "🔒 LOCKED" if team[key]['gate_locked'] else "🔓 UNLOCKED",
+        "items": team[key]['items'],
+        "notes": look['notes'],
+        "friend_location": look['friend_location'],
+        "atmosphere": look['atmosphere']
+    }
+
+def run_action(team: dict, verb: str, friend: str, arg: str) -> dict:
+    """Record the endpoint step and dispatch the action through the puzzle engine"""
+    record_step(team, puzzle.SCENARIOS[team['scenario']].steps[verb])
+    response, stage = puzzle.dispatch(team, verb, friend, arg, clock.now())
+    if stage is not None:
+        advance_stage(team, stage)
+    publish_update(team, verb, friend)
+    return response
+
 # GET - Look around
 @app.get("/{team_id}/eleven")
-async def eleven_look(team_id: str):
+async def eleven_look(team_id: str, response: Response, if_none_match: Optional[str] = Header(None)):
     """Eleven: Look around Hawkins Lab (Real World)"""
     if team_id not in teams:
         raise HTTPException(status_code=404, detail="Team not found")
     
     team = teams[team_id]
+    body = look_around(team, 'eleven', if_none_match)
+    if body is None:
+        return not_modified(team)
     
-    # Record step
-    if "GET_ELEVEN" not in team['steps_completed']:
-        team['steps_completed'].append("GET_ELEVEN")
-    
-    return {
-        "location": team['eleven']['location'],
-        "gate_status": "🔒 LOCKED" if team['eleven']['gate_locked'] else "🔓 UNLOCKED",
-        "items": team['eleven']['items'],
-        "notes": [
-            "Demogorgon tooth from Mike needed to tune radio",
-            "Radio needs to scan for gate frequency",
-            "The gate is flickering... we don't have much time"
-        ],
-        "friend_location": "Upside Down Hawkins Lab (Mike)",
-        "atmosphere": "Lights are flickering. You hear static from the radio."
-    }
+    response.headers["ETag"] = team_etag(team)
+    return body
 
 @app.get("/{team_id}/mike")
-async def mike_look(team_id: str):
+async def mike_look(team_id: str, response: Response, if_none_match: Optional[str] = Header(None)):
     """Mike: Look around Upside Down Hawkins Lab"""
     if team_id not in teams:
         raise HTTPException(status_code=404, detail="Team not found")
     
     team = teams[team_id]
+    body = look_around(team, 'mike', if_none_match)
+    if body is None:
+        return not_modified(team)
     
-    # Record step
-    if "GET_MIKE" not in team['steps_completed']:
-        team['steps_completed'].append("GET_MIKE")
-    
-    return {
-        "location": team['mike']['location'],
-        "gate_status": "🔒 LOCKED" if team['mike']['gate_locked'] else "🔓 UNLOCKED",
-        "items": team['mike']['items'],
-        "notes": [
-            "Eleven needs the demogorgon tooth to tune her radio",
-            "Gate control panel needs activation code",
-            "You hear Demogorgon screeches in the distance..."
-        ],
-        "friend_location": "Hawkins Lab - Real World (Eleven)",
-        "atmosphere": "Dark, spores floating. Everything is mirrored and decaying."
-    }
+    response.headers["ETag"] = team_etag(team)
+    return body
 
 # POST - Send items
 @app.post("/{team_id}/send_item")
@@ -205,39 +411,7 @@ async def send_item(team_id: str, data: SendItem):
     if team_id not in teams:
         raise HTTPException(status_code=404, detail="Team not found")
     
-    team = teams[team_id]
-    
-    # Record step
-    if "POST" not in team['steps_completed']:
-        team['steps_completed'].append("POST")
-    
-    # Mike sending demogorgon tooth to Eleven
-    if data.from_friend == "Mike" and data.item == "demogorgon tooth":
-        if "demogorgon tooth" in team['mike']['items']:
-            # Move tooth from Mike to Eleven
-            team['mike']['items'].remove("demogorgon tooth")
-            team['eleven']['items'].append("demogorgon tooth")
-            team['mike']['last_action'] = time.time()
-            
-            return {
-                "success": True,
-                "message": "Demogorgon tooth sent to Eleven!",
-                "eleven_items": team['eleven']['items'],
-                "mike_items": team['mike']['items'],
-                "next_action": "Eleven: Combine radio and tooth (PUT /use_item)",
-                "story_update": "The tooth vibrates with interdimensional energy"
-            }
-        else:
-            return {
-                "success": False,
-                "message": "Mike doesn't have the demogorgon tooth",
-                "mike_items": team['mike']['items']
-            }
-    
-    return {
-        "success": False,
-        "message": "Cannot send that item. Only Mike can send 'demogorgon tooth'"
-    }
+    return run_action(teams[team_id], "send_item", data.from_friend, data.item)
 
 # PUT - Use/Combine items
 @app.put("/{team_id}/use_item")
@@ -246,39 +420,7 @@ async def use_item(team_id: str, data: UseItem):
     if team_id not in teams:
         raise HTTPException(status_code=404, detail="Team not found")
     
-    team = teams[team_id]
-    
-    # Record step
-    if "PUT" not in team['steps_completed']:
-        team['steps_completed'].append("PUT")
-    
-    # Eleven combining radio and demogorgon tooth
-    if data.friend == "Eleven" and data.action == "combine_radio_tooth":
-        # Check if Eleven has both items
-        has_radio = any("radio" in item for item in team['eleven']['items'])
-        has_tooth = "demogorgon tooth" in team['eleven']['items']
-        
-        if has_radio and has_tooth:
-            # Remove old items
-            team['eleven']['items'] = [item for item in team['eleven']['items'] 
-                                      if not item.startswith('radio') and item != "demogorgon tooth"]
-            
-            # Add tuned radio
-            team['eleven']['items'].append("tuned radio")
-            team['eleven']['last_action'] = time.time()
-            
-            return {
-                "success": True,
-                "message": "Tuned radio created! The radio now picks up interdimensional signals",
-                "next_action": "Scan for gate frequency: PATCH /fix with action='scan_frequency'",
-                "sound_effect": "📻 Radio static turns into clear frequency patterns"
-            }
-    
-    return {
-        "success": False,
-        "message": "Cannot combine. Eleven needs both 'radio' and 'demogorgon tooth'",
-        "eleven_items": team['eleven']['items']
-    }
+    return run_action(teams[team_id], "use_item", data.friend, data.action)
 
 # PATCH - Fix/Adjust
 @app.patch("/{team_id}/fix")
@@ -287,32 +429,7 @@ async def fix_something(team_id: str, data: FixAction):
     if team_id not in teams:
         raise HTTPException(status_code=404, detail="Team not found")
     
-    team = teams[team_id]
-    
-    # Record step
-    if "PATCH" not in team['steps_completed']:
-        team['steps_completed'].append("PATCH")
-    
-    # Eleven scanning for gate frequency
-    if data.friend == "Eleven" and data.action == "scan_frequency":
-        if "tuned radio" in team['eleven']['items']:
-            team['eleven']['has_frequency'] = True
-            team['eleven']['items'].append("frequency reading")
-            team['eleven']['last_action'] = time.time()
-            
-            return {
-                "success": True,
-                "message": "Frequency found! The radio reveals the gate code",
-                "code_revealed": "0110",
-                "instructions": "Tell Mike to use code '0110' on the gate control panel (DELETE /remove)",
-                "story": "The radio crackles: '0110... 0110... Will's birthday...'"
-            }
-    
-    return {
-        "success": False,
-        "message": "Cannot scan frequency. Eleven needs 'tuned radio' first",
-        "eleven_items": team['eleven']['items']
-    }
+    return run_action(teams[team_id], "fix", data.friend, data.action)
 
 # DELETE - Remove obstacle
 @app.delete("/{team_id}/remove")
@@ -321,32 +438,7 @@ async def remove_obstacle(team_id: str, data: RemoveAction):
     if team_id not in teams:
         raise HTTPException(status_code=404, detail="Team not found")
     
-    team = teams[team_id]
-    
-    # Record step
-    if "DELETE" not in team['steps_completed']:
-        team['steps_completed'].append("DELETE")
-    
-    # Mike activating gate control panel
-    if data.friend == "Mike" and data.code == "0110":
-        if "broken walkie-talkie" in team['mike']['items']:
-            team['mike']['items'].remove("broken walkie-talkie")
-            team['mike']['items'].append("activated gate panel")
-            team['mike']['has_eggs'] = True
-            team['mike']['last_action'] = time.time()
-            
-            return {
-                "success": True,
-                "message": "Gate control panel activated! The gate starts to stabilize",
-                "instructions": "Both friends ready for escape! Coordinate final POST /escape within 10 seconds",
-                "story": "The gate flickers and stabilizes. A clear portal forms. You have 10 seconds!"
-            }
-    
-    return {
-        "success": False,
-        "message": "Cannot activate panel. Mike needs 'broken walkie-talkie' and correct code '0110'",
-        "mike_items": team['mike']['items']
-    }
+    return run_action(teams[team_id], "remove", data.friend, data.code)
 
 # HEAD - Quick status check
 @app.head("/{team_id}/status")
@@ -358,14 +450,17 @@ async def quick_status(team_id: str):
     team = teams[team_id]
     
     # Record step
-    if "HEAD" not in team['steps_completed']:
-        team['steps_completed'].append("HEAD")
+    record_step(team, "HEAD")
     
     from fastapi.responses import Response
     
-    elapsed = int(time.time() - team['start_time'])
+    return Response(headers=quick_status_headers(team))
+
+def quick_status_headers(team: dict) -> dict:
+    """Headers for HEAD /{team_id}/status, shared with the fast path"""
+    elapsed = int(clock.now() - team['start_time'])
     
-    headers = {
+    return {
         "X-Team-Status": "ACTIVE",
         "X-Escaped": "YES" if team['escaped'] else "NO",
         "X-Eleven-Ready": "YES" if team['eleven']['has_frequency'] else "NO",
@@ -373,7 +468,6 @@ async def quick_status(team_id: str):
         "X-Time-Elapsed": str(elapsed),
         "X-Dimension-Sync": "STABLE" if team['eleven']['has_frequency'] and team['mike']['has_eggs'] else "UNSTABLE"
     }
-    return Response(headers=headers)
 
 # OPTIONS - See available methods
 @app.options("/{team_id}/escape")
@@ -383,15 +477,15 @@ async def escape_options(team_id: str):
         raise HTTPException(status_code=404, detail="Team not found")
     
     team = teams[team_id]
+    window = puzzle.SCENARIOS[team['scenario']].escape_window
     
     # Record step
-    if "OPTIONS" not in team['steps_completed']:
-        team['steps_completed'].append("OPTIONS")
+    record_step(team, "OPTIONS")
     
     from fastapi.responses import Response
     headers = {
         "Allow": "POST",
-        "X-Escape-Requires": "Both friends POST within 10 seconds",
+        "X-Escape-Requires": f"Both friends POST within {window:g} seconds",
         "X-Preconditions": "Eleven needs frequency, Mike needs activated gate",
         "X-Warning": "Gate unstable - must synchronize perfectly"
     }
@@ -405,7 +499,7 @@ async def get_hint(team_id: str, friend: Optional[str] = None):
         raise HTTPException(status_code=404, detail="Team not found")
     
     team = teams[team_id]
-    current_time = time.time()
+    current_time = clock.now()
     
     # Prevent hint spamming (1 hint per 30 seconds)
     if team.get('last_hint_time') and (current_time - team['last_hint_time']) < 30:
@@ -415,22 +509,24 @@ async def get_hint(team_id: str, friend: Optional[str] = None):
         }
     
     team['last_hint_time'] = current_time
+    team['version'] += 1
     
     # Track hint usage
     if friend == "Eleven":
-        team['eleven']['hints_used'] += 1
+        puzzle.own_character(team, 'eleven')['hints_used'] += 1
     elif friend == "Mike":
-        team['mike']['hints_used'] += 1
+        puzzle.own_character(team, 'mike')['hints_used'] += 1
     
     # Analyze team progress and provide context-aware hint
     hint = generate_contextual_hint(team, friend)
     
     # Record hint request
-    hint_requests[team_id].append({
+    hint_requests.setdefault(team['team_id'], []).append({
         "time": current_time,
         "friend": friend,
         "hint_given": hint
     })
+    publish_update(team, "hint", friend)
     
     return {
         "hint": hint,
@@ -447,124 +543,92 @@ def generate_contextual_hint(team: dict, friend: Optional[str]) -> str:
         return "You've already escaped! Get your escape key at GET /{team_id}/key"
     
     # Analyze based on completed steps
-    steps = team['steps_completed']
-    
-    # Check basic progress
-    if "GET_ELEVEN" not in steps or "GET_MIKE" not in steps:
-        return "🔍 Start by having both Eleven and Mike look around their locations using GET endpoints"
-    
-    # Check if tooth was sent
-    if "POST" not in steps:
-        if friend == "Mike":
-            return "📦 Mike should send the demogorgon tooth to Eleven using POST /send_item"
-        elif friend == "Eleven":
-            return "📻 Eleven needs the demogorgon tooth from Mike. Ask Mike to send it!"
-        else:
-            return "Mike needs to send his demogorgon tooth to Eleven using POST /send_item"
-    
-    # Check if radio was tuned
-    if "PUT" not in steps:
-        if friend == "Eleven":
-            return "🔧 Eleven should combine the radio and demogorgon tooth using PUT /use_item with action='combine_radio_tooth'"
-        else:
-            return "Eleven needs to combine the radio and tooth. Tell her to use PUT /use_item"
-    
-    # Check if frequency was found
-    if "PATCH" not in steps:
-        if friend == "Eleven":
-            return "📡 Eleven should scan for the gate frequency using PATCH /fix with action='scan_frequency'"
-        else:
-            return "Eleven needs to scan for the gate frequency with her tuned radio"
-    
-    # Check if gate panel was activated
-    if "DELETE" not in steps:
-        if friend == "Mike":
-            return "🔢 Mike needs to use the code '0110' on the gate control panel using DELETE /remove"
-        else:
-            return "Mike needs the code '0110' to activate the gate panel. It was revealed by Eleven's radio!"
-    
-    # Check if ready for escape
-    if "HEAD" not in steps:
-        return "📊 Check dimension synchronization with HEAD /{team_id}/status"
-    
-    if "OPTIONS" not in steps:
-        return "ℹ️ Check escape requirements with OPTIONS /{team_id}/escape"
+    steps_hint = puzzle.SCENARIOS[team['scenario']].step_hint(team['steps_completed'], friend)
+    if steps_hint:
+        return steps_hint
     
     # Check escape attempts
-    if len(team['escape_attempts']) < 2:
+    window = puzzle.SCENARIOS[team['scenario']].escape_window
+    if team['escape'].count < 2:
         if friend == "Eleven" and not team['eleven']['has_frequency']:
             return "Eleven isn't ready! She needs to find the frequency first"
         if friend == "Mike" and not team['mike']['has_eggs']:
             return "Mike isn't ready! He needs to activate the gate panel first"
         
-        if team['escape_attempts']:
-            last_attempt = team['escape_attempts'][-1]
-            time_since = current_time - last_attempt['time']
-            if time_since > 10:
-                return "⏰ Last escape attempt expired! Both must POST /escape within 10 seconds. Try again!"
+        if team['escape'].last_time is not None:
+            time_since = clock.now() - team['escape'].last_time
+            if time_since > window:
+                return f"⏰ Last escape attempt expired! Both must POST /escape within {window:g} seconds. Try again!"
             else:
-                return f"⏱️ Hurry! {10 - int(time_since)} seconds left for other friend to escape!"
+                return f"⏱️ Hurry! {window - int(time_since):g} seconds left for other friend to escape!"
         
         if friend == "Eleven":
-            return "🚪 Eleven should attempt escape first using POST /escape. Mike must follow within 10 seconds!"
+            return f"🚪 Eleven should attempt escape first using POST /escape. Mike must follow within {window:g} seconds!"
         elif friend == "Mike":
-            return "🚪 Wait for Eleven to attempt escape first, then Mike must follow within 10 seconds!"
+            return f"🚪 Wait for Eleven to attempt escape first, then Mike must follow within {window:g} seconds!"
         else:
-            return "Both friends must POST /escape within 10 seconds of each other! Eleven should go first"
+            return f"Both friends must POST /escape within {window:g} seconds of each other! Eleven should go first"
     
     return "Check your items and make sure both friends are ready. Then coordinate escape attempts!"
 
 # POST - Escape attempt
 @app.post("/{team_id}/escape")
 async def attempt_escape(team_id: str, data: EscapeAttempt):
-    """Attempt to escape - both must call within 10 seconds"""
+    """Attempt to escape - both must call within the scenario's escape window"""
     if team_id not in teams:
         raise HTTPException(status_code=404, detail="Team not found")
     
     team = teams[team_id]
     
     # Check preconditions
-    if data.friend == "Eleven" and not team['eleven']['has_frequency']:
-        raise HTTPException(400, "Eleven needs to find the frequency first!")
-    if data.friend == "Mike" and not team['mike']['has_eggs']:
-        raise HTTPException(400, "Mike needs to activate the gate panel first!")
-    
-    # Record escape attempt
-    current_time = time.time()
-    team['escape_attempts'].append({
-        "friend": data.friend,
-        "time": current_time
-    })
-    
-    # Check if both escaped within 10 seconds
-    if len(team['escape_attempts']) >= 2:
-        # Get the last two attempts
-        last_two = team['escape_attempts'][-2:]
-        
-        # Calculate time difference
-        time_diff = abs(last_two[1]['time'] - last_two[0]['time'])
+    scenario = puzzle.SCENARIOS[team['scenario']]
+    requirement = scenario.escape_requires.get(data.friend)
+    if requirement:
+        key, flag, error = requirement
+        if not team[key][flag]:
+            raise HTTPException(400, error)
+    
+    key = scenario.characters.get(data.friend)
+    if key is None:
+        raise HTTPException(400, f"Unknown friend '{data.friend}'")
+    
+    # Record escape attempt and expire stale ones
+    current_time = clock.now()
+    escape_timers.advance(current_time)
+    if team['escape'] is NO_ATTEMPTS:
+        team['escape'] = EscapeRendezvous()
+    escaped = team['escape'].attempt(key, current_time, scenario.escape_window)
+    team['version'] += 1
+    escape_timers.schedule(team['team_id'], current_time + scenario.escape_window)
+    
+    # Check if two different friends escaped within the window
+    if escaped:
+        # Mark team as escaped
+        team['escaped'] = True
+        team['end_time'] = current_time
+        seconds = int(current_time - team['start_time'])
+        hints_used = team['eleven']['hints_used'] + team['mike']['hints_used']
+        team['escape_key'] = escape_keys.sign(team['team_id'], team['team_name'], seconds, hints_used)
+        advance_stage(team, len(scenario.stages) - 1)
+        rooms[team['room']].record_escape(team, hints_used)
+        publish_update(team, "escape", data.friend)
         
-        if time_diff <= 10:  # Within 10 seconds
-            # Mark team as escaped
-            team['escaped'] = True
-            team['end_time'] = current_time
-            team['escape_key'] = f"ESCAPE_{team['team_name']}_{int(current_time)}"
-            
-            return {
-                "success": True,
-                "message": "ESCAPE SUCCESSFUL! The gate closes behind you.",
-                "escape_key": team['escape_key'],
-                "time_taken": f"{int(current_time - team['start_time'])} seconds",
-                "steps_used": team['steps_completed'],
-                "hints_used": team['eleven']['hints_used'] + team['mike']['hints_used'],
-                "story": "You both jump through the gate as it collapses. Safe in the Real World!",
-                "congratulations": "You used all HTTP methods to escape the Upside Down!"
-            }
-    
+        return {
+            "success": True,
+            "message": "ESCAPE SUCCESSFUL! The gate closes behind you.",
+            "escape_key": team['escape_key'],
+            "time_taken": f"{seconds} seconds",
+            "steps_used": team['steps_completed'],
+            "hints_used": hints_used,
+            "story": "You both jump through the gate as it collapses. Safe in the Real World!",
+            "congratulations": "You used all HTTP methods to escape the Upside Down!"
+        }
+
+    publish_update(team, "escape", data.friend)
     return {
         "success": False,
-        "message": f"Waiting for friend... {len(team['escape_attempts'])}/2 attempts",
-        "time_window": "Both must POST within 10 seconds - Gate is unstable!",
+        "message": f"Waiting for friend... {team['escape'].pending()}/2 attempts",
+        "time_window": f"Both must POST within {scenario.escape_window:g} seconds - Gate is unstable!",
         "warning": "Demogorgon screeches grow louder..."
     }
 
@@ -591,36 +655,389 @@ async def get_escape_key(team_id: str):
         "certificate": f"Team {team['team_name']} successfully escaped the Upside Down!"
     }
 
+# GET - Check an escape key
+@app.get("/verify_key/{escape_key}")
+async def verify_escape_key(escape_key: str):
+    """Check an escape key and read who earned it; needs no team state"""
+    return verify_key_body(escape_key)
+
+# --- WebSocket channels ---
+# Both friends can play over one socket each instead of REST calls (protocol
+# in channels.py). Actions run the REST handlers above, so a socket and a
+# REST client on the same team see the same game.
+CHANNEL_ACTIONS = {
+    "send_item": (SendItem, send_item),
+    "use_item": (UseItem, use_item),
+    "fix": (FixAction, fix_something),
+    "remove": (RemoveAction, remove_obstacle),
+    "escape": (EscapeAttempt, attempt_escape),
+    "hint": (None, get_hint),
+}
+
+async def channel_message(team_id: str, friend: Optional[str], text: str) -> dict:
+    """Run one socket message as its REST handler; returns the result message"""
+    try:
+        message = json.loads(text)
+    except ValueError:
+        message = None
+    if not isinstance(message, dict):
+        return {"type": "result", "id": None, "action": None, "status": 400,
+                "body": {"detail": "Messages must be JSON objects"}}
+    action = message.get("action")
+    reply = {"type": "result", "id": message.get("id"), "action": action}
+    if action not in CHANNEL_ACTIONS:
+        reply.update(status=400, body={"detail": f"Unknown action '{action}'",
+                                       "actions": list(CHANNEL_ACTIONS)})
+        return reply
+    model, handler = CHANNEL_ACTIONS[action]
+    fields = message.get("data") or {}
+    if not isinstance(fields, dict):
+        reply.update(status=400, body={"detail": "data must be a JSON object"})
+        return reply
+    fields.setdefault("from_friend" if model is SendItem else "friend", friend)
+    try:
+        if model is None:
+            body = await handler(team_id, fields["friend"])
+        else:
+            body = await handler(team_id, model(**fields))
+    except ValidationError as e:
+        reply.update(status=422, body={"detail": e.errors()})
+    except HTTPException as e:
+        reply.update(status=e.status_code, body={"detail": e.detail})
+    else:
+        reply.update(status=200, body=body)
+    return reply
+
+@app.websocket("/ws/{team_id}")
+async def team_channel(websocket: WebSocket, team_id: str, friend: Optional[str] = None):
+    """Play a team's game over a WebSocket, with live updates from the partner"""
+    await websocket.accept()
+    if team_id not in teams:
+        await websocket.send_json({"type": "error", "status": 404, "detail": "Team not found"})
+        await websocket.close(code=POLICY_VIOLATION)
+        return
+    
+    # Updates and closes are keyed on the canonical ID, however the path spelled it
+    team_id = teams[team_id]['team_id']
+    listener = channels.join(websocket, team_id, friend)
+    channels.send(listener, {"type": "welcome", "team": team_status_body(teams[team_id])})
+    try:
+        while True:
+            event = await websocket.receive()
+            if event["type"] == "websocket.disconnect":
+                break
+            text = event.get("text")
+            if text is None:
+                text = (event.get("bytes") or b"").decode("utf-8", "replace")
+            channels.send(listener, await channel_message(team_id, listener.friend, text))
+    finally:
+        await channels.leave(listener)
+
+# --- Admin snapshots ---
+# Aggregates over every team are served from a snapshot up to
+# ADMIN_SNAPSHOT_MAX_AGE_MS old; dashboards polling together share one
+# rebuild (see admin_cache.py)
+admin_snapshots = SnapshotCache(
+    float(os.environ.get("ADMIN_SNAPSHOT_MAX_AGE_MS", DEFAULT_MAX_AGE * 1000)) / 1000)
+# Teams summarised between two chances for game requests to run
+SNAPSHOT_CHUNK = 2000
+
+def snapshot_response(snapshot: Snapshot) -> Response:
+    return Response(snapshot.body, media_type="application/json", headers=admin_snapshots.headers(snapshot))
+
+def team_summary(team: dict, current_time: float) -> dict:
+    elapsed = int(current_time - team['start_time'])
+    return {
+        "team_id": team['team_id'],
+        "team_name": team['team_name'],
+        "room": team['room'],
+        "escaped": team['escaped'],
+        "time_elapsed": f"{elapsed}s",
+        "eleven_ready": team['eleven']['has_frequency'],
+        "mike_ready": team['mike']['has_eggs'],
+        "steps_count": len(team['steps_completed']),
+        "hints_used": team['eleven']['hints_used'] + team['mike']['hints_used'],
+        "escape_attempts": team['escape'].count,
+        "status": "ESCAPED" if team['escaped'] else "TRAPPED"
+    }
+
+async def build_all_teams(room: Optional[str]) -> bytes:
+    """The all_teams body, encoded a chunk at a time so the event loop never stalls on it"""
+    current_time = clock.now()
+    team_ids = list(rooms[room].team_ids if room is not None else teams)
+    chunks = []
+    total = escaped = 0
+    for start in range(0, len(team_ids), SNAPSHOT_CHUNK):
+        summaries = []
+        for team_id in team_ids[start:start + SNAPSHOT_CHUNK]:
+            team = teams.get(team_id)
+            # Deleted since the build started
+            if team is None:
+                continue
+            summaries.append(team_summary(team, current_time))
+            escaped += team['escaped']
+        if summaries:
+            total += len(summaries)
+            chunks.append(json_body(summaries)[1:-1])
+        await asyncio.sleep(0)
+    # Byte for byte what returning the whole dict would encode to
+    head = json_body({"total_teams": total, "escaped_teams": escaped, "trapped_teams": total - escaped})
+    return b"%s,\"teams\":[%s]}" % (head[:-1], b",".join(chunks))
+
 # ADMIN - Get all teams
 @app.get("/admin/all_teams")
-async def get_all_teams():
-    """Get all teams (for monitoring)"""
-    all_teams = []
-    current_time = time.time()
+async def get_all_teams(room: Optional[str] = None):
+    """Get all teams, or just one room's teams (for monitoring)"""
+    if room is not None and room not in rooms:
+        raise HTTPException(status_code=404, detail="Room not found")
+    
+    with tracing.span("snapshot"):
+        snapshot = await admin_snapshots.get(("all_teams", room), lambda: build_all_teams(room))
+    return snapshot_response(snapshot)
+
+# ADMIN - WebSocket channels
+@app.get("/admin/channels")
+async def channel_stats():
+    return channels.stats()
+
+# ADMIN - Snapshot cache
+@app.get("/admin/snapshot_cache")
+async def snapshot_cache_stats():
+    """Hits, shared rebuilds and rebuild cost of the admin snapshot cache"""
+    return admin_snapshots.stats()
+
+# ADMIN - Rooms
+@app.get("/admin/rooms")
+async def list_rooms():
+    """Team counts for every room"""
+    return {
+        "total_rooms": len(rooms),
+        "rooms": [
+            {
+                "room": room.name,
+                "total_teams": len(room),
+                "escaped_teams": room.escaped,
+                "trapped_teams": len(room) - room.escaped
+            }
+            for room in rooms.values()
+        ]
+    }
+
+@app.get("/admin/rooms/{room}/leaderboard")
+async def room_leaderboard(room: str, limit: int = 10):
+    """Fastest escapes in a room; ties go to the team that used fewer hints"""
+    if room not in rooms:
+        raise HTTPException(status_code=404, detail="Room not found")
     
-    for team_id, team in teams.items():
-        elapsed = int(current_time - team['start_time'])
-        
-        all_teams.append({
-            "team_id": team_id,
-            "team_name": team['team_name'],
-            "escaped": team['escaped'],
-            "time_elapsed": f"{elapsed}s",
-            "eleven_ready": team['eleven']['has_frequency'],
-            "mike_ready": team['mike']['has_eggs'],
-            "steps_count": len(team['steps_completed']),
-            "hints_used": team['eleven']['hints_used'] + team['mike']['hints_used'],
-            "escape_attempts": len(team['escape_attempts']),
-            "status": "ESCAPED" if team['escaped'] else "TRAPPED"
-        })
+    entries = rooms[room].leaderboard[:max(limit, 0)]
+    return {
+        "room": room,
+        "escaped_teams": rooms[room].escaped,
+        "leaderboard": [
+            {
+                "rank": rank,
+                "team_id": team_id,
+                "team_name": teams[team_id]['team_name'],
+                "time_taken": f"{int(time_taken)} seconds",
+                "hints_used": hints_used
+            }
+            for rank, (time_taken, hints_used, team_id) in enumerate(entries, start=1)
+        ]
+    }
+
+@app.post("/admin/rooms/{room}/reset")
+async def reset_room(room: str):
+    """Reset every team in a room to its initial state"""
+    if room not in rooms:
+        raise HTTPException(status_code=404, detail="Room not found")
+    
+    team_ids = list(rooms[room].team_ids)
+    for team_id in team_ids:
+        reset_team_state(teams[team_id])
+    
+    return {
+        "message": f"Room '{room}' reset: {len(team_ids)} teams are back at the gate...",
+        "teams_reset": len(team_ids)
+    }
+
+# ADMIN - Team search
+@app.get("/admin/search")
+async def search_teams(q: str, mode: str = "auto", room: Optional[str] = None, limit: int = 20):
+    """Find teams by name prefix or by similar spelling (typos welcome)"""
+    if mode not in search.MODES:
+        raise HTTPException(400, f"Unknown mode. Use one of {', '.join(search.MODES)}")
+    if room is not None and room not in rooms:
+        raise HTTPException(status_code=404, detail="Room not found")
+    
+    started = time.perf_counter()
+    scoped = [rooms[room]] if room is not None else rooms.values()
+    matches = search.search((each.search for each in scoped), q, mode, max(1, min(limit, 100)))
+    
+    return {
+        "query": q,
+        "mode": mode,
+        "took_ms": round((time.perf_counter() - started) * 1000, 3),
+        "results": [
+            {
+                "team_id": team_id,
+                "team_name": teams[team_id]['team_name'],
+                "room": teams[team_id]['room'],
+                "escaped": teams[team_id]['escaped'],
+                "match": match,
+                "score": score
+            }
+            for match, score, team_id in matches
+        ]
+    }
+
+# ADMIN - Game funnel
+@app.get("/admin/funnel")
+async def get_funnel(scenario: Optional[str] = None, room: Optional[str] = None):
+    """How many teams are at each stage, and how long they spent there"""
+    if scenario is not None and scenario not in puzzle.SCENARIOS:
+        raise HTTPException(status_code=404, detail="Scenario not found")
+    if room is not None and room not in rooms:
+        raise HTTPException(status_code=404, detail="Room not found")
+    
+    names = [scenario] if scenario else list(puzzle.SCENARIOS)
+    scoped = [rooms[room]] if room is not None else list(rooms.values())
+    result = {}
+    for name in names:
+        # Sum the per-room funnels; the cost is O(rooms x stages), never O(teams)
+        funnel = Funnel(puzzle.SCENARIOS[name].stages)
+        for each in scoped:
+            if name in each.funnels:
+                funnel.merge(each.funnels[name])
+        result[name] = {
+            "total_teams": sum(funnel.current),
+            "stages": funnel.snapshot()
+        }
+    return {"scenarios": result}
+
+# ADMIN - Export results
+@app.get("/admin/export/{table}")
+async def export_table(table: str, format: str = "csv", room: Optional[str] = None):
+    """Stream teams or hint events as CSV or an Arrow IPC stream"""
+    if room is not None and room not in rooms:
+        raise HTTPException(status_code=404, detail="Room not found")
+    if table not in ("teams", "hints"):
+        raise HTTPException(status_code=404, detail="Unknown export table. Use 'teams' or 'hints'")
+    if format not in export.FORMATS:
+        raise HTTPException(400, f"Unknown format. Use one of {', '.join(export.FORMATS)}")
+    if format == "arrow" and export.pyarrow is None:
+        raise HTTPException(501, "Arrow export needs the optional 'pyarrow' package")
+    
+    from fastapi.responses import StreamingResponse
+    
+    # A room's ID index can grow while the response streams, so export a copy
+    team_ids = list(rooms[room].team_ids) if room is not None else None
+    if table == "teams":
+        rows = export.iter_team_rows(teams, team_ids)
+        columns = export.TEAM_COLUMNS
+    else:
+        rows = export.iter_hint_rows(teams, hint_requests, team_ids)
+        columns = export.HINT_COLUMNS
+    
+    async def chunks():
+        # Encode on the event loop, one batch at a time, yielding between batches
+        for chunk in export.stream_export(rows, columns, format):
+            yield chunk
+            await asyncio.sleep(0)
+    
+    extension = "arrows" if format == "arrow" else format
+    return StreamingResponse(chunks(), media_type=export.MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f"attachment; filename={table}.{extension}"})
+
+# ADMIN - Idempotency keys
+@app.get("/admin/idempotency")
+async def idempotency_stats():
+    """Hit and miss counts for Idempotency-Key replays"""
+    return idempotency_store.stats()
+
+# ADMIN - Memory accounting
+allocation_tracer = memory.AllocationTracer()
+
+@app.get("/admin/memory")
+async def memory_report(sample: int = 1000):
+    """Approximate deep size of team state and hint history, per team and in total"""
+    # Scenario objects are shared by every team, so they are not charged to any of them
+    shared = memory.shared_object_ids(puzzle.SCENARIOS)
+    structures = {
+        "teams": memory.estimate_mapping(teams, sample, shared),
+        "hint_requests": memory.estimate_mapping(hint_requests, sample, shared),
+        # Room indexes hold the same team_id strings the team state already owns
+        "rooms": memory.estimate_mapping(rooms, sample, shared | {id(team['team_id']) for team in teams.values()}),
+    }
+    # Most teams never ask for a hint and have no hint_requests entry
+    hint_bytes = structures["hint_requests"]["total_bytes"] - structures["hint_requests"]["index_bytes"]
+    per_team = structures["teams"]["avg_entry_bytes"] + (round(hint_bytes / len(teams)) if teams else 0)
+    
+    return {
+        "total_teams": len(teams),
+        "avg_bytes_per_team": per_team,
+        "total_bytes": sum(report["total_bytes"] for report in structures.values()),
+        "structures": structures,
+        "tracemalloc": allocation_tracer.status()
+    }
+
+@app.get("/admin/memory/team/{team_id}")
+async def team_memory(team_id: str):
+    """Approximate deep size of one team's state and hint history"""
+    if team_id not in teams:
+        raise HTTPException(status_code=404, detail="Team not found")
     
+    team = teams[team_id]
+    shared = memory.shared_object_ids(puzzle.SCENARIOS)
+    state_bytes = memory.deep_sizeof(team, shared)
+    hint_bytes = memory.deep_sizeof(hint_requests.get(team['team_id'], []), shared)
     return {
-        "total_teams": len(all_teams),
-        "escaped_teams": sum(1 for team in all_teams if team['escaped']),
-        "trapped_teams": sum(1 for team in all_teams if not team['escaped']),
-        "teams": all_teams
+        "team_id": team['team_id'],
+        "state_bytes": state_bytes,
+        "hint_requests_bytes": hint_bytes,
+        "hint_requests": len(hint_requests.get(team['team_id'], [])),
+        "total_bytes": state_bytes + hint_bytes
     }
 
+@app.post("/admin/memory/tracemalloc/start")
+async def start_tracemalloc(frames: int = 1):
+    """Start tracing allocations (slows the server down while on)"""
+    allocation_tracer.start(max(frames, 1))
+    return allocation_tracer.status()
+
+@app.post("/admin/memory/tracemalloc/snapshot")
+async def take_tracemalloc_snapshot():
+    """Take a numbered allocation snapshot"""
+    if not allocation_tracer.tracing:
+        raise HTTPException(409, "tracemalloc is not running. POST /admin/memory/tracemalloc/start first")
+    
+    snapshot_id = allocation_tracer.snapshot()
+    return {"snapshot": snapshot_id, **allocation_tracer.status()}
+
+@app.get("/admin/memory/tracemalloc/diff")
+async def diff_tracemalloc(before: Optional[int] = None, after: Optional[int] = None,
+                           group_by: str = "lineno", limit: int = 20):
+    """Top allocation changes between two snapshots (default: oldest and newest kept)"""
+    if group_by not in memory.GROUP_BY:
+        raise HTTPException(400, f"Unknown group_by. Use one of {', '.join(memory.GROUP_BY)}")
+    snapshots = allocation_tracer.snapshots
+    before = min(snapshots, default=None) if before is None else before
+    after = max(snapshots, default=None) if after is None else after
+    if before not in snapshots or after not in snapshots:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    
+    return {
+        "before": before,
+        "after": after,
+        "group_by": group_by,
+        "top": allocation_tracer.diff(before, after, group_by, max(limit, 0))
+    }
+
+@app.post("/admin/memory/tracemalloc/stop")
+async def stop_tracemalloc():
+    """Stop tracing and drop all snapshots"""
+    allocation_tracer.stop()
+    return allocation_tracer.status()
+
 # ADMIN - Reset team
 @app.post("/admin/reset_team/{team_id}")
 async def reset_team(team_id: str):
@@ -631,48 +1048,234 @@ async def reset_team(team_id: str):
     team_name = teams[team_id]['team_name']
     
     # Reset to initial state
-    teams[team_id] = {
-        'team_id': team_id,
-        'team_name': team_name,
-        'escaped': False,
-        'escape_key': None,
-        'start_time': time.time(),
-        'end_time': None,
-        'eleven': {
-            'location': 'Hawkins Lab (Real World)',
-            'items': DEFAULT_ITEMS["Eleven"].copy(),
-            'gate_locked': True,
-            'has_frequency': False,
-            'has_eggs': False,
-            'last_action': None,
-            'hints_used': 0
-        },
-        'mike': {
-            'location': 'Upside Down Hawkins Lab',
-            'items': DEFAULT_ITEMS["Mike"].copy(),
-            'gate_locked': True,
-            'has_frequency': False,
-            'has_eggs': False,
-            'last_action': None,
-            'hints_used': 0
-        },
-        'steps_completed': [],
-        'escape_attempts': [],
-        'last_hint_time': None
-    }
-    
-    hint_requests[team_id] = []
+    reset_team_state(teams[team_id])
     
     return {"message": f"Team '{team_name}' reset. The gate has reopened..."}
 
+# ADMIN - Bulk reset and delete
+def select_teams(room: Optional[str], scenario: Optional[str], escaped: Optional[bool],
+                 name_prefix: Optional[str], min_age: Optional[float]) -> List[dict]:
+    """Teams matching every filter given; at least one filter is required"""
+    if room is None and scenario is None and escaped is None and name_prefix is None and min_age is None:
+        raise HTTPException(400, "Give at least one filter: room, scenario, escaped, name_prefix or min_age")
+    if room is not None and room not in rooms:
+        raise HTTPException(status_code=404, detail="Room not found")
+    if scenario is not None and scenario not in puzzle.SCENARIOS:
+        raise HTTPException(400, f"Unknown scenario '{scenario}'")
+    
+    prefix = search.normalize_name(name_prefix) if name_prefix is not None else None
+    started_before = clock.now() - min_age if min_age is not None else None
+    team_ids = rooms[room].team_ids if room is not None else teams
+    return [
+        team for team in map(teams.__getitem__, team_ids)
+        if (scenario is None or team['scenario'] == scenario)
+        and (escaped is None or team['escaped'] == escaped)
+        and (prefix is None or search.normalize_name(team['team_name']).startswith(prefix))
+        and (started_before is None or team['start_time'] <= started_before)
+    ]
+
+@app.post("/admin/teams/reset")
+async def bulk_reset_teams(room: Optional[str] = None, scenario: Optional[str] = None,
+                           escaped: Optional[bool] = None, name_prefix: Optional[str] = None,
+                           min_age: Optional[float] = None):
+    """Reset every team matching the filters (min_age: seconds since the team started)"""
+    started = time.perf_counter()
+    matched = select_teams(room, scenario, escaped, name_prefix, min_age)
+    for team in matched:
+        reset_team_state(team)
+    
+    return {
+        "message": f"{len(matched)} teams are back at the gate...",
+        "teams_reset": len(matched),
+        "took_ms": round((time.perf_counter() - started) * 1000, 3)
+    }
+
+@app.post("/admin/teams/delete")
+async def bulk_delete_teams(room: Optional[str] = None, scenario: Optional[str] = None,
+                            escaped: Optional[bool] = None, name_prefix: Optional[str] = None,
+                            min_age: Optional[float] = None):
+    """Delete every team matching the filters for good (min_age: seconds since the team started)"""
+    started = time.perf_counter()
+    matched = select_teams(room, scenario, escaped, name_prefix, min_age)
+    for team in matched:
+        delete_team_state(team)
+    
+    return {
+        "message": f"{len(matched)} teams vanished into the Upside Down.",
+        "teams_deleted": len(matched),
+        "took_ms": round((time.perf_counter() - started) * 1000, 3)
+    }
+
+# --- Live state handoff ---
+# serve.py moves every game into the replacement process on reload (see handoff.py)
+last_handoff: Optional[dict] = None
+
+def handoff_state() -> dict:
+    """Everything a replacement process needs to carry on every game"""
+    return {
+        'teams': teams,
+        'hint_requests': hint_requests,
+        'rooms': rooms,
+        'escape_timers': (escape_timers.buckets, escape_timers.scheduled, escape_timers.current_tick),
+        'idempotency': idempotency_store.entries,
+        # Same epoch, so ETags clients hold stay valid across the reload
+        'etag_epoch': ETAG_EPOCH,
+        # Same secret, so keys already handed out still verify
+        'escape_key_secret': ESCAPE_KEY_SECRET,
+    }
+
+def restore_state(state: dict, report: Optional[dict] = None) -> None:
+    """Install state produced by handoff_state() in another process"""
+    global teams, hint_requests, rooms, ETAG_EPOCH, ESCAPE_KEY_SECRET, escape_keys, last_handoff
+    teams = state['teams']
+    hint_requests = state['hint_requests']
+    rooms = state['rooms']
+    escape_timers.buckets, escape_timers.scheduled, escape_timers.current_tick = state['escape_timers']
+    idempotency_store.entries = state['idempotency']
+    ETAG_EPOCH = state['etag_epoch']
+    if not ESCAPE_KEY_SECRET_CONFIGURED:
+        ESCAPE_KEY_SECRET = state['escape_key_secret']
+        escape_keys = EscapeKeySigner(ESCAPE_KEY_SECRET)
+    last_handoff = report
+
+# ADMIN - Last reload
+@app.get("/admin/handoff")
+async def handoff_report():
+    """How long the reload that handed this process its state took"""
+    if last_handoff is None:
+        return {"handed_off": False, "message": "This process started without a handoff"}
+    return {"handed_off": True, "teams": len(teams), **last_handoff}
+
+# --- Housekeeping ---
+# One scheduler runs every periodic job, and the loop monitor logs any request
+# that blocks the event loop for longer than LOOP_LAG_THRESHOLD_MS. Hint
+# cooldowns need no job: they are a comparison against last_hint_time.
+loop_monitor = LoopMonitor(threshold=float(os.environ.get("LOOP_LAG_THRESHOLD_MS", 100)) / 1000)
+app.add_middleware(ActiveRequests, monitor=loop_monitor)
+scheduler = Scheduler()
+# Stale escape attempts get cleared even for teams that never try again
+scheduler.add("escape-expiry", 1.0, lambda budget: escape_timers.advance(clock.now(), budget))
+scheduler.add("idempotency-expiry", 30.0, idempotency_store.expire)
+scheduler.add("metrics-rollup", 10.0, loop_monitor.rollup, budget=MAX_SAMPLES)
+# Nobody polling any more: let big admin snapshots go
+scheduler.add("admin-snapshot-expiry", 30.0, admin_snapshots.expire)
+
+# Crash recovery: SNAPSHOT_FILE=state.pickle, restored with serve.py --restore
+SNAPSHOT_FILE = os.environ.get("SNAPSHOT_FILE")
+snapshot_writer = handoff.SnapshotWriter(SNAPSHOT_FILE, handoff_state) if SNAPSHOT_FILE else None
+if snapshot_writer:
+    scheduler.add("snapshot", float(os.environ.get("SNAPSHOT_INTERVAL", 60)), snapshot_writer.run)
+
+@app.on_event("startup")
+async def start_housekeeping():
+    loop_monitor.start()
+    scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_housekeeping():
+    scheduler.stop()
+    loop_monitor.stop()
+    if snapshot_writer:
+        snapshot_writer.collect()
+
+# ADMIN - Scheduler and event-loop health
+@app.get("/admin/scheduler")
+async def scheduler_stats():
+    """Periodic jobs, event-loop lag and recent stalls with the requests behind them"""
+    return {
+        "jobs": scheduler.stats(),
+        "loop": loop_monitor.stats(),
+        "snapshots": snapshot_writer.stats() if snapshot_writer else None
+    }
+
+# --- Admission control ---
+# At most ADMISSION_MAX_IN_FLIGHT requests run at once (0 turns admission
+# control off); the rest queue with players mid-game ahead of new teams,
+# and new teams ahead of admin and root traffic, which is shed with 503
+# once it has queued ADMISSION_MAX_WAIT_MS or the loop lags
+# ADMISSION_MAX_LAG_MS. See admission.py.
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", 16))
+admission = AdmissionController(
+    max_in_flight=ADMISSION_MAX_IN_FLIGHT,
+    max_wait=float(os.environ.get("ADMISSION_MAX_WAIT_MS", 250)) / 1000,
+    max_lag=float(os.environ.get("ADMISSION_MAX_LAG_MS", 200)) / 1000,
+    max_queue=int(os.environ.get("ADMISSION_MAX_QUEUE", 1000)),
+    lag=lambda: loop_monitor.lag
+) if ADMISSION_MAX_IN_FLIGHT > 0 else None
+if admission:
+    app.add_middleware(AdmissionMiddleware, controller=admission)
+
+# ADMIN - Admission control
+@app.get("/admin/admission")
+async def admission_stats():
+    """Requests admitted and shed per priority class, and what is queued right now"""
+    if admission is None:
+        return {"enabled": False}
+    return {"enabled": True, "loop_lag_ms": round(loop_monitor.lag * 1000, 2), **admission.report()}
+
+# --- Request tracing ---
+# Every request is timed through routing and response, with validation,
+# handler and serialization in between when TRACE_PHASES is on (see
+# tracing.py). A TRACE_SAMPLE_RATE share of them, and all that take
+# TRACE_SLOW_MS or longer, are kept in a ring of the last TRACE_RING_SIZE;
+# slow ones are logged too. Both at 0 turn tracing off.
+tracer = Tracer(
+    sample_rate=float(os.environ.get("TRACE_SAMPLE_RATE", DEFAULT_SAMPLE_RATE)),
+    slow_threshold=float(os.environ.get("TRACE_SLOW_MS", DEFAULT_SLOW_MS)) / 1000,
+    capacity=int(os.environ.get("TRACE_RING_SIZE", DEFAULT_RING_SIZE))
+)
+TRACE_EXPORT_FILE = os.environ.get("TRACE_EXPORT_FILE", "traces.json")
+if tracer.enabled:
+    # Outermost, so time spent queued for admission counts
+    app.add_middleware(TracingMiddleware, tracer=tracer)
+
+# ADMIN - Traces
+@app.get("/admin/traces")
+async def list_traces(route: Optional[str] = None, slow: Optional[bool] = None, min_ms: float = 0,
+                      limit: int = 50):
+    """Kept traces, newest first; route matches a route template or a literal path"""
+    return {
+        **tracer.stats(),
+        "traces": [trace.to_dict() for trace in tracer.search(route, slow, min_ms, max(1, min(limit, 1000)))]
+    }
+
+@app.get("/admin/traces/{trace_id}")
+async def get_trace(trace_id: int):
+    trace = tracer.find(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found (it may have left the ring)")
+    return trace.to_dict()
+
+@app.post("/admin/traces/export")
+async def export_traces():
+    """Write every kept trace to TRACE_EXPORT_FILE as Chrome trace event JSON"""
+    traces = list(tracer.ring)
+    events = await asyncio.get_running_loop().run_in_executor(
+        None, tracing.write_chrome_trace, TRACE_EXPORT_FILE, traces)
+    return {
+        "file": os.path.abspath(TRACE_EXPORT_FILE),
+        "traces": len(traces),
+        "events": events,
+        "open_with": "chrome://tracing or https://ui.perfetto.dev"
+    }
+
 # Root endpoint
 @app.get("/")
 async def root():
+    with tracing.span("snapshot"):
+        snapshot = await admin_snapshots.get("root", build_root)
+    return snapshot_response(snapshot)
+
+async def build_root() -> bytes:
+    return json_body(root_body())
+
+def root_body() -> dict:
+    window = puzzle.SCENARIOS[puzzle.DEFAULT_SCENARIO].escape_window
     return {
         "game": "Stranger Things: Escape the Upside Down",
         "status": "Running - Season 4 Special",
         "total_teams": len(teams),
-        "escaped_teams": sum(1 for team in teams.values() if team['escaped']),
+        "escaped_teams": sum(room.escaped for room in rooms.values()),
         "story": "Two friends, two dimensions. One escape.",
         "characters": {
             "Eleven": "In the Real World. Has radio. Needs demogorgon frequency.",
@@ -690,11 +1293,87 @@ async def root():
             "8": "HEAD /{team_id}/status - Check dimension sync",
             "9": "OPTIONS /{team_id}/escape - See escape requirements",
             "10": "POST /{team_id}/escape with {\"friend\": \"Eleven\"}",
-            "11": "POST /{team_id}/escape with {\"friend\": \"Mike\"} (within 10s!)",
+            "11": f"POST /{{team_id}}/escape with {{\"friend\": \"Mike\"}} (within {window:g}s!)",
             "12": "GET /{team_id}/key - Get escape key",
             "help": "GET /{team_id}/hint - Get help when stuck"
         },
         "api_docs": "Visit /docs for interactive API documentation",
         "theme_music": "🎵 Should I Stay or Should I Go - The Clash 🎵",
         "note": "Multiple teams can play simultaneously. Each team has isolated state."
-    }
\ No newline at end of file
+    }
+
+# --- Raw ASGI fast path ---
+# Optional: serve `main:fast_app` instead of `main:app` to answer the hottest
+# read-only routes straight from team state. Responses are byte-identical to
+# the FastAPI routes above; everything else falls through to `app`.
+fast_router = FastPathRouter(app)
+
+def _quick_status_blocks() -> Dict[tuple, tuple]:
+    """Pre-encoded HEAD /status headers around X-Time-Elapsed, per readiness combination"""
+    blocks = {}
+    for escaped in (False, True):
+        for frequency in (False, True):
+            for eggs in (False, True):
+                sample = {'escaped': escaped, 'start_time': clock.now(),
+                          'eleven': {'has_frequency': frequency}, 'mike': {'has_eggs': eggs}}
+                raw = [(k.lower().encode("latin-1"), v.encode("latin-1"))
+                       for k, v in quick_status_headers(sample).items()]
+                split = [name for name, _ in raw].index(b"x-time-elapsed")
+                blocks[(escaped, frequency, eggs)] = (tuple(raw[:split]),
+                                                      tuple(raw[split + 1:]) + ((b"content-length", b"0"),))
+    return blocks
+
+QUICK_STATUS_BLOCKS = _quick_status_blocks()
+
+@fast_router.route("HEAD", "/{team_id}/status")
+def fast_quick_status(team_id: str, headers):
+    team = teams.get(team_id)
+    if team is None:
+        return None
+    record_step(team, "HEAD")
+    before, after = QUICK_STATUS_BLOCKS[(bool(team['escaped']), bool(team['eleven']['has_frequency']),
+                                         bool(team['mike']['has_eggs']))]
+    elapsed = str(int(clock.now() - team['start_time'])).encode("latin-1")
+    return 200, [*before, (b"x-time-elapsed", elapsed), *after], b""
+
+def fast_not_modified(team: dict):
+    return 304, [(b"etag", team_etag(team).encode("latin-1"))], b""
+
+@fast_router.route("GET", "/team_status/{team_id}")
+def fast_team_status(team_id: str, headers):
+    team = teams.get(team_id)
+    if team is None:
+        return None
+    if etag_matches(team, header_value(headers, b"if-none-match")):
+        return fast_not_modified(team)
+    return json_response(team_status_body(team), [(b"etag", team_etag(team).encode("latin-1"))])
+
+def fast_look(team_id: str, headers, key: str):
+    team = teams.get(team_id)
+    if team is None:
+        return None
+    body = look_around(team, key, header_value(headers, b"if-none-match"))
+    if body is None:
+        return fast_not_modified(team)
+    return json_response(body, [(b"etag", team_etag(team).encode("latin-1"))])
+
+@fast_router.route("GET", "/verify_key/{escape_key}")
+def fast_verify_key(escape_key: str, headers):
+    return json_response(verify_key_body(escape_key))
+
+@fast_router.route("GET", "/{team_id}/eleven")
+def fast_eleven_look(team_id: str, headers):
+    return fast_look(team_id, headers, 'eleven')
+
+@fast_router.route("GET", "/{team_id}/mike")
+def fast_mike_look(team_id: str, headers):
+    return fast_look(team_id, headers, 'mike')
+
+# Capture sits in front of the fast path too; it marks the scope so the copy
+# inside `app` skips requests that fall through
+fast_app = CaptureMiddleware(fast_router, capture_writer, team_id_in_path) if capture_writer else fast_router
+fast_app = ActiveRequests(fast_app, loop_monitor)
+if admission:
+    fast_app = AdmissionMiddleware(fast_app, admission)
+if tracer.enabled:
+    fast_app = TracingMiddleware(fast_app, tracer)
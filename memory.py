@@ -0,0 +1,152 @@
+"""Memory accounting for capacity planning.
+
+``deep_sizeof`` walks an object graph and adds up ``sys.getsizeof`` for
+every object reachable from it, counting each object once. Objects owned
+by the compiled scenarios (item names, look text, ...) are shared by every
+team, so reports exclude them and only count what a team adds.
+
+``AllocationTracer`` wraps tracemalloc: start tracing, take numbered
+snapshots and diff any two of them by file or by line.
+"""
+import sys
+import tracemalloc
+from types import BuiltinFunctionType, FunctionType, MethodType, ModuleType
+from typing import Dict, Iterable, List, Set
+
+# Never descended into or counted: code, classes and modules are not data
+OPAQUE = (type, ModuleType, FunctionType, MethodType, BuiltinFunctionType)
+ATOMIC = (str, bytes, bytearray, int, float, complex, bool, type(None))
+
+MAX_SNAPSHOTS = 8
+GROUP_BY = ("lineno", "filename")
+
+_slot_names: Dict[type, tuple] = {}
+
+
+def _slots_of(cls: type) -> tuple:
+    if cls not in _slot_names:
+        names = []
+        for klass in cls.__mro__:
+            slots = klass.__dict__.get("__slots__", ())
+            names.extend((slots,) if isinstance(slots, str) else slots)
+        _slot_names[cls] = tuple(name for name in names if name not in ("__dict__", "__weakref__"))
+    return _slot_names[cls]
+
+
+def _walk(obj, exclude: Set[int], seen: Set[int]) -> int:
+    size = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        key = id(item)
+        if key in seen or key in exclude or isinstance(item, OPAQUE):
+            continue
+        seen.add(key)
+        size += sys.getsizeof(item)
+        if isinstance(item, ATOMIC):
+            continue
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        else:
+            attributes = getattr(item, "__dict__", None)
+            if attributes is not None:
+                stack.append(attributes)
+            for name in _slots_of(type(item)):
+                value = getattr(item, name, None)
+                if value is not None:
+                    stack.append(value)
+    return size
+
+
+def deep_sizeof(obj, exclude: Iterable[int] = ()) -> int:
+    """Approximate bytes reachable from obj, skipping objects whose id() is in exclude"""
+    return _walk(obj, set(exclude), set())
+
+
+def shared_object_ids(*roots) -> Set[int]:
+    """ids of every object reachable from roots, plus the None/True/False singletons"""
+    seen: Set[int] = {id(None), id(True), id(False)}
+    for root in roots:
+        _walk(root, set(), seen)
+    return seen
+
+
+def estimate_mapping(mapping, sample: int, exclude: Set[int]) -> dict:
+    """Deep size of a mapping's values (sampled evenly past `sample` entries) plus its own index"""
+    keys = list(mapping)
+    values = [mapping[key] for key in keys]
+    step = max(1, -(-len(keys) // max(sample, 1)))
+    sizes = [deep_sizeof(value, exclude) for value in values[::step]]
+    # The index: the mapping's own containers and keys, without the values
+    index_bytes = deep_sizeof(mapping, exclude | {id(value) for value in values})
+    average = sum(sizes) / len(sizes) if sizes else 0.0
+    return {
+        "entries": len(keys),
+        "sampled": len(sizes),
+        "estimated": step > 1,
+        "avg_entry_bytes": round(average),
+        "max_sampled_entry_bytes": max(sizes, default=0),
+        "index_bytes": index_bytes,
+        "total_bytes": round(average * len(keys)) + index_bytes,
+    }
+
+
+class AllocationTracer:
+    """Numbered tracemalloc snapshots that can be diffed pairwise"""
+
+    def __init__(self):
+        self.snapshots: Dict[int, tracemalloc.Snapshot] = {}
+        self.next_id = 1
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 1) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def stop(self) -> None:
+        tracemalloc.stop()
+        self.snapshots.clear()
+
+    def snapshot(self) -> int:
+        """Take a snapshot and return its number; only the newest MAX_SNAPSHOTS are kept"""
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+        snapshot_id = self.next_id
+        self.next_id += 1
+        self.snapshots[snapshot_id] = snapshot
+        while len(self.snapshots) > MAX_SNAPSHOTS:
+            del self.snapshots[min(self.snapshots)]
+        return snapshot_id
+
+    def diff(self, before: int, after: int, group_by: str = "lineno", limit: int = 20) -> List[dict]:
+        """Top allocation changes from snapshot `before` to `after`, largest first"""
+        stats = self.snapshots[after].compare_to(self.snapshots[before], group_by)
+        return [
+            {
+                "file": stat.traceback[0].filename,
+                "line": stat.traceback[0].lineno if group_by == "lineno" else None,
+                "size_diff_bytes": stat.size_diff,
+                "size_bytes": stat.size,
+                "count_diff": stat.count_diff,
+                "count": stat.count,
+            }
+            for stat in stats[:limit]
+        ]
+
+    def status(self) -> dict:
+        current, peak = tracemalloc.get_traced_memory() if self.tracing else (0, 0)
+        return {
+            "tracing": self.tracing,
+            "traced_bytes": current,
+            "peak_traced_bytes": peak,
+            "snapshots": sorted(self.snapshots),
+        }
@@ -0,0 +1,297 @@
+"""Declarative puzzle scenarios compiled into transition tables.
+
+Each scenario lives in ``scenarios/<name>.json`` and describes the two
+characters, their starting items, the actions they can take (with
+preconditions, effects and responses) and the step-based hints. At import
+time every scenario is compiled into ``TRANSITIONS``, a flat dict keyed by
+``(scenario, friend, verb, arg)``, so an action is a single dict lookup no
+matter how many scenarios the server hosts.
+
+Scenarios also list their funnel stages in order; a stage is reached either
+by a transition that names it or once all of its ``after_steps`` have been
+recorded. Every scenario implicitly starts at ``created`` and ends at
+``escaped``.
+
+Scenarios share the team state layout used by main.py: characters are
+stored under the ``eleven`` and ``mike`` keys and expose the
+``has_frequency`` / ``has_eggs`` flags read by the status endpoints. A new
+team's characters are the scenario's shared, read-only templates; anything
+that writes to a character goes through ``own_character`` first.
+"""
+import json
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+SCENARIO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scenarios")
+DEFAULT_SCENARIO = "stranger_things"
+
+# Verbs map to the REST endpoints: send_item (POST), use_item (PUT),
+# fix (PATCH) and remove (DELETE)
+VERBS = ("send_item", "use_item", "fix", "remove")
+CHARACTER_KEYS = ("eleven", "mike")
+FIRST_STAGE = "created"
+LAST_STAGE = "escaped"
+
+
+class ScenarioError(ValueError):
+    """Raised when a scenario definition is malformed"""
+
+
+# A response template is a tuple of (field, constant, state_ref) where
+# state_ref is (character_key, field) for "$Character.field" values
+Template = Tuple[Tuple[str, Any, Optional[Tuple[str, str]]], ...]
+
+
+class Transition:
+    """A compiled action: preconditions, effects and response templates"""
+    __slots__ = ('actor', 'stage', 'requires', 'effects', 'success', 'failure')
+
+    def __init__(self, actor: str, stage: Optional[int], requires: Tuple[Tuple[str, str], ...],
+                 effects: Tuple[Callable[[dict], None], ...],
+                 success: Template, failure: Template):
+        self.actor = actor
+        self.stage = stage
+        self.requires = requires
+        self.effects = effects
+        self.success = success
+        self.failure = failure
+
+
+class SharedState(dict):
+    """A character's starting state, shared read-only by every team that has not changed it yet
+
+    Items are a tuple; own_character() swaps in a private, mutable copy
+    before a team's first write. Pickles by reference to the scenario's
+    template, so teams loaded from a handoff go on sharing it.
+    """
+    __slots__ = ('origin',)
+
+    def __init__(self, origin: Tuple[str, str], state: dict):
+        super().__init__(state)
+        self.origin = origin
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Shared character state is read-only; use puzzle.own_character() before writing")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = __ior__ = _read_only
+
+    def __reduce__(self):
+        return shared_character, self.origin
+
+
+def shared_character(scenario: str, key: str) -> SharedState:
+    return SCENARIOS[scenario].templates[key]
+
+
+def own_character(team: dict, key: str) -> dict:
+    """The team's own copy of a character's state, made on the first write"""
+    character = team[key]
+    if type(character) is SharedState:
+        character = team[key] = dict(character, items=list(character['items']))
+    return character
+
+
+class Scenario:
+    """Everything about a scenario that is not a transition"""
+
+    def __init__(self, name: str, title: str, characters: Dict[str, str],
+                 initial: Dict[str, dict], looks: Dict[str, dict],
+                 stages: List[str], step_stages: List[Tuple[int, Tuple[str, ...]]],
+                 steps: Dict[str, str], failures: Dict[str, Template],
+                 escape_window: float, escape_requires: Dict[str, Tuple[str, str, str]],
+                 hints: List[Tuple[Tuple[str, ...], Dict[str, str]]]):
+        self.name = name
+        self.title = title
+        self.characters = characters
+        self.initial = initial
+        self.looks = looks
+        self.stages = stages
+        self.step_stages = step_stages
+        self.steps = steps
+        self.failures = failures
+        self.escape_window = escape_window
+        self.escape_requires = escape_requires
+        self.hints = hints
+        # Every new team starts out pointing at these (see own_character)
+        self.templates = {
+            key: SharedState((name, key), {
+                'location': start['location'],
+                'items': start['items'],
+                'gate_locked': True,
+                'has_frequency': False,
+                'has_eggs': False,
+                'last_action': None,
+                'hints_used': 0
+            })
+            for key, start in initial.items()
+        }
+
+
+    def stage_after_steps(self, steps: List[str]) -> Optional[int]:
+        """Furthest stage reached through recorded steps alone"""
+        reached = None
+        for stage, required in self.step_stages:
+            if all(step in steps for step in required):
+                reached = stage
+        return reached
+
+    def step_hint(self, steps: List[str], friend: Optional[str]) -> Optional[str]:
+        """First step-based hint whose steps are not all completed yet"""
+        for required, text in self.hints:
+            if any(step not in steps for step in required):
+                return text.get(friend) or text['*']
+        return None
+
+
+# --- Compiled tables ---
+SCENARIOS: Dict[str, Scenario] = {}
+TRANSITIONS: Dict[Tuple[str, str, str, str], Transition] = {}
+
+
+def _character_key(characters: Dict[str, str], name: str, where: str) -> str:
+    if name not in characters:
+        raise ScenarioError(f"{where}: unknown character '{name}'")
+    return characters[name]
+
+
+def _compile_template(spec: Dict[str, Any], characters: Dict[str, str], where: str) -> Template:
+    fields = []
+    for field, value in spec.items():
+        ref = None
+        if isinstance(value, str) and value.startswith("$"):
+            name, _, attr = value[1:].partition(".")
+            ref = (_character_key(characters, name, where), attr)
+            value = None
+        fields.append((field, value, ref))
+    return tuple(fields)
+
+
+def _compile_effect(spec: Dict[str, Any], characters: Dict[str, str], where: str) -> Callable[[dict], None]:
+    key = _character_key(characters, spec.get('character', ''), where)
+
+    if 'add_item' in spec:
+        item = spec['add_item']
+
+        def effect(team: dict) -> None:
+            own_character(team, key)['items'].append(item)
+    elif 'remove_item' in spec:
+        item = spec['remove_item']
+
+        def effect(team: dict) -> None:
+            if item in team[key]['items']:
+                own_character(team, key)['items'].remove(item)
+    elif 'set' in spec:
+        field, value = spec['set'], spec.get('value')
+
+        def effect(team: dict) -> None:
+            own_character(team, key)[field] = value
+    else:
+        raise ScenarioError(f"{where}: effect needs add_item, remove_item or set")
+    return effect
+
+
+def compile_scenario(spec: Dict[str, Any]) -> Scenario:
+    """Validate a scenario definition and register its transitions"""
+    name = spec.get('name')
+    if not name:
+        raise ScenarioError("Scenario needs a name")
+
+    characters: Dict[str, str] = {}
+    initial: Dict[str, dict] = {}
+    looks: Dict[str, dict] = {}
+    for friend, char in spec.get('characters', {}).items():
+        key = char.get('key')
+        if key not in CHARACTER_KEYS:
+            raise ScenarioError(f"{name}: character '{friend}' key must be one of {CHARACTER_KEYS}")
+        characters[friend] = key
+        initial[key] = {'location': char['location'], 'items': tuple(char.get('items', ()))}
+        looks[key] = char['look']
+    if sorted(characters.values()) != sorted(CHARACTER_KEYS):
+        raise ScenarioError(f"{name}: scenario must define exactly the characters {CHARACTER_KEYS}")
+
+    stages = [FIRST_STAGE] + [stage['name'] for stage in spec.get('stages', [])] + [LAST_STAGE]
+    if len(set(stages)) != len(stages):
+        raise ScenarioError(f"{name}: duplicate stage names")
+    step_stages = [
+        (stages.index(stage['name']), tuple(stage['after_steps']))
+        for stage in spec.get('stages', []) if stage.get('after_steps')
+    ]
+
+    steps: Dict[str, str] = {}
+    failures: Dict[str, Template] = {}
+    transitions: Dict[Tuple[str, str, str, str], Transition] = {}
+    for verb in VERBS:
+        action = spec.get('actions', {}).get(verb)
+        if action is None:
+            raise ScenarioError(f"{name}: missing action '{verb}'")
+        where = f"{name}.{verb}"
+        steps[verb] = action['step']
+        failures[verb] = _compile_template(action['failure'], characters, where)
+
+        for t in action.get('transitions', []):
+            actor = _character_key(characters, t['friend'], where)
+            stage = None
+            if 'stage' in t:
+                if t['stage'] not in stages:
+                    raise ScenarioError(f"{where}: unknown stage '{t['stage']}'")
+                stage = stages.index(t['stage'])
+            requires = tuple(
+                (_character_key(characters, r['character'], where), r['has_item'])
+                for r in t.get('requires', [])
+            )
+            effects = tuple(_compile_effect(e, characters, where) for e in t.get('effects', []))
+            success = _compile_template(t['success'], characters, where)
+            failure = _compile_template(t['failure'], characters, where) if 'failure' in t else failures[verb]
+            transitions[(name, t['friend'], verb, t['arg'])] = Transition(actor, stage, requires, effects, success, failure)
+
+    escape = spec.get('escape', {})
+    escape_requires = {
+        r['character']: (_character_key(characters, r['character'], f"{name}.escape"), r['flag'], r['error'])
+        for r in escape.get('requires', [])
+    }
+    hints = [(tuple(h['unless_steps']), h['text']) for h in spec.get('hints', [])]
+
+    scenario = Scenario(name, spec.get('title', name), characters, initial, looks,
+                        stages, step_stages, steps, failures, escape.get('window', 10), escape_requires, hints)
+    SCENARIOS[name] = scenario
+    TRANSITIONS.update(transitions)
+    return scenario
+
+
+def load_scenarios(directory: str = SCENARIO_DIR) -> None:
+    """Compile every scenario file in the directory"""
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(".json"):
+            with open(os.path.join(directory, filename), encoding="utf-8") as f:
+                compile_scenario(json.load(f))
+    if DEFAULT_SCENARIO not in SCENARIOS:
+        raise ScenarioError(f"Default scenario '{DEFAULT_SCENARIO}' not found in {directory}")
+
+
+def render(template: Template, team: dict) -> dict:
+    """Build a response dict from a compiled template"""
+    return {field: team[ref[0]][ref[1]] if ref else value for field, value, ref in template}
+
+
+def dispatch(team: dict, verb: str, friend: str, arg: str, now: float) -> Tuple[dict, Optional[int]]:
+    """Run one action against a team: a single lookup in the transition table
+
+    Returns the response and, when the action succeeded and completes a
+    funnel stage, that stage's index.
+    """
+    transition = TRANSITIONS.get((team['scenario'], friend, verb, arg))
+    if transition is None:
+        return render(SCENARIOS[team['scenario']].failures[verb], team), None
+
+    for key, item in transition.requires:
+        if item not in team[key]['items']:
+            return render(transition.failure, team), None
+
+    for effect in transition.effects:
+        effect(team)
+    own_character(team, transition.actor)['last_action'] = now
+    team['version'] += 1
+    return render(transition.success, team), transition.stage
+
+
+load_scenarios()
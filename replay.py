@@ -0,0 +1,143 @@
+"""Replay captured traffic against a local server.
+
+Reads a capture written with CAPTURE_FILE (see capture.py) and plays it back
+at 1x, 10x or any other speed, or as fast as possible (``--speed max``).
+Requests for the same team are sent in their original order, one at a time;
+different teams run concurrently. Team IDs minted during the capture are
+mapped to the IDs the target server hands out when the create_team
+requests are replayed.
+
+Usage: python replay.py requests.jsonl --url http://localhost:8000 --speed 10
+"""
+import argparse
+import asyncio
+import base64
+import json
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+from urllib.parse import quote
+
+from http_pool import BackendError, ConnectionPool
+
+# Requests that don't belong to a team (root, admin listings) share one lane
+GLOBAL_LANE = None
+REQUEST_TIMEOUT = 30
+
+
+def load_capture(path: str) -> List[dict]:
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            # Skip anything that isn't a capture record
+            if "method" in entry and "path" in entry and "ts" in entry:
+                entries.append(entry)
+    entries.sort(key=lambda e: e["ts"])
+    return entries
+
+
+class Replayer:
+    def __init__(self, pool: ConnectionPool, speed: Optional[float]):
+        self.pool = pool
+        self.speed = speed
+        self.id_map: Dict[str, str] = {}
+        self.latencies: List[float] = []
+        self.sent = 0
+        self.errors = 0
+        self.status_mismatches = 0
+
+    def _rewrite(self, text: str, team_id: Optional[str]) -> str:
+        new_id = self.id_map.get(team_id) if team_id else None
+        return text.replace(team_id, new_id) if new_id else text
+
+    async def _send(self, entry: dict) -> None:
+        team_id = entry.get("team_id")
+        # Captured paths are decoded; the query string is captured as sent
+        path = quote(self._rewrite(entry["path"], team_id), safe="/:@!$&'()*+,;=~")
+        if entry.get("query"):
+            path += "?" + self._rewrite(entry["query"], team_id)
+        if entry.get("body_b64"):
+            content = base64.b64decode(entry["body_b64"])
+        else:
+            content = (entry.get("body") or "").encode("utf-8")
+        headers = [(b"content-type", entry["content_type"].encode("latin-1"))] if entry.get("content_type") else []
+
+        start = time.perf_counter()
+        try:
+            status, _, body = await asyncio.wait_for(self.pool.fetch(entry["method"], path, headers, content),
+                                                     REQUEST_TIMEOUT)
+        except (BackendError, asyncio.TimeoutError):
+            self.errors += 1
+            return
+        self.latencies.append(time.perf_counter() - start)
+        self.sent += 1
+        if entry.get("status") is not None and status != entry["status"]:
+            self.status_mismatches += 1
+        if entry["path"] == "/create_team" and entry.get("team_id") and status == 200:
+            self.id_map[entry["team_id"]] = json.loads(body)["team_id"]
+
+    async def _lane(self, entries: List[dict], t0: float, started: float) -> None:
+        for entry in entries:
+            if self.speed is not None:
+                due = started + (entry["ts"] - t0) / self.speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await self._send(entry)
+
+    async def run(self, entries: List[dict]) -> float:
+        lanes: Dict[Optional[str], List[dict]] = defaultdict(list)
+        for entry in entries:
+            lanes[entry.get("team_id") or GLOBAL_LANE].append(entry)
+        t0 = entries[0]["ts"]
+        started = time.perf_counter()
+        await asyncio.gather(*(self._lane(lane, t0, started) for lane in lanes.values()))
+        return time.perf_counter() - started
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def replay(args) -> bool:
+    entries = load_capture(args.capture)
+    if not entries:
+        print("❌ No captured requests found")
+        return False
+    speed = None if args.speed == "max" else float(args.speed)
+    pool = ConnectionPool(args.url, args.connections)
+    try:
+        replayer = Replayer(pool, speed)
+        elapsed = await replayer.run(entries)
+    finally:
+        await pool.close()
+
+    captured_span = entries[-1]["ts"] - entries[0]["ts"]
+    print(f"Replayed {replayer.sent:,} of {len(entries):,} requests in {elapsed:.2f}s "
+          f"(captured span {captured_span:.2f}s, {replayer.sent / elapsed:,.0f} req/s)")
+    if replayer.latencies:
+        print(f"   latency p50 {percentile(replayer.latencies, 0.5) * 1000:.1f} ms, "
+              f"p99 {percentile(replayer.latencies, 0.99) * 1000:.1f} ms")
+    print(f"   status codes differing from capture: {replayer.status_mismatches:,}, "
+          f"transport errors: {replayer.errors:,}")
+    return replayer.errors == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured traffic against a server")
+    parser.add_argument("capture", help="Capture file written with CAPTURE_FILE")
+    parser.add_argument("--url", default="http://localhost:8000", help="Server base URL")
+    parser.add_argument("--speed", default="1", help="Playback speed multiplier, or 'max'")
+    parser.add_argument("--connections", type=int, default=100, help="Keep-alive connection pool size")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(replay(args)) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Event rooms: per-room team indexes, counters, funnels and leaderboards.
+
+Every team belongs to exactly one room (one event, school or time slot).
+A room keeps its own index of team IDs and normalized team names, a
+search index over those names, its escaped counter, a funnel per scenario
+and a leaderboard kept sorted as teams escape, so room-level queries and
+resets only touch that room's teams.
+"""
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+
+import puzzle
+from funnel import Funnel
+from search import TeamNameIndex, normalize_name
+
+DEFAULT_ROOM = "main"
+
+# (seconds taken, hints used, team_id): fastest first, then fewest hints
+LeaderboardEntry = Tuple[float, int, str]
+
+
+class Room:
+    def __init__(self, name: str):
+        self.name = name
+        self.team_ids: Dict[str, None] = {}  # insertion-ordered set
+        self.names: Dict[str, str] = {}
+        self.search = TeamNameIndex()
+        self.escaped = 0
+        self.funnels: Dict[str, Funnel] = {}
+        self.leaderboard: List[LeaderboardEntry] = []
+
+    def funnel(self, scenario: str) -> Funnel:
+        if scenario not in self.funnels:
+            self.funnels[scenario] = Funnel(puzzle.SCENARIOS[scenario].stages)
+        return self.funnels[scenario]
+
+    def find_by_name(self, team_name: str) -> Optional[str]:
+        return self.names.get(normalize_name(team_name))
+
+    def add(self, team: dict) -> None:
+        self.team_ids[team['team_id']] = None
+        self.names[normalize_name(team['team_name'])] = team['team_id']
+        self.search.add(team['team_id'], team['team_name'])
+
+    def remove(self, team: dict) -> None:
+        self.forget_escape(team)
+        self.team_ids.pop(team['team_id'], None)
+        self.names.pop(normalize_name(team['team_name']), None)
+        self.search.remove(team['team_id'])
+
+    def record_escape(self, team: dict, hints_used: int) -> None:
+        """Count an escape and place the team on the leaderboard"""
+        self.forget_escape(team)
+        entry = (team['end_time'] - team['start_time'], hints_used, team['team_id'])
+        insort(self.leaderboard, entry)
+        team['leaderboard_entry'] = entry
+        self.escaped += 1
+
+    def forget_escape(self, team: dict) -> None:
+        """Undo record_escape, e.g. when an escaped team is reset"""
+        entry = team.get('leaderboard_entry')
+        if entry is None:
+            return
+        index = bisect_left(self.leaderboard, entry)
+        if index < len(self.leaderboard) and self.leaderboard[index] == entry:
+            del self.leaderboard[index]
+        team['leaderboard_entry'] = None
+        self.escaped -= 1
+
+    def __len__(self) -> int:
+        return len(self.team_ids)
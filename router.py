@@ -0,0 +1,578 @@
+"""Consistent-hash router in front of several game server processes.
+
+One process tops out at one core, so ``router:app`` spreads teams over N
+backends running ``main:fast_app`` and forwards requests to them over
+pooled keep-alive connections.
+
+Placement: backend n is started with TEAM_ID_SHARD=n, so every team ID it
+mints encodes its shard (see team_ids.py). Requests that name a team are
+routed by decoding the ID; no lookup table, no probing, and any number of
+router workers agree without sharing state. New teams are placed by
+``create_team`` on a consistent-hash ring keyed by room and normalized
+team name, so a repeated name in the same room still lands on the backend
+that already knows it, and adding a backend only moves 1/N of new
+placements.
+
+Admin aggregates (root counters, all_teams, rooms, leaderboards, funnel,
+search, ...) are fanned out to every backend and merged. Escape key checks
+need no team state and take turns across the backends. Team WebSockets
+(``/ws/{team_id}``, see channels.py) are relayed frame by frame to the
+team's backend, so both friends' sockets meet in the same process. Any
+request can be pinned to one backend with an ``X-Backend: <n>`` header.
+
+Usage:
+    python router.py --spawn 4 --port 8000 --workers 2
+    ROUTER_BACKENDS=http://127.0.0.1:8001,http://127.0.0.1:8002 uvicorn router:app
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import secrets
+import signal
+import subprocess
+import sys
+import time
+from bisect import bisect
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, quote
+from urllib.request import urlopen
+
+import websockets
+
+from admin_cache import AGE_HEADER, BUILD_HEADER
+from escape_keys import SECRET_ENV
+from http_pool import HOP_BY_HOP, BackendError, ConnectionPool, RawHeaders
+from search import normalize_name
+from team_ids import shard_of
+
+VIRTUAL_NODES = 160
+DEFAULT_CONNECTIONS = 200
+DEFAULT_ROOM = "main"
+
+# Written by the pool on requests (responses lose the ones in http_pool.py)
+REWRITTEN_REQUEST = {b"host", b"content-length"}
+BACKEND_HEADER = b"x-backend"
+
+
+def hash64(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent-hash ring with virtual nodes"""
+
+    def __init__(self, nodes: List[int], vnodes: int = VIRTUAL_NODES):
+        points = sorted((hash64(f"backend-{node}#{i}"), node) for node in nodes for i in range(vnodes))
+        self.points = [point for point, _ in points]
+        self.nodes = [node for _, node in points]
+
+    def node_for(self, key: str) -> int:
+        return self.nodes[bisect(self.points, hash64(key)) % len(self.points)]
+
+
+def placement_key(body: bytes) -> str:
+    """Ring key for a create_team body: its room and normalized team name"""
+    try:
+        data = json.loads(body)
+        room = (data.get("room") or "").strip() or DEFAULT_ROOM
+        return f"{room}\0{normalize_name(data['team_name'])}"
+    except (ValueError, KeyError, TypeError, AttributeError):
+        # The backend answers malformed bodies with its own validation error
+        return ""
+
+
+def team_id_in_path(path: str) -> Optional[str]:
+    """The team_id a request path is about, if it is about one team"""
+    parts = path.strip("/").split("/")
+    if len(parts) == 2 and parts[0] in ("team_status", "ws"):
+        return parts[1]
+    if len(parts) == 3 and parts[:2] == ["admin", "reset_team"]:
+        return parts[2]
+    if len(parts) == 4 and parts[:3] == ["admin", "memory", "team"]:
+        return parts[3]
+    if len(parts) == 2 and parts[0] not in ("admin", "docs", "redoc", "verify_key"):
+        return parts[0]
+    return None
+
+
+# --- Merging fanned-out admin responses ---
+# Each merger gets the JSON bodies of the backends that answered 200 and the
+# request's query parameters.
+
+def _sum_fields(bodies: List[dict], fields) -> dict:
+    return {field: sum(body.get(field, 0) for body in bodies) for field in fields}
+
+
+def merge_root(bodies: List[dict], query: dict) -> dict:
+    return {**bodies[0], **_sum_fields(bodies, ("total_teams", "escaped_teams"))}
+
+
+def merge_all_teams(bodies: List[dict], query: dict) -> dict:
+    return {
+        **_sum_fields(bodies, ("total_teams", "escaped_teams", "trapped_teams")),
+        "teams": [team for body in bodies for team in body["teams"]],
+    }
+
+
+def merge_rooms(bodies: List[dict], query: dict) -> dict:
+    rooms: Dict[str, dict] = {}
+    for body in bodies:
+        for room in body["rooms"]:
+            merged = rooms.setdefault(room["room"], {"room": room["room"], "total_teams": 0,
+                                                     "escaped_teams": 0, "trapped_teams": 0})
+            for field in ("total_teams", "escaped_teams", "trapped_teams"):
+                merged[field] += room[field]
+    return {"total_rooms": len(rooms), "rooms": list(rooms.values())}
+
+
+def merge_leaderboard(bodies: List[dict], query: dict) -> dict:
+    limit = int(query.get("limit", 10))
+    entries = [entry for body in bodies for entry in body["leaderboard"]]
+    entries.sort(key=lambda e: (int(e["time_taken"].split()[0]), e["hints_used"], e["team_id"]))
+    return {
+        "room": bodies[0]["room"],
+        "escaped_teams": sum(body["escaped_teams"] for body in bodies),
+        "leaderboard": [{**entry, "rank": rank} for rank, entry in enumerate(entries[:max(limit, 0)], start=1)],
+    }
+
+
+def merge_room_reset(bodies: List[dict], query: dict) -> dict:
+    count = sum(body["teams_reset"] for body in bodies)
+    room = bodies[0]["message"].split("'")[1]
+    return {"message": f"Room '{room}' reset: {count} teams are back at the gate...", "teams_reset": count}
+
+
+def merge_bulk(bodies: List[dict], query: dict) -> dict:
+    """Bulk team reset/delete: add up the teams each backend touched"""
+    field = "teams_reset" if "teams_reset" in bodies[0] else "teams_deleted"
+    count = sum(body[field] for body in bodies)
+    message = f"{count} teams are back at the gate..." if field == "teams_reset" \
+        else f"{count} teams vanished into the Upside Down."
+    return {"message": message, field: count, "took_ms": max(body["took_ms"] for body in bodies)}
+
+
+def merge_funnel(bodies: List[dict], query: dict) -> dict:
+    scenarios: Dict[str, dict] = {}
+    for body in bodies:
+        for name, funnel in body["scenarios"].items():
+            if name not in scenarios:
+                scenarios[name] = json.loads(json.dumps(funnel))
+                for stage in scenarios[name]["stages"]:
+                    stage["dwell_total"] = (stage["avg_dwell_seconds"] or 0) * stage["teams_left"]
+                continue
+            merged = scenarios[name]
+            merged["total_teams"] += funnel["total_teams"]
+            for into, stage in zip(merged["stages"], funnel["stages"]):
+                for field in ("teams_here", "teams_reached", "teams_left"):
+                    into[field] += stage[field]
+                into["dwell_total"] += (stage["avg_dwell_seconds"] or 0) * stage["teams_left"]
+                for bucket, count in stage["dwell_histogram"].items():
+                    into["dwell_histogram"][bucket] += count
+    for funnel in scenarios.values():
+        for stage in funnel["stages"]:
+            total = stage.pop("dwell_total")
+            stage["avg_dwell_seconds"] = round(total / stage["teams_left"], 1) if stage["teams_left"] else None
+    return {"scenarios": scenarios}
+
+
+def merge_search(bodies: List[dict], query: dict) -> dict:
+    limit = max(1, min(int(query.get("limit", 20)), 100))
+    results = [result for body in bodies for result in body["results"]]
+    results.sort(key=lambda r: (r["match"] != "prefix", -r["score"],
+                                r["team_name"].lower() if r["match"] == "prefix" else ""))
+    return {**bodies[0], "took_ms": max(body["took_ms"] for body in bodies), "results": results[:limit]}
+
+
+def merge_counters(bodies: List[dict], query: dict) -> dict:
+    """Sum every numeric field (idempotency stats)"""
+    merged = dict(bodies[0])
+    for key, value in bodies[0].items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and key != "ttl_seconds":
+            merged[key] = sum(body[key] for body in bodies)
+    lookups = merged.get("hits", 0) + merged.get("misses", 0)
+    if "hit_rate" in merged:
+        merged["hit_rate"] = round(merged["hits"] / lookups, 4) if lookups else None
+    return merged
+
+
+def merge_snapshot_cache(bodies: List[dict], query: dict) -> dict:
+    merged = {**bodies[0], **_sum_fields(bodies, ("snapshots", "snapshot_bytes", "building_now", "served_cached",
+                                                  "builds", "waited_for_build"))}
+    requests = merged["served_cached"] + merged["builds"] + merged["waited_for_build"]
+    merged["hit_rate"] = round((requests - merged["builds"]) / requests, 4) if requests else None
+    merged["avg_build_ms"] = round(sum((body["avg_build_ms"] or 0) * body["builds"] for body in bodies)
+                                   / merged["builds"], 2) if merged["builds"] else None
+    merged["longest_build_ms"] = max(body["longest_build_ms"] for body in bodies)
+    return merged
+
+
+def merge_channels(bodies: List[dict], query: dict) -> dict:
+    return {**bodies[0], **_sum_fields(bodies, ("teams_listening", "open_sockets", "opened_total", "messages_sent",
+                                                  "broadcasts", "closed_for_overflow"))}
+
+
+def merge_memory(bodies: List[dict], query: dict) -> dict:
+    teams = sum(body["total_teams"] for body in bodies)
+    return {
+        "total_teams": teams,
+        "avg_bytes_per_team": round(sum(body["avg_bytes_per_team"] * body["total_teams"] for body in bodies)
+                                    / teams) if teams else 0,
+        "total_bytes": sum(body["total_bytes"] for body in bodies),
+        "backends": bodies,
+    }
+
+
+Merger = Callable[[List[dict], dict], dict]
+
+FAN_OUT: Dict[Tuple[str, str], Merger] = {
+    ("GET", "/"): merge_root,
+    ("GET", "/admin/all_teams"): merge_all_teams,
+    ("GET", "/admin/rooms"): merge_rooms,
+    ("GET", "/admin/funnel"): merge_funnel,
+    ("GET", "/admin/search"): merge_search,
+    ("GET", "/admin/idempotency"): merge_counters,
+    ("GET", "/admin/snapshot_cache"): merge_snapshot_cache,
+    ("GET", "/admin/channels"): merge_channels,
+    ("GET", "/admin/memory"): merge_memory,
+    ("POST", "/admin/teams/reset"): merge_bulk,
+    ("POST", "/admin/teams/delete"): merge_bulk,
+}
+ROOM_LEADERBOARD = re.compile(r"^/admin/rooms/([^/]+)/leaderboard$")
+ROOM_RESET = re.compile(r"^/admin/rooms/([^/]+)/reset$")
+CSV_EXPORT = re.compile(r"^/admin/export/[^/]+$")
+# Answered from the request alone (escape_keys.py), so any backend will do
+STATELESS = re.compile(r"^/verify_key/[^/]+$")
+
+
+class Backend:
+    def __init__(self, index: int, url: str, connections: int):
+        self.index = index
+        self.url = url
+        self.pool = ConnectionPool(url, connections)
+        self.forwarded = 0
+
+
+class Router:
+    """ASGI app forwarding each request to the backend that owns its team"""
+
+    def __init__(self, urls: List[str], connections: int = DEFAULT_CONNECTIONS):
+        if not urls:
+            raise ValueError("The router needs at least one backend (set ROUTER_BACKENDS)")
+        self.backends = [Backend(index, url, connections) for index, url in enumerate(urls)]
+        self.ring = HashRing([backend.index for backend in self.backends])
+        self.fanned_out = 0
+        self.next_stateless = 0
+
+    def backend_for_team(self, team_id: str) -> Backend:
+        shard = shard_of(team_id)
+        if shard is None or shard >= len(self.backends):
+            # Malformed or foreign ID: any backend answers 404 the same way
+            return self.backends[0]
+        return self.backends[shard]
+
+    # --- ASGI plumbing ---
+
+    @staticmethod
+    async def _read_body(receive) -> Optional[bytes]:
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return None
+            body.extend(message.get("body", b""))
+            if not message.get("more_body"):
+                return bytes(body)
+
+    @staticmethod
+    async def _respond(send, status: int, headers: RawHeaders, body: bytes) -> None:
+        headers = [*headers, (b"content-length", str(len(body)).encode("latin-1"))]
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    async def _respond_json(self, send, status: int, content, headers: RawHeaders = ()) -> None:
+        body = json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        await self._respond(send, status, [(b"content-type", b"application/json"), *headers], body)
+
+    async def _forward(self, backend: Backend, scope, headers: RawHeaders, body: bytes, send) -> None:
+        try:
+            status, response_headers, chunks = await backend.pool.request(scope["method"], self._url(scope),
+                                                                          headers, body)
+        except BackendError as error:
+            await self._respond_json(send, 502, {"detail": f"Backend {backend.index} unavailable: {error}"})
+            return
+        backend.forwarded += 1
+        try:
+            if b"content-length" in dict(response_headers) or scope["method"] == "HEAD":
+                # One-piece bodies go out in one message, with the backend's content-length
+                content = b"".join([chunk async for chunk in chunks])
+                await send({"type": "http.response.start", "status": status, "headers": response_headers})
+                await send({"type": "http.response.body", "body": content})
+                return
+            await send({"type": "http.response.start", "status": status, "headers": response_headers})
+            async for chunk in chunks:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            await chunks.aclose()
+
+    @staticmethod
+    def _url(scope) -> str:
+        """The request target as the client sent it, still percent-encoded"""
+        raw_path = scope.get("raw_path")
+        path = raw_path.decode("latin-1") if raw_path else quote(scope["path"])
+        query = scope.get("query_string", b"")
+        return path + ("?" + query.decode("latin-1") if query else "")
+
+    async def _fan_out(self, scope, headers: RawHeaders, body: bytes, send,
+                       merge: Callable[[List[dict]], dict]) -> None:
+        self.fanned_out += 1
+
+        async def ask(backend: Backend):
+            response = await backend.pool.fetch(scope["method"], self._url(scope), headers, body)
+            backend.forwarded += 1
+            return response
+
+        try:
+            responses = await asyncio.gather(*(ask(backend) for backend in self.backends))
+        except BackendError as error:
+            await self._respond_json(send, 502, {"detail": f"Backend unavailable: {error}"})
+            return
+        ok = [json.loads(content) for status, _, content in responses if status == 200]
+        if not ok:
+            # Every backend refused (unknown room, bad parameter...): pass the first answer on
+            status, response_headers, content = responses[0]
+            await self._respond(send, status, [h for h in response_headers if h[0] != b"content-length"], content)
+            return
+        # A merged snapshot is as old as its oldest part, and took as long as the slowest
+        snapshot_headers = []
+        for name in (AGE_HEADER, BUILD_HEADER):
+            values = [float(value) for status, response_headers, _ in responses if status == 200
+                      for header, value in response_headers if header == name]
+            if values:
+                snapshot_headers.append((name, f"{max(values):.1f}".encode("latin-1")))
+        await self._respond_json(send, 200, merge(ok), snapshot_headers)
+
+    async def _export(self, scope, headers: RawHeaders, body: bytes, send) -> None:
+        """CSV exports from every backend, concatenated under one header row"""
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        if query.get("format", ["csv"])[0] != "csv":
+            await self._respond_json(send, 400, {"detail": "The router only merges CSV exports. "
+                                                           "Send X-Backend: <n> to export from one backend"})
+            return
+        started = False
+        for backend in self.backends:
+            try:
+                status, response_headers, chunks = await backend.pool.request("GET", self._url(scope), headers, b"")
+            except BackendError as error:
+                if not started:
+                    await self._respond_json(send, 502, {"detail": f"Backend {backend.index} unavailable: {error}"})
+                # Once streaming, the only way to report a failure is to cut the response short
+                return
+            try:
+                if not started:
+                    if status != 200:
+                        await self._respond(send, status, [h for h in response_headers if h[0] != b"content-length"],
+                                            b"".join([chunk async for chunk in chunks]))
+                        return
+                    # The merged body is longer than the first backend's
+                    await send({"type": "http.response.start", "status": 200,
+                                "headers": [h for h in response_headers if h[0] != b"content-length"]})
+                    started = True
+                    skip_header = False
+                else:
+                    skip_header = True
+                async for chunk in chunks:
+                    if skip_header:
+                        newline = chunk.find(b"\n")
+                        if newline < 0:
+                            continue
+                        chunk, skip_header = chunk[newline + 1:], False
+                    if chunk:
+                        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            finally:
+                await chunks.aclose()
+        await send({"type": "http.response.body", "body": b""})
+
+    async def _proxy_websocket(self, scope, receive, send) -> None:
+        """Relay a WebSocket to its team's backend until either side closes"""
+        if (await receive())["type"] != "websocket.connect":
+            return
+        team_id = team_id_in_path(scope["path"])
+        backend = self.backend_for_team(team_id) if team_id is not None else self.backends[0]
+        url = "ws" + backend.url[len("http"):] + self._url(scope)
+        try:
+            upstream = await websockets.connect(url, subprotocols=scope.get("subprotocols") or None)
+        except (OSError, asyncio.TimeoutError, websockets.WebSocketException):
+            # Closing before accepting turns the handshake down with a 403
+            await send({"type": "websocket.close", "code": 1011})
+            return
+        backend.forwarded += 1
+        await send({"type": "websocket.accept", "subprotocol": upstream.subprotocol})
+
+        async def to_client():
+            try:
+                async for message in upstream:
+                    if isinstance(message, str):
+                        await send({"type": "websocket.send", "text": message})
+                    else:
+                        await send({"type": "websocket.send", "bytes": message})
+            except websockets.ConnectionClosed:
+                pass
+            await send({"type": "websocket.close", "code": upstream.close_code or 1000})
+
+        async def to_backend():
+            while True:
+                message = await receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+                text = message.get("text")
+                await upstream.send(text if text is not None else message["bytes"])
+
+        # Whichever side goes first ends the relay; a failed send just ends its pump
+        pumps = [asyncio.ensure_future(to_client()), asyncio.ensure_future(to_backend())]
+        try:
+            await asyncio.wait(pumps, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for pump in pumps:
+                pump.cancel()
+            await asyncio.gather(*pumps, return_exceptions=True)
+            await upstream.close()
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                for backend in self.backends:
+                    await backend.pool.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] == "websocket":
+            await self._proxy_websocket(scope, receive, send)
+            return
+        if scope["type"] != "http":
+            raise RuntimeError(f"The router does not forward {scope['type']} connections")
+
+        body = await self._read_body(receive)
+        if body is None:
+            return
+        headers = [(name, value) for name, value in scope["headers"]
+                   if name not in HOP_BY_HOP and name not in REWRITTEN_REQUEST]
+        method, path = scope["method"], scope["path"]
+
+        pinned = next((value for name, value in headers if name == BACKEND_HEADER), None)
+        if pinned is not None:
+            try:
+                backend = self.backends[int(pinned)]
+            except (ValueError, IndexError):
+                await self._respond_json(send, 400, {"detail": f"X-Backend must be 0-{len(self.backends) - 1}"})
+                return
+            await self._forward(backend, scope, headers, body, send)
+            return
+
+        if path == "/create_team":
+            await self._forward(self.backends[self.ring.node_for(placement_key(body))], scope, headers, body, send)
+            return
+        merge = FAN_OUT.get((method, path))
+        if merge is None and method == "GET" and ROOM_LEADERBOARD.match(path):
+            merge = merge_leaderboard
+        if merge is None and method == "POST" and ROOM_RESET.match(path):
+            merge = merge_room_reset
+        if merge is not None:
+            query = {key: values[0] for key, values in parse_qs(scope.get("query_string", b"").decode()).items()}
+            await self._fan_out(scope, headers, body, send, lambda bodies: merge(bodies, query))
+            return
+        if method == "GET" and STATELESS.match(path):
+            self.next_stateless = (self.next_stateless + 1) % len(self.backends)
+            await self._forward(self.backends[self.next_stateless], scope, headers, body, send)
+            return
+        if method == "GET" and CSV_EXPORT.match(path):
+            await self._export(scope, headers, body, send)
+            return
+        team_id = team_id_in_path(path)
+        if team_id is not None:
+            await self._forward(self.backend_for_team(team_id), scope, headers, body, send)
+            return
+        if path.startswith("/admin/"):
+            await self._respond_json(send, 400, {"detail": "The router does not aggregate this endpoint. "
+                                                           "Send X-Backend: <n> to address one backend"})
+            return
+        # Docs, OpenAPI schema and anything else backend-independent
+        await self._forward(self.backends[0], scope, headers, body, send)
+
+
+def backend_urls() -> List[str]:
+    return [url.strip() for url in os.environ.get("ROUTER_BACKENDS", "").split(",") if url.strip()]
+
+
+app = Router(backend_urls(), int(os.environ.get("ROUTER_CONNECTIONS", DEFAULT_CONNECTIONS))) \
+    if backend_urls() else None
+
+
+def spawn_backends(count: int, base_port: int, host: str = "127.0.0.1") -> Tuple[List[subprocess.Popen], List[str]]:
+    """Start `count` backends of main:fast_app, backend n with TEAM_ID_SHARD=n"""
+    processes, urls = [], []
+    # Any backend may be asked to verify a key another one signed
+    secret = os.environ.get(SECRET_ENV) or secrets.token_hex(32)
+    for index in range(count):
+        port = base_port + index
+        env = {**os.environ, "TEAM_ID_SHARD": str(index), SECRET_ENV: secret}
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:fast_app", "--host", host, "--port", str(port),
+             "--log-level", "warning"],
+            env=env, cwd=os.path.dirname(os.path.abspath(__file__))))
+        urls.append(f"http://{host}:{port}")
+    return processes, urls
+
+
+def wait_until_up(urls: List[str], timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    for url in urls:
+        while True:
+            try:
+                urlopen(url + "/openapi.json", timeout=1.0).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Backend {url} did not start")
+                time.sleep(0.1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Route teams to several game server processes")
+    parser.add_argument("--spawn", type=int, default=0, help="Start this many local backends")
+    parser.add_argument("--backend", action="append", default=[],
+                        help="Existing backend URL; the nth one must run with TEAM_ID_SHARD=n")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="Router worker processes")
+    args = parser.parse_args()
+
+    processes, urls = spawn_backends(args.spawn, args.port + 1) if args.spawn else ([], [])
+    urls = args.backend + urls
+    if not urls:
+        parser.error("give --spawn N or at least one --backend URL")
+    try:
+        wait_until_up(urls)
+        os.environ["ROUTER_BACKENDS"] = ",".join(urls)
+        print(f"Routing {len(urls)} backends: {', '.join(urls)}")
+        import uvicorn
+        uvicorn.run("router:app", host=args.host, port=args.port, workers=args.workers, log_level="warning")
+    finally:
+        for process in processes:
+            process.send_signal(signal.SIGINT)
+        for process in processes:
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""Background housekeeping jobs and event-loop lag monitoring.
+
+``Scheduler`` runs periodic jobs from a single task on the event loop.
+Every run is pushed back by a random jitter, so jobs sharing an interval
+(and processes sharing a host) do not all fire at once, and every job gets
+a budget: a run does at most that much work and leaves the rest to the
+next one, which comes early while a backlog remains. No run holds the loop
+for long, however much work piles up.
+
+``LoopMonitor`` measures event-loop lag: a heartbeat sleeps for a fixed
+interval and records how late it wakes up. A watchdog thread notices when
+the heartbeat is overdue and looks at what the loop is stuck in: the
+request (from ``ActiveRequests``, an ASGI middleware) and the line being
+run, so every stall over the threshold is logged against its route.
+"""
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+# A job with work left over runs again this soon instead of waiting a full interval
+CATCH_UP_DELAY = 0.01
+MAX_STALLS = 50
+MAX_ROLLUPS = 60
+MAX_SAMPLES = 10_000
+
+# Set on the scope by the outermost ActiveRequests so inner copies skip the request
+SCOPE_MARKER = "scheduler.tracked"
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class Job:
+    """A periodic job: run(budget) does at most `budget` units of work and returns how many it did"""
+
+    def __init__(self, name: str, interval: float, run: Callable[[int], int], budget: int, jitter: float):
+        self.name = name
+        self.interval = interval
+        self.run = run
+        self.budget = budget
+        self.jitter = jitter
+        self.runs = 0
+        self.work = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.next_run = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "interval_seconds": self.interval,
+            "budget": self.budget,
+            "runs": self.runs,
+            "work_done": self.work,
+            "errors": self.errors,
+            "avg_ms": round(self.total_seconds / self.runs * 1000, 3) if self.runs else None,
+            "max_ms": round(self.max_seconds * 1000, 3),
+            "next_run_in_seconds": round(max(0.0, self.next_run - time.monotonic()), 3),
+        }
+
+
+class Scheduler:
+    """Runs every registered job from one task, soonest first"""
+
+    def __init__(self):
+        self.jobs: List[Job] = []
+        self.task: Optional[asyncio.Task] = None
+
+    def add(self, name: str, interval: float, run: Callable[[int], int], budget: int = 1000,
+            jitter: float = 0.1) -> Job:
+        """Register a job; jitter is the fraction of the interval each run may move by"""
+        job = Job(name, interval, run, budget, jitter)
+        job.next_run = time.monotonic() + self._delay(job)
+        self.jobs.append(job)
+        return job
+
+    @staticmethod
+    def _delay(job: Job) -> float:
+        return job.interval * (1 + random.uniform(-job.jitter, job.jitter))
+
+    def start(self) -> None:
+        if self.task is None:
+            now = time.monotonic()
+            for job in self.jobs:
+                job.next_run = now + self._delay(job)
+            self.task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def _run(self) -> None:
+        while self.jobs:
+            job = min(self.jobs, key=lambda candidate: candidate.next_run)
+            delay = job.next_run - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            job.next_run = time.monotonic() + self._run_job(job)
+
+    def _run_job(self, job: Job) -> float:
+        """Run a job once; returns the delay until its next run"""
+        started = time.perf_counter()
+        try:
+            done = job.run(job.budget)
+        except Exception as error:
+            job.errors += 1
+            print(f"Job {job.name} failed: {error!r}")
+            done = 0
+        elapsed = time.perf_counter() - started
+        job.runs += 1
+        job.work += done
+        job.total_seconds += elapsed
+        job.max_seconds = max(job.max_seconds, elapsed)
+        return CATCH_UP_DELAY if done >= job.budget else self._delay(job)
+
+    def stats(self) -> List[dict]:
+        return [job.stats() for job in self.jobs]
+
+
+class LoopMonitor:
+    """Event-loop lag samples, per-interval rollups and a log of stalls over the threshold"""
+
+    def __init__(self, interval: float = 0.05, threshold: float = 0.1):
+        self.interval = interval
+        self.threshold = threshold
+        self.lag = 0.0
+        self.samples: Deque[float] = deque(maxlen=MAX_SAMPLES)
+        self.rollups: Deque[dict] = deque(maxlen=MAX_ROLLUPS)
+        self.stalls: Deque[dict] = deque(maxlen=MAX_STALLS)
+        self.stall_count = 0
+        # Request scopes by the task serving them, kept up to date by ActiveRequests
+        self.active: Dict[asyncio.Task, dict] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.loop_thread: Optional[int] = None
+        self.task: Optional[asyncio.Task] = None
+        self.stopping = threading.Event()
+        self.last_beat = time.monotonic()
+        self.suspect: Optional[dict] = None
+
+    def start(self) -> None:
+        if self.task is not None:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self.stopping.clear()
+        self.task = self.loop.create_task(self._heartbeat())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+    def stop(self) -> None:
+        self.stopping.set()
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def _heartbeat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, time.monotonic() - expected)
+            self.samples.append(self.lag)
+            self.last_beat = time.monotonic()
+            if self.lag >= self.threshold:
+                self._record_stall(self.suspect or {"route": None, "location": None})
+            self.suspect = None
+
+    def _record_stall(self, suspect: dict) -> None:
+        self.stall_count += 1
+        stall = {"at": time.time(), "blocked_ms": round(self.lag * 1000, 1), **suspect}
+        self.stalls.append(stall)
+        print(f"Event loop blocked for {stall['blocked_ms']:.0f} ms in {suspect['route'] or 'no request'}"
+              f" at {suspect['location'] or 'unknown location'}")
+
+    def _watch(self) -> None:
+        """Watchdog thread: catch the loop while it is stuck"""
+        while not self.stopping.wait(self.interval / 2):
+            overdue = time.monotonic() - self.last_beat - self.interval
+            # Look early: a stall that ends before the next look goes unexplained
+            if overdue >= self.threshold / 2 and self.suspect is None:
+                self.suspect = self._inspect()
+
+    def _inspect(self) -> dict:
+        task = asyncio.current_task(self.loop)
+        scope = self.active.get(task) if task is not None else None
+        route = None
+        if scope is not None:
+            endpoint = scope.get("endpoint")
+            route = f"{scope.get('method', 'WS')} {scope['path']}"
+            if endpoint is not None:
+                route += f" ({getattr(endpoint, '__name__', endpoint)})"
+        # Blame the innermost frame in this codebase rather than the library it called into
+        frame = sys._current_frames().get(self.loop_thread)
+        location = None
+        while frame is not None:
+            if location is None or frame.f_code.co_filename.startswith(SOURCE_DIR):
+                location = f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno} {frame.f_code.co_name}"
+                if frame.f_code.co_filename.startswith(SOURCE_DIR):
+                    break
+            frame = frame.f_back
+        return {"route": route, "location": location}
+
+    def rollup(self, budget: int = MAX_SAMPLES) -> int:
+        """Fold the samples since the last rollup into one summary; returns how many were folded"""
+        count = min(budget, len(self.samples))
+        if not count:
+            return 0
+        window = sorted(self.samples.popleft() for _ in range(count))
+        self.rollups.append({
+            "at": time.time(),
+            "samples": count,
+            "p50_ms": round(window[count // 2] * 1000, 2),
+            "p99_ms": round(window[min(count - 1, int(count * 0.99))] * 1000, 2),
+            "max_ms": round(window[-1] * 1000, 2),
+        })
+        return count
+
+    def stats(self) -> dict:
+        return {
+            "lag_ms": round(self.lag * 1000, 2),
+            "threshold_ms": round(self.threshold * 1000, 1),
+            "stalls": self.stall_count,
+            "in_flight_requests": len(self.active),
+            "recent_stalls": list(self.stalls),
+            "rollups": list(self.rollups),
+        }
+
+
+class ActiveRequests:
+    """ASGI middleware recording which request each task is serving, for LoopMonitor"""
+
+    def __init__(self, app, monitor: LoopMonitor):
+        self.app = app
+        self.monitor = monitor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket") or scope.get(SCOPE_MARKER):
+            await self.app(scope, receive, send)
+            return
+        scope[SCOPE_MARKER] = True
+        task = asyncio.current_task()
+        self.monitor.active[task] = scope
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.monitor.active.pop(task, None)
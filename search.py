@@ -0,0 +1,127 @@
+"""Prefix and typo-tolerant search over normalized team names.
+
+``TeamNameIndex`` keeps two structures up to date as teams come and go:
+
+- a sorted array of (name, team_id) for prefix queries: one binary
+  search finds the first match, with no per-character trie nodes;
+- trigram postings (trigram -> team IDs) for fuzzy queries. Candidates
+  are the teams sharing the query's rarest trigrams; they are ranked by
+  Dice similarity of their trigram sets, so a typo or two still finds the
+  team while the work stays bounded however many teams there are.
+"""
+from bisect import bisect_left, insort
+from collections import Counter
+from heapq import nlargest
+from typing import Dict, Iterable, List, Set, Tuple
+
+# Posting lists scanned per fuzzy query before settling on the candidates so far
+MAX_SCANNED_POSTINGS = 20_000
+# Candidates rescored exactly, per requested result
+RESCORE_FACTOR = 5
+MIN_SIMILARITY = 0.25
+MODES = ("auto", "prefix", "fuzzy")
+
+
+def normalize_name(name: str) -> str:
+    """Team names are unique per room, ignoring case and surrounding spaces"""
+    return name.lower().strip()
+
+
+def trigrams(name: str) -> Set[str]:
+    """Trigrams of a normalized name, padded so word starts weigh more"""
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(query_grams: Set[str], name: str) -> float:
+    """Dice coefficient between two trigram sets"""
+    grams = trigrams(name)
+    return 2 * len(query_grams & grams) / (len(query_grams) + len(grams))
+
+
+class TeamNameIndex:
+    """Sorted names plus trigram postings, for prefix and fuzzy lookups"""
+
+    def __init__(self):
+        self.sorted_names: List[Tuple[str, str]] = []
+        self.postings: Dict[str, Set[str]] = {}
+        self.names: Dict[str, str] = {}  # team_id -> normalized name
+
+    def add(self, team_id: str, team_name: str) -> None:
+        if team_id in self.names:
+            self.remove(team_id)
+        name = normalize_name(team_name)
+        self.names[team_id] = name
+        insort(self.sorted_names, (name, team_id))
+        for gram in trigrams(name):
+            self.postings.setdefault(gram, set()).add(team_id)
+
+    def remove(self, team_id: str) -> None:
+        name = self.names.pop(team_id, None)
+        if name is None:
+            return
+        index = bisect_left(self.sorted_names, (name, team_id))
+        if index < len(self.sorted_names) and self.sorted_names[index] == (name, team_id):
+            del self.sorted_names[index]
+        for gram in trigrams(name):
+            ids = self.postings.get(gram)
+            if ids is not None:
+                ids.discard(team_id)
+                if not ids:
+                    del self.postings[gram]
+
+    def prefix(self, query: str, limit: int) -> List[Tuple[float, str]]:
+        """(score, team_id) for names starting with the query, alphabetically"""
+        query = normalize_name(query)
+        start = bisect_left(self.sorted_names, (query,))
+        results = []
+        for name, team_id in self.sorted_names[start:start + limit]:
+            if not name.startswith(query):
+                break
+            results.append((1.0, team_id))
+        return results
+
+    def fuzzy(self, query: str, limit: int) -> List[Tuple[float, str]]:
+        """(score, team_id) for the names most similar to the query, best first"""
+        query_grams = trigrams(normalize_name(query))
+        # Rarest trigrams first: they narrow the candidates the most
+        postings = sorted((self.postings[gram] for gram in query_grams if gram in self.postings), key=len)
+        shared: Counter = Counter()
+        scanned = 0
+        for ids in postings:
+            if shared and scanned + len(ids) > MAX_SCANNED_POSTINGS:
+                break
+            shared.update(ids)
+            scanned += len(ids)
+
+        candidates = nlargest(limit * RESCORE_FACTOR, shared.items(), key=lambda item: item[1])
+        scored = [(similarity(query_grams, self.names[team_id]), team_id) for team_id, _ in candidates]
+        scored = [(round(score, 3), team_id) for score, team_id in scored if score >= MIN_SIMILARITY]
+        scored.sort(key=lambda item: (-item[0], self.names[item[1]]))
+        return scored[:limit]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+def search(indexes: Iterable[TeamNameIndex], query: str, mode: str, limit: int) -> List[Tuple[str, float, str]]:
+    """(match, score, team_id) across indexes: prefix matches alphabetically, then
+    fuzzy matches best first; "auto" mode tries both"""
+    prefixed: List[Tuple[str, str]] = []
+    fuzzy: List[Tuple[float, str, TeamNameIndex]] = []
+    for index in indexes:
+        if mode in ("auto", "prefix"):
+            prefixed.extend((index.names[team_id], team_id) for _, team_id in index.prefix(query, limit))
+        if mode in ("auto", "fuzzy"):
+            fuzzy.extend((score, team_id, index) for score, team_id in index.fuzzy(query, limit))
+
+    results = [("prefix", 1.0, team_id) for _, team_id in sorted(prefixed)[:limit]]
+    seen = {team_id for _, _, team_id in results}
+    fuzzy.sort(key=lambda item: (-item[0], item[2].names[item[1]]))
+    for score, team_id, _ in fuzzy:
+        if len(results) >= limit:
+            break
+        if team_id not in seen:
+            results.append(("fuzzy", score, team_id))
+            seen.add(team_id)
+    return results
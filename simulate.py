@@ -0,0 +1,362 @@
+"""Deterministic, in-process game simulation on a virtual clock.
+
+Plays many randomized games in-process against main.py with ``main.clock``
+swapped for a ``VirtualClock``, so escape windows and hint cooldowns pass
+instantly. Requests go straight to the route handlers (bodies validated
+through their pydantic models, ``HTTPException`` turned into its status)
+or, for the looks and status, the fast path handlers; no HTTP stack is
+involved. Requests that carry an Idempotency-Key go through main's
+``IdempotencyMiddleware`` and store in front of the same handler calls, so
+replays are still checked; ``--asgi`` sends every request through the full
+ASGI ``app`` instead. Games mix in wrong actions,
+hint requests, duplicate and late escape attempts and mid-game resets.
+After every game the team's state is checked against a set of invariants
+and a model of what should have happened.
+
+Usage: python simulate.py --games 100000 --seed 1
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+from clock import VirtualClock
+from idempotency import IdempotencyMiddleware
+
+# The winning path, in order: (method, path template, body)
+WALKTHROUGH = [
+    ("GET", "/{t}/eleven", None),
+    ("GET", "/{t}/mike", None),
+    ("POST", "/{t}/send_item", {"from_friend": "Mike", "item": "demogorgon tooth"}),
+    ("PUT", "/{t}/use_item", {"friend": "Eleven", "action": "combine_radio_tooth"}),
+    ("PATCH", "/{t}/fix", {"friend": "Eleven", "action": "scan_frequency"}),
+    ("DELETE", "/{t}/remove", {"friend": "Mike", "code": "0110"}),
+    ("HEAD", "/{t}/status", None),
+    ("OPTIONS", "/{t}/escape", None),
+]
+
+# Actions that never succeed; players also jump ahead to later walkthrough steps
+WRONG_ACTIONS = [
+    ("POST", "/{t}/send_item", {"from_friend": "Eleven", "item": "radio"}),
+    ("POST", "/{t}/send_item", {"from_friend": "Mike", "item": "broken walkie-talkie"}),
+    ("PUT", "/{t}/use_item", {"friend": "Mike", "action": "combine_radio_tooth"}),
+    ("PATCH", "/{t}/fix", {"friend": "Eleven", "action": "scan_static"}),
+    ("DELETE", "/{t}/remove", {"friend": "Mike", "code": "1234"}),
+    ("DELETE", "/{t}/remove", {"friend": "Eleven", "code": "0110"}),
+    ("POST", "/{t}/escape", {"friend": "Eleven"}),
+    ("GET", "/{t}/key", None),
+]
+
+# Requests served by a fast path handler in main: (method, last path segment) -> handler
+FAST_HANDLERS = {
+    ("GET", "eleven"): "fast_eleven_look",
+    ("GET", "mike"): "fast_mike_look",
+    ("HEAD", "status"): "fast_quick_status",
+}
+
+ESCAPE_PATTERNS = ("together", "duplicate", "late")
+
+# Games are spread over a few event rooms; None leaves the room to the server default
+ROOMS = (None, "hawkins-high", "hawkins-middle")
+
+
+async def call_asgi(app, method: str, path: str, body: bytes = b"",
+                    headers=()) -> Tuple[int, List[Tuple[bytes, bytes]], bytes]:
+    """Run one request through an ASGI app in-process; returns (status, headers, body)"""
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "path": path, "raw_path": path.encode(), "root_path": "",
+        "scheme": "http", "query_string": query.encode(), "server": ("sim", 80), "client": ("sim", 1),
+        "headers": [(b"host", b"sim"), (b"content-length", str(len(body)).encode()), *headers],
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    response = {"status": None, "headers": [], "body": b""}
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = [tuple(h) for h in message.get("headers", [])]
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+
+    await app(scope, receive, send)
+    return response["status"], response["headers"], response["body"]
+
+
+class Simulation:
+    def __init__(self, main, clock: VirtualClock, seed: int, asgi: bool = False):
+        self.main = main
+        self.asgi = asgi
+        # The real middleware and store, in front of the direct handler calls instead of FastAPI
+        self.idempotent = IdempotencyMiddleware(self.handler_app, store=main.idempotency_store,
+                                                team_id_of=main.team_id_in_path)
+        self.clock = clock
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.games = 0
+        self.escaped = 0
+        self.violations: List[str] = []
+
+    async def request(self, method: str, path: str, body: Optional[dict] = None,
+                      idempotency_key: Optional[str] = None):
+        self.requests += 1
+        app = self.main.app
+        if not self.asgi:
+            if idempotency_key is not None:
+                app = self.idempotent
+            else:
+                result = await self.call_handler(method, path, body)
+                if result is not None:
+                    return result
+        payload = json.dumps(body).encode() if body is not None else b""
+        headers = [(b"content-type", b"application/json")] if body is not None else []
+        if idempotency_key is not None:
+            headers.append((b"idempotency-key", idempotency_key.encode()))
+        status, _, raw = await call_asgi(app, method, path, payload, headers)
+        return status, (json.loads(raw) if raw else None)
+
+    async def handler_app(self, scope, receive, send):
+        """ASGI app over call_handler; only sees the game actions the idempotency middleware handles"""
+        message = await receive()
+        body = json.loads(message["body"]) if message["body"] else None
+        status, response = await self.call_handler(scope["method"], scope["path"], body)
+        raw = json.dumps(response).encode() if response is not None else b""
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": raw})
+
+    async def call_handler(self, method: str, path: str, body: Optional[dict]):
+        """Run a request as a direct handler call; None for anything it can't route"""
+        main = self.main
+        path, _, query = path.partition("?")
+        team_id, _, action = path.lstrip("/").rpartition("/")
+        try:
+            if path == "/create_team":
+                return 200, await main.create_new_team(main.TeamCreate(**body))
+            if path.startswith("/admin/reset_team/"):
+                return 200, await main.reset_team(action)
+            if body is not None and action in main.CHANNEL_ACTIONS:
+                model, handler = main.CHANNEL_ACTIONS[action]
+                return 200, await handler(team_id, model(**body))
+            if (method, action) in FAST_HANDLERS:
+                handled = getattr(main, FAST_HANDLERS[method, action])(team_id, [])
+                if handled is None:
+                    return None
+                status, _, raw = handled
+                return status, (json.loads(raw) if raw else None)
+            if method == "OPTIONS" and action == "escape":
+                return (await main.escape_options(team_id)).status_code, None
+            if method == "GET" and action == "hint":
+                friend = query.partition("friend=")[2] or None
+                return 200, await main.get_hint(team_id, friend)
+            if method == "GET" and action == "key":
+                return 200, await main.get_escape_key(team_id)
+        except ValidationError as e:
+            return 422, {"detail": e.errors()}
+        except HTTPException as e:
+            return e.status_code, {"detail": e.detail}
+        return None
+
+    def tick(self, low: float = 0.1, high: float = 3.0) -> None:
+        self.clock.advance(self.rng.uniform(low, high))
+
+    def fail(self, team_id: str, message: str) -> None:
+        if len(self.violations) < 50:
+            self.violations.append(f"{team_id}: {message}")
+
+    async def hint(self, team_id: str, model: dict) -> None:
+        friend = self.rng.choice(("Eleven", "Mike", None))
+        path = f"/{team_id}/hint" + (f"?friend={friend}" if friend else "")
+        status, body = await self.request("GET", path)
+        if status != 200:
+            self.fail(team_id, f"hint returned {status}")
+        elif "hint" in body and friend:
+            model['hints'] += 1
+
+    async def play_walkthrough(self, team_id: str, model: dict) -> bool:
+        """Play the winning path with noise; False if the game was reset midway"""
+        done = set()
+        for index, (method, template, body) in enumerate(WALKTHROUGH):
+            if self.rng.random() < 0.3:
+                if self.rng.random() < 0.5 or index == len(WALKTHROUGH) - 1:
+                    ahead, wrong = None, self.rng.choice(WRONG_ACTIONS)
+                else:
+                    ahead = self.rng.randrange(index + 1, len(WALKTHROUGH))
+                    wrong = WALKTHROUGH[ahead]
+                status, response = await self.request(wrong[0], wrong[1].format(t=team_id), wrong[2])
+                if ahead is not None and status == 200 and (wrong[2] is None or response.get("success")):
+                    # Out of order, but its preconditions were already met
+                    done.add(ahead)
+                self.tick()
+            if index in done:
+                continue
+            if self.rng.random() < 0.1:
+                await self.hint(team_id, model)
+            if self.rng.random() < 0.01:
+                status, _ = await self.request("POST", f"/admin/reset_team/{team_id}")
+                if status != 200:
+                    self.fail(team_id, f"reset returned {status}")
+                model['hints'] = 0
+                return False
+            # Some players retry actions on a flaky connection, with an Idempotency-Key
+            key = f"sim-{self.requests}" if body is not None and self.rng.random() < 0.1 else None
+            status, response = await self.request(method, template.format(t=team_id), body, key)
+            if status != 200:
+                self.fail(team_id, f"{method} {template} returned {status}")
+            elif body is not None and response and response.get("success") is False:
+                self.fail(team_id, f"{method} {template} failed: {response.get('message')}")
+            if key is not None:
+                self.tick(0.0, 1.0)
+                retry_status, retry = await self.request(method, template.format(t=team_id), body, key)
+                if (retry_status, retry) != (status, response):
+                    self.fail(team_id, f"idempotent retry of {method} {template} got a different response")
+            self.tick()
+        return True
+
+    async def escape(self, team_id: str, window: float) -> None:
+        pattern = self.rng.choice(ESCAPE_PATTERNS)
+        attempts = [("Eleven", 0.0)]
+        if pattern == "duplicate":
+            attempts += [("Eleven", self.rng.uniform(0.0, window)), ("Mike", self.rng.uniform(0.0, window))]
+        elif pattern == "late":
+            attempts += [("Mike", window + self.rng.uniform(0.5, 30.0)), ("Eleven", self.rng.uniform(0.0, window))]
+        else:
+            attempts += [("Mike", self.rng.uniform(0.0, window))]
+
+        for index, (friend, delay) in enumerate(attempts):
+            self.clock.advance(delay)
+            status, body = await self.request("POST", f"/{team_id}/escape", {"friend": friend})
+            expected = index == len(attempts) - 1
+            if status != 200 or bool(body.get("success")) != expected:
+                self.fail(team_id, f"{pattern} escape attempt {index + 1} by {friend}: "
+                                   f"status {status}, success {body and body.get('success')}, expected {expected}")
+
+    def check_team(self, team_id: str, model: dict) -> None:
+        team = self.main.teams[team_id]
+        eleven, mike = team['eleven']['items'], team['mike']['items']
+        tuned = "tuned radio" in eleven
+        if (eleven + mike).count("demogorgon tooth") + tuned != 1:
+            self.fail(team_id, f"tooth not conserved: {eleven} / {mike}")
+        if ("radio" in eleven) == tuned:
+            self.fail(team_id, f"radio and tuned radio inconsistent: {eleven}")
+        if team['eleven']['has_frequency'] != ("frequency reading" in eleven):
+            self.fail(team_id, "has_frequency disagrees with items")
+        if team['mike']['has_eggs'] != ("activated gate panel" in mike) or \
+                team['mike']['has_eggs'] == ("broken walkie-talkie" in mike):
+            self.fail(team_id, "has_eggs disagrees with items")
+        if team['escaped'] and not (team['eleven']['has_frequency'] and team['mike']['has_eggs']):
+            self.fail(team_id, "escaped without both friends ready")
+        if not team['escaped']:
+            self.fail(team_id, "game finished without escaping")
+        if len(team['escape'].times) != 2:
+            self.fail(team_id, "escape state grew")
+        hints = team['eleven']['hints_used'] + team['mike']['hints_used']
+        if hints != model['hints']:
+            self.fail(team_id, f"hints_used {hints}, expected {model['hints']}")
+
+    async def play_game(self, number: int) -> None:
+        request = {"team_name": f"sim-{number}"}
+        room = self.rng.choice(ROOMS)
+        if room is not None:
+            request["room"] = room
+        status, body = await self.request("POST", "/create_team", request)
+        if status != 200:
+            self.fail(f"game {number}", f"create_team returned {status}")
+            return
+        team_id = body["team_id"]
+        window = self.main.puzzle.SCENARIOS[self.main.teams[team_id]['scenario']].escape_window
+        model = {'hints': 0}
+
+        while not await self.play_walkthrough(team_id, model):
+            self.tick()
+        await self.escape(team_id, window)
+        if self.rng.random() < 0.05:
+            # Escaping again after the gate closed must not break anything
+            await self.request("POST", f"/{team_id}/escape", {"friend": "Mike"})
+        status, _ = await self.request("GET", f"/{team_id}/key")
+        if status != 200:
+            self.fail(team_id, f"key returned {status}")
+
+        self.check_team(team_id, model)
+        self.games += 1
+        self.escaped += self.main.teams[team_id]['escaped']
+        # Let hint cooldowns and escape windows lapse between games
+        self.clock.advance(31.0)
+
+    def check_global(self) -> None:
+        rooms = self.main.rooms
+        if sum(len(room) for room in rooms.values()) != len(self.main.teams):
+            self.fail("rooms", f"rooms index {sum(map(len, rooms.values()))} teams, state has {len(self.main.teams)}")
+        for room in rooms.values():
+            members = [self.main.teams[team_id] for team_id in room.team_ids]
+            if any(team['room'] != room.name for team in members):
+                self.fail(room.name, "indexes a team from another room")
+            if len(room.names) != len(members):
+                self.fail(room.name, f"name index has {len(room.names)} entries for {len(members)} teams")
+            escaped = sum(1 for team in members if team['escaped'])
+            if room.escaped != escaped or len(room.leaderboard) != escaped:
+                self.fail(room.name, f"escaped counter {room.escaped}, leaderboard {len(room.leaderboard)}, "
+                                     f"state has {escaped}")
+            if room.leaderboard != sorted(room.leaderboard):
+                self.fail(room.name, "leaderboard out of order")
+            for name, funnel in room.funnels.items():
+                in_scenario = sum(1 for team in members if team['scenario'] == name)
+                if sum(funnel.current) != in_scenario:
+                    self.fail(room.name, f"{name} funnel counts {sum(funnel.current)} teams, state has {in_scenario}")
+                # Nothing is deleted here, so every team reached the first stage exactly once
+                if funnel.reached[0] != in_scenario:
+                    self.fail(room.name, f"{name} funnel: {funnel.reached[0]} teams reached the first stage, "
+                                         f"state has {in_scenario}")
+                if any(later > earlier for earlier, later in zip(funnel.reached, funnel.reached[1:])):
+                    self.fail(room.name, f"{name} funnel reached counts grow down the funnel: {funnel.reached}")
+        if len(self.main.escape_timers) > len(self.main.teams):
+            self.fail("escape timers", f"{len(self.main.escape_timers)} timers for {len(self.main.teams)} teams")
+
+
+async def simulate(games: int, seed: int, asgi: bool = False) -> Simulation:
+    import main
+
+    clock = VirtualClock()
+    main.clock = clock
+    sim = Simulation(main, clock, seed, asgi)
+    for number in range(games):
+        await sim.play_game(number)
+    sim.check_global()
+    return sim
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play randomized games in-process on a virtual clock")
+    parser.add_argument("--games", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--asgi", action="store_true",
+                        help="send every request through the ASGI app and its middlewares")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    sim = asyncio.run(simulate(args.games, args.seed, args.asgi))
+    elapsed = time.perf_counter() - start
+
+    print(f"Played {sim.games:,} games ({sim.requests:,} requests) in {elapsed:.2f}s")
+    print(f"   {sim.games / elapsed:,.0f} games/s, {sim.requests / elapsed:,.0f} requests/s, "
+          f"{sim.escaped:,} escaped")
+    if sim.violations:
+        print(f"❌ {len(sim.violations)} invariant violations (first {min(10, len(sim.violations))}):")
+        for violation in sim.violations[:10]:
+            print(f"   {violation}")
+        sys.exit(1)
+    print("✅ All invariants held")
+
+
+if __name__ == "__main__":
+    main()
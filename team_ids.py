@@ -0,0 +1,184 @@
+"""Compact, collision-free team IDs backed by a dense team table.
+
+A team ID is 6 base32 characters encoding the team's dense index through a
+seeded bijection (so IDs are unique by construction and do not look
+sequential) plus 1 check symbol. IDs use Crockford's alphabet, are
+case-insensitive and accept the usual look-alikes (O for 0, I/L for 1).
+The check symbol is Crockford's: the payload value mod 37, written with
+the 32 digits and ``*~$=u`` for 32-36. 37 is prime, so every single-digit
+substitution and every swap of neighbours changes the remainder, and such
+typos are rejected before any lookup happens.
+
+Sharded deployments (see router.py) split the encoded space into SHARDS
+equal spans. A table started with TEAM_ID_SHARD=n only mints IDs inside
+span n, so ``shard_of`` can tell which backend owns a team from the ID
+alone.
+"""
+import os
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, List, Optional
+
+ALPHABET = "0123456789abcdefghjkmnpqrstvwxyz"
+CHECK_ALPHABET = ALPHABET + "*~$=u"
+CHECK_MODULUS = len(CHECK_ALPHABET)
+
+# Crockford digits (and look-alikes) to the digits int(..., 32) understands;
+# anything else becomes "!" so int() rejects it
+_PY_DIGITS = "0123456789abcdefghijklmnopqrstuv"
+_LOOKALIKES = {'o': '0', 'i': '1', 'l': '1'}
+_TO_PY = {}
+for _c in "0123456789abcdefghijklmnopqrstuvwxyz":
+    if _c in ALPHABET:
+        _digit = _PY_DIGITS[ALPHABET.index(_c)]
+    else:
+        _digit = _PY_DIGITS[ALPHABET.index(_LOOKALIKES[_c])] if _c in _LOOKALIKES else "!"
+    _TO_PY[_c] = _TO_PY[_c.upper()] = _digit
+_TRANSLATE = str.maketrans(_TO_PY)
+_CHECK_VALUES = {**{c: ALPHABET.index(c) for c in ALPHABET},
+                 **{c: ALPHABET.index(digit) for c, digit in _LOOKALIKES.items()},
+                 **{c: CHECK_ALPHABET.index(c) for c in CHECK_ALPHABET[len(ALPHABET):]}}
+_CHECK_VALUES.update({c.upper(): value for c, value in _CHECK_VALUES.items()})
+
+PAYLOAD_LENGTH = 6
+ID_LENGTH = PAYLOAD_LENGTH + 1
+BITS = 5 * PAYLOAD_LENGTH
+CAPACITY = 1 << BITS
+MASK = CAPACITY - 1
+
+# Odd multipliers are invertible mod 2**BITS, so the mixing is a bijection
+_MULT_A = 0x2545F491 & MASK | 1
+_MULT_B = 0x1B873593 & MASK | 1
+_INV_A = pow(_MULT_A, -1, CAPACITY)
+_INV_B = pow(_MULT_B, -1, CAPACITY)
+_SHIFT = BITS // 2
+
+SHARD_BITS = 6
+SHARDS = 1 << SHARD_BITS
+SHARD_SPAN = CAPACITY >> SHARD_BITS
+
+
+class TeamIdCodec:
+    """Maps dense indexes to team IDs and back"""
+
+    def __init__(self, seed: int):
+        self.seed = seed & MASK
+
+    def encode(self, index: int) -> str:
+        x = (index + self.seed) & MASK
+        x = (x * _MULT_A) & MASK
+        x ^= x >> _SHIFT
+        x = (x * _MULT_B) & MASK
+        chars = [ALPHABET[(x >> (5 * i)) & 31] for i in range(PAYLOAD_LENGTH - 1, -1, -1)]
+        return "".join(chars) + CHECK_ALPHABET[x % CHECK_MODULUS]
+
+    def decode(self, team_id: str) -> Optional[int]:
+        """Dense index for a team ID, or None if it is malformed or fails the checksum"""
+        if len(team_id) != ID_LENGTH:
+            return None
+        payload = team_id[:PAYLOAD_LENGTH]
+        if not (payload.isascii() and payload.isalnum()):
+            return None
+        try:
+            x = int(payload.translate(_TRANSLATE), 32)
+        except ValueError:
+            return None
+        if x % CHECK_MODULUS != _CHECK_VALUES.get(team_id[PAYLOAD_LENGTH]):
+            return None
+        x = (x * _INV_B) & MASK
+        x ^= x >> _SHIFT
+        x = (x * _INV_A) & MASK
+        return (x - self.seed) & MASK
+
+
+_UNSEEDED = TeamIdCodec(0)
+
+
+def shard_of(team_id: str) -> Optional[int]:
+    """Shard whose span an ID was minted in, or None if the ID is malformed"""
+    value = _UNSEEDED.decode(team_id)
+    return None if value is None else value // SHARD_SPAN
+
+
+class TeamTable(MutableMapping):
+    """Dict-like store of teams keyed by team ID and held in a dense list
+
+    ``allocate()`` hands out the next unused ID. An ID spelled the way it
+    was handed out is found with one dict lookup; any other spelling (other
+    case, look-alikes) is decoded to its list index, which also rejects
+    typos without touching the table. Iteration follows creation order,
+    like a dict.
+    """
+
+    def __init__(self, seed: Optional[int] = None, shard: Optional[int] = None):
+        if seed is None:
+            seed = int(os.environ.get("TEAM_ID_SEED") or int.from_bytes(os.urandom(4), "big"))
+        if shard is None and os.environ.get("TEAM_ID_SHARD"):
+            shard = int(os.environ["TEAM_ID_SHARD"])
+        self.shard = shard
+        self.capacity = CAPACITY
+        if shard is not None:
+            if not 0 <= shard < SHARDS:
+                raise ValueError(f"Team ID shard must be between 0 and {SHARDS - 1}")
+            # Start at a random point in the first half of the span; the
+            # second half keeps the last IDs from spilling into the next shard
+            self.capacity = SHARD_SPAN // 2
+            seed = shard * SHARD_SPAN + seed % self.capacity
+        self.codec = TeamIdCodec(seed)
+        self._slots: List[Any] = []
+        self._ids: List[Optional[str]] = []
+        # Canonical ID to the same values as _slots, for every team present
+        self._by_id: Dict[str, Any] = {}
+
+    def allocate(self) -> str:
+        """Reserve a new, never used team ID"""
+        if len(self._slots) >= self.capacity:
+            raise RuntimeError("Team ID space exhausted")
+        team_id = self.codec.encode(len(self._slots))
+        self._slots.append(None)
+        self._ids.append(None)
+        return team_id
+
+    def index(self, team_id: str) -> Optional[int]:
+        """Dense index of an existing team, or None"""
+        index = self.codec.decode(team_id)
+        if index is None or index >= len(self._slots) or self._ids[index] is None:
+            return None
+        return index
+
+    def __getitem__(self, team_id: str) -> Any:
+        try:
+            return self._by_id[team_id]
+        except KeyError:
+            pass
+        index = self.index(team_id)
+        if index is None:
+            raise KeyError(team_id)
+        return self._slots[index]
+
+    def __contains__(self, team_id: object) -> bool:
+        return team_id in self._by_id or (isinstance(team_id, str) and self.index(team_id) is not None)
+
+    def __setitem__(self, team_id: str, value: Any) -> None:
+        index = self.codec.decode(team_id)
+        if index is None or index >= len(self._slots):
+            raise KeyError(f"Team ID {team_id!r} was not allocated by this table")
+        if self._ids[index] is None:
+            self._ids[index] = self.codec.encode(index)
+        self._by_id[self._ids[index]] = value
+        self._slots[index] = value
+
+    def __delitem__(self, team_id: str) -> None:
+        index = self.index(team_id)
+        if index is None:
+            raise KeyError(team_id)
+        self._slots[index] = None
+        del self._by_id[self._ids[index]]
+        self._ids[index] = None
+
+    def __iter__(self) -> Iterator[str]:
+        for team_id in self._ids:
+            if team_id is not None:
+                yield team_id
+
+    def __len__(self) -> int:
+        return len(self._by_id)
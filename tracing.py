@@ -0,0 +1,298 @@
+"""Sampled per-request tracing with a slow-request log.
+
+``TracingMiddleware`` times every HTTP request through consecutive phases:
+
+- ``routing``: admission queueing, the other middlewares, path matching
+  and reading the body
+- ``validation``: path, query and body parameters checked against their
+  pydantic models (``SendItem``, ``UseItem``, ...)
+- ``handler``: the route function (or the fast path handler, which
+  leaves no separate validation or serialization)
+- ``serialization``: encoding the return value and rendering the response
+- ``response``: sending it, and whatever the middlewares do afterwards
+
+Only routes built as ``TracedRoute`` mark the three phases inside FastAPI;
+set it as the router's ``route_class`` before adding routes to opt in.
+Other routes count everything up to the response as ``routing``. Code can
+add finer spans of its own with ``span(name)``; they nest inside the phase
+they run in.
+
+Recording costs a few clock reads, so every request is recorded and the
+decision to keep it is made at the end. A request is kept if it was
+sampled (``sample_rate``) or took at least ``slow_threshold``; slow ones
+are also logged. Kept traces go to a bounded ring, newest last, and
+``chrome_trace`` turns them into Chrome trace event JSON, which
+chrome://tracing and ui.perfetto.dev open directly.
+"""
+import asyncio
+import contextvars
+import functools
+import itertools
+import json
+import os
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Optional
+
+from fastapi import Depends
+from fastapi.routing import APIRoute
+
+DEFAULT_SAMPLE_RATE = 0.01
+DEFAULT_SLOW_MS = 500
+DEFAULT_RING_SIZE = 1000
+
+# Set on the scope by the outermost TracingMiddleware so inner copies skip the request
+SCOPE_MARKER = "tracing.traced"
+
+_current: contextvars.ContextVar = contextvars.ContextVar("trace", default=None)
+# Wall-clock time is worked out from perf_counter when a trace is read, not per request
+_WALL_OFFSET = time.time() - time.perf_counter()
+
+
+class Trace:
+    """Phases and spans of one request; times are perf_counter seconds"""
+    __slots__ = ("id", "method", "path", "route", "status", "start", "end",
+                 "phase", "phase_start", "spans", "depth", "kept_because")
+
+    def __init__(self, trace_id: int, method: str, path: str):
+        self.id = trace_id
+        self.method = method
+        self.path = path
+        self.route: Optional[str] = None
+        self.status: Optional[int] = None
+        self.start = self.phase_start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.phase = "routing"
+        # (name, start, end, depth): phases at depth 0, span() inside them deeper
+        self.spans: List[tuple] = []
+        self.depth = 0
+        self.kept_because: Optional[str] = None
+
+    def enter(self, phase: str) -> None:
+        """End the current phase and start the next"""
+        now = time.perf_counter()
+        self.spans.append((self.phase, self.phase_start, now, 0))
+        self.phase = phase
+        self.phase_start = now
+
+    def finish(self) -> float:
+        self.end = time.perf_counter()
+        self.spans.append((self.phase, self.phase_start, self.end, 0))
+        return self.end - self.start
+
+    @property
+    def at(self) -> float:
+        return _WALL_OFFSET + self.start
+
+    def phases(self) -> Dict[str, float]:
+        """Milliseconds per phase (a phase entered twice counts twice)"""
+        totals: Dict[str, float] = {}
+        for name, start, end, depth in self.spans:
+            if depth == 0:
+                totals[name] = totals.get(name, 0.0) + (end - start) * 1000
+        return {name: round(ms, 3) for name, ms in totals.items()}
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "at": self.at,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "total_ms": round((self.end - self.start) * 1000, 3),
+            "kept_because": self.kept_because,
+            "phases": self.phases(),
+            "spans": [{"name": name, "depth": depth,
+                       "offset_ms": round((start - self.start) * 1000, 3),
+                       "ms": round((end - start) * 1000, 3)}
+                      for name, start, end, depth in sorted(self.spans, key=lambda s: (s[1], s[3]))],
+        }
+
+
+def current() -> Optional[Trace]:
+    """The trace of the request being served, if any"""
+    return _current.get()
+
+
+@contextmanager
+def span(name: str):
+    """Time a block as a span of the current request's trace; free outside one"""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    trace.depth += 1
+    depth = trace.depth
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.spans.append((name, start, time.perf_counter(), depth))
+        trace.depth -= 1
+
+
+class Tracer:
+    """Decides which finished traces to keep and holds the last `capacity` of them"""
+
+    def __init__(self, sample_rate: float = DEFAULT_SAMPLE_RATE, slow_threshold: float = DEFAULT_SLOW_MS / 1000,
+                 capacity: int = DEFAULT_RING_SIZE):
+        self.sample_rate = sample_rate
+        # 0 keeps no request for being slow
+        self.slow_threshold = slow_threshold
+        self.ring: Deque[Trace] = deque(maxlen=capacity)
+        self.ids = itertools.count(1)
+        self.recorded = 0
+        self.sampled = 0
+        self.slow = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 or self.slow_threshold > 0
+
+    def begin(self, method: str, path: str) -> Trace:
+        return Trace(next(self.ids), method, path)
+
+    def end(self, trace: Trace) -> None:
+        seconds = trace.finish()
+        self.recorded += 1
+        if 0 < self.slow_threshold <= seconds:
+            self.slow += 1
+            trace.kept_because = "slow"
+            phases = ", ".join(f"{name} {ms:.1f}" for name, ms in trace.phases().items())
+            print(f"Slow request {seconds * 1000:.0f} ms: {trace.method} {trace.path} -> {trace.status} "
+                  f"({phases}) trace {trace.id}")
+        elif self.sample_rate > 0 and random.random() < self.sample_rate:
+            self.sampled += 1
+            trace.kept_because = "sampled"
+        else:
+            return
+        self.ring.append(trace)
+
+    def find(self, trace_id: int) -> Optional[Trace]:
+        return next((trace for trace in self.ring if trace.id == trace_id), None)
+
+    def search(self, route: Optional[str] = None, slow: Optional[bool] = None, min_ms: float = 0,
+               limit: int = 50) -> List[Trace]:
+        """Kept traces matching the filters, newest first"""
+        found = []
+        for trace in reversed(self.ring):
+            if route is not None and route not in (trace.route, trace.path):
+                continue
+            if slow is not None and (trace.kept_because == "slow") != slow:
+                continue
+            if (trace.end - trace.start) * 1000 < min_ms:
+                continue
+            found.append(trace)
+            if len(found) >= limit:
+                break
+        return found
+
+    def stats(self) -> dict:
+        return {
+            "sample_rate": self.sample_rate,
+            "slow_threshold_ms": round(self.slow_threshold * 1000, 1),
+            "capacity": self.ring.maxlen,
+            "kept": len(self.ring),
+            "recorded_total": self.recorded,
+            "kept_sampled": self.sampled,
+            "kept_slow": self.slow,
+        }
+
+
+def chrome_trace(traces: List[Trace]) -> dict:
+    """Chrome trace event JSON: one row per request, its phases and spans nested under it"""
+    pid = os.getpid()
+    events = []
+    for trace in traces:
+        # Trace events want wall-clock microseconds
+        base = trace.at * 1_000_000
+        label = f"{trace.method} {trace.route or trace.path}"
+        events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": trace.id,
+                       "args": {"name": f"#{trace.id} {label}"}})
+        events.append({"name": label, "cat": "request", "ph": "X", "pid": pid, "tid": trace.id, "ts": base,
+                       "dur": (trace.end - trace.start) * 1_000_000,
+                       "args": {"path": trace.path, "status": trace.status, "kept_because": trace.kept_because}})
+        for name, start, end, depth in trace.spans:
+            events.append({"name": name, "cat": "phase" if depth == 0 else "span", "ph": "X", "pid": pid,
+                           "tid": trace.id, "ts": base + (start - trace.start) * 1_000_000,
+                           "dur": (end - start) * 1_000_000})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def write_chrome_trace(path: str, traces: List[Trace]) -> int:
+    """Write traces to a file as Chrome trace event JSON; returns the number of events"""
+    document = chrome_trace(traces)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f, separators=(",", ":"))
+    return len(document["traceEvents"])
+
+
+async def _validation_started() -> None:
+    trace = _current.get()
+    if trace is not None:
+        trace.enter("validation")
+
+
+def _handler_phases(endpoint):
+    """Wrap an async endpoint: its call is the handler phase, what follows is serialization"""
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        trace = _current.get()
+        if trace is not None:
+            trace.enter("handler")
+        result = await endpoint(*args, **kwargs)
+        if trace is not None:
+            trace.enter("serialization")
+        return result
+    return wrapper
+
+
+class TracedRoute(APIRoute):
+    """APIRoute marking the validation, handler and serialization phases of its requests
+
+    A first dependency starts validation, since FastAPI solves dependencies
+    once the body is read and before the parameters. Sync endpoints are left
+    unwrapped, so their time stays in validation.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        kwargs["dependencies"] = [Depends(_validation_started), *(kwargs.get("dependencies") or [])]
+        super().__init__(path, endpoint, **kwargs)
+        # The request handler built above holds this dependant and looks its call up per request
+        if asyncio.iscoroutinefunction(self.dependant.call):
+            self.dependant.call = _handler_phases(self.dependant.call)
+
+
+class TracingMiddleware:
+    """ASGI middleware recording a Trace for every HTTP request"""
+
+    def __init__(self, app, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get(SCOPE_MARKER):
+            await self.app(scope, receive, send)
+            return
+        scope[SCOPE_MARKER] = True
+        trace = self.tracer.begin(scope["method"], scope["path"])
+        token = _current.set(trace)
+
+        async def traced_send(message):
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+                trace.enter("response")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, traced_send)
+        finally:
+            _current.reset(token)
+            # Set by FastAPI's router when a route matched
+            route = scope.get("route")
+            if route is not None:
+                trace.route = route.path
+            self.tracer.end(trace)